@@ -0,0 +1,58 @@
+# backend/alembic/env.py
+"""
+Окружение Alembic.
+
+При старте приложения миграции запускаются из app/db_migrations.py с уже
+открытым соединением (config.attributes["connection"]); при ручном запуске
+`alembic ...` соединение создается по DATABASE_URL.
+"""
+import os
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+from app.models import Base
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("connection") is None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def _configure(**kwargs) -> None:
+    context.configure(
+        target_metadata=target_metadata,
+        compare_type=True,
+        # SQLite не умеет ALTER для большинства операций - там автогенерация пишет batch-операции
+        render_as_batch=kwargs.pop("dialect_name", "") == "sqlite",
+        **kwargs,
+    )
+
+
+def run_migrations_offline() -> None:
+    url = os.getenv("DATABASE_URL")
+    _configure(url=url, literal_binds=True, dialect_opts={"paramstyle": "named"}, dialect_name=url.split(":", 1)[0])
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _configure(connection=connection, dialect_name=connection.dialect.name)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+    engine = create_engine(os.environ["DATABASE_URL"], poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        _configure(connection=connection, dialect_name=connection.dialect.name)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,173 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-17 01:16:06.782486
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('app_settings',
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('value', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('app_settings', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_app_settings_key'), ['key'], unique=False)
+
+    op.create_table('cafes',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('cover_image', sa.String(), nullable=True),
+    sa.Column('kitchen_categories', sa.String(), nullable=True),
+    sa.Column('rating', sa.String(), nullable=True),
+    sa.Column('cooking_time', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('opening_hours', sa.String(), nullable=True),
+    sa.Column('min_order_amount', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('cafes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_cafes_id'), ['id'], unique=False)
+
+    op.create_table('categories',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('icon', sa.String(), nullable=True),
+    sa.Column('background_color', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_categories_id'), ['id'], unique=False)
+
+    op.create_table('global_addon_groups',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('global_addon_groups', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_global_addon_groups_id'), ['id'], unique=False)
+
+    op.create_table('global_addon_items',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('group_id', sa.String(), nullable=True),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['group_id'], ['global_addon_groups.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('global_addon_items', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_global_addon_items_id'), ['id'], unique=False)
+
+    op.create_table('global_products',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('image', sa.String(), nullable=True),
+    sa.Column('category_id', sa.String(), nullable=True),
+    sa.Column('sub_category', sa.String(), nullable=True),
+    sa.Column('is_popular', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('global_products', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_global_products_id'), ['id'], unique=False)
+
+    op.create_table('orders',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('cafe_id', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.Column('user_info', sa.JSON(), nullable=True),
+    sa.Column('cart_items', sa.JSON(), nullable=True),
+    sa.Column('total_amount', sa.Integer(), nullable=True),
+    sa.Column('currency', sa.String(length=3), nullable=True),
+    sa.Column('telegram_payment_charge_id', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('order_type', sa.String(), nullable=True),
+    sa.Column('payment_method', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['cafe_id'], ['cafes.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('telegram_payment_charge_id')
+    )
+    op.create_table('global_product_variants',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('global_product_id', sa.String(), nullable=True),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('weight', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['global_product_id'], ['global_products.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('global_product_variants', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_global_product_variants_id'), ['id'], unique=False)
+
+    op.create_table('product_addon_groups',
+    sa.Column('product_id', sa.String(), nullable=False),
+    sa.Column('addon_group_id', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['addon_group_id'], ['global_addon_groups.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['global_products.id'], ),
+    sa.PrimaryKeyConstraint('product_id', 'addon_group_id')
+    )
+    op.create_table('venue_addon_items',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.String(), nullable=True),
+    sa.Column('addon_id', sa.String(), nullable=True),
+    sa.Column('price', sa.Integer(), nullable=False),
+    sa.Column('is_available', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['addon_id'], ['global_addon_items.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['cafes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('venue_menu_items',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.String(), nullable=True),
+    sa.Column('variant_id', sa.String(), nullable=True),
+    sa.Column('price', sa.Integer(), nullable=False),
+    sa.Column('is_available', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['variant_id'], ['global_product_variants.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['cafes.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('venue_menu_items')
+    op.drop_table('venue_addon_items')
+    op.drop_table('product_addon_groups')
+    with op.batch_alter_table('global_product_variants', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_global_product_variants_id'))
+
+    op.drop_table('global_product_variants')
+    op.drop_table('orders')
+    with op.batch_alter_table('global_products', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_global_products_id'))
+
+    op.drop_table('global_products')
+    with op.batch_alter_table('global_addon_items', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_global_addon_items_id'))
+
+    op.drop_table('global_addon_items')
+    with op.batch_alter_table('global_addon_groups', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_global_addon_groups_id'))
+
+    op.drop_table('global_addon_groups')
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_categories_id'))
+
+    op.drop_table('categories')
+    with op.batch_alter_table('cafes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_cafes_id'))
+
+    op.drop_table('cafes')
+    with op.batch_alter_table('app_settings', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_app_settings_key'))
+
+    op.drop_table('app_settings')
@@ -0,0 +1,50 @@
+"""catalog and order indexes
+
+Revision ID: 0002
+Revises: 0001a
+Create Date: 2026-10-17 01:17:13.410573
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0002'
+down_revision: Union[str, None] = '0001a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Повторный импорт каталога без уникальности мог наплодить дубли цен -
+    # оставляем последнюю запись пары, иначе уникальный индекс не создастся
+    op.execute(
+        "DELETE FROM venue_menu_items WHERE id NOT IN "
+        "(SELECT MAX(id) FROM venue_menu_items GROUP BY venue_id, variant_id)"
+    )
+    op.execute(
+        "DELETE FROM venue_addon_items WHERE id NOT IN "
+        "(SELECT MAX(id) FROM venue_addon_items GROUP BY venue_id, addon_id)"
+    )
+
+    op.create_index('uq_venue_menu_items_venue_variant', 'venue_menu_items', ['venue_id', 'variant_id'], unique=True)
+    op.create_index('ix_venue_menu_items_venue_available', 'venue_menu_items', ['venue_id', 'is_available', 'variant_id'])
+    op.create_index('uq_venue_addon_items_venue_addon', 'venue_addon_items', ['venue_id', 'addon_id'], unique=True)
+    op.create_index('ix_global_products_category_popular', 'global_products', ['category_id', 'is_popular'])
+    op.create_index('ix_orders_cafe_created', 'orders', ['cafe_id', 'created_at'])
+    op.create_index('ix_orders_status', 'orders', ['status'])
+    op.create_index(
+        'ix_notification_outbox_pending', 'notification_outbox', ['next_attempt_at'],
+        postgresql_where=sa.text("status = 'pending'"), sqlite_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notification_outbox_pending', table_name='notification_outbox')
+    op.drop_index('ix_orders_status', table_name='orders')
+    op.drop_index('ix_orders_cafe_created', table_name='orders')
+    op.drop_index('ix_global_products_category_popular', table_name='global_products')
+    op.drop_index('uq_venue_addon_items_venue_addon', table_name='venue_addon_items')
+    op.drop_index('ix_venue_menu_items_venue_available', table_name='venue_menu_items')
+    op.drop_index('uq_venue_menu_items_venue_variant', table_name='venue_menu_items')
@@ -0,0 +1,31 @@
+"""orders keyset index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 01:31:02.118406
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Заказ с NULL created_at не попал бы ни на одну страницу: (created_at, id) < курсор для него не истина.
+    # Время таких заказов неизвестно - ставим начало эпохи, они уходят в конец списка и не попадают в фильтры по датам
+    op.execute("UPDATE orders SET created_at = '1970-01-01 00:00:00' WHERE created_at IS NULL")
+    with op.batch_alter_table('orders') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), existing_server_default=sa.func.now(), nullable=False)
+    op.create_index('ix_orders_created_id', 'orders', ['created_at', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_orders_created_id', table_name='orders')
+    with op.batch_alter_table('orders') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), existing_server_default=sa.func.now(), nullable=True)
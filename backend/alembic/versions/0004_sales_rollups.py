@@ -0,0 +1,55 @@
+"""sales rollups
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 02:05:41.552310
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Таблицы заполняются из существующих заказов командой python -m app.sales_rollup --backfill (entrypoint.sh)
+    op.create_table('sales_venue_daily',
+    sa.Column('venue_id', sa.String(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('orders_count', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.BigInteger(), nullable=False),
+    sa.Column('items_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('venue_id', 'day')
+    )
+    op.create_index('ix_sales_venue_daily_day', 'sales_venue_daily', ['day'])
+    op.create_table('sales_variant_daily',
+    sa.Column('venue_id', sa.String(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('variant_id', sa.String(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('orders_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('venue_id', 'day', 'variant_id')
+    )
+    op.create_index('ix_sales_variant_daily_day', 'sales_variant_daily', ['day'])
+    op.create_table('sales_addon_daily',
+    sa.Column('venue_id', sa.String(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('addon_id', sa.String(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('venue_id', 'day', 'addon_id')
+    )
+    op.create_index('ix_sales_addon_daily_day', 'sales_addon_daily', ['day'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sales_addon_daily_day', table_name='sales_addon_daily')
+    op.drop_table('sales_addon_daily')
+    op.drop_index('ix_sales_variant_daily_day', table_name='sales_variant_daily')
+    op.drop_table('sales_variant_daily')
+    op.drop_index('ix_sales_venue_daily_day', table_name='sales_venue_daily')
+    op.drop_table('sales_venue_daily')
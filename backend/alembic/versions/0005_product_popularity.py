@@ -0,0 +1,37 @@
+"""product popularity
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 03:12:08.904127
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Заполняется фоновой задачей app/popularity.py: первый проход берет заказы за POPULARITY_BACKFILL_DAYS
+    op.create_table('product_popularity',
+    sa.Column('venue_id', sa.String(), nullable=False),
+    sa.Column('product_id', sa.String(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('scored_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('venue_id', 'product_id')
+    )
+    op.create_table('job_watermarks',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('processed_until', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('job_watermarks')
+    op.drop_table('product_popularity')
@@ -1,14 +1,17 @@
 # backend/app/admin.py
+import asyncio
 import os
 import json
+from datetime import date, timedelta
 from passlib.context import CryptContext
 from babel.numbers import format_currency
 from markupsafe import Markup
 from typing import Dict, List, Any
 
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload, joinedload
-from sqladmin import Admin, ModelView
+from sqlalchemy.orm import selectinload, joinedload, defer
+from sqladmin import Admin, BaseView, ModelView, expose
+from sqladmin.filters import BooleanFilter, ForeignKeyFilter, StaticValuesFilter
 from sqladmin.authentication import AuthenticationBackend
 from starlette.datastructures import UploadFile
 from starlette.requests import Request
@@ -17,17 +20,43 @@ from wtforms import FileField
 
 from .models import (
     Cafe, Category, GlobalProduct, GlobalProductVariant, VenueMenuItem, Order,
-    GlobalAddonGroup, GlobalAddonItem, VenueAddonItem, AppSetting
+    GlobalAddonGroup, GlobalAddonItem, VenueAddonItem, AppSetting, NotificationOutbox, SERVICE_SETTING_KEYS
 )
+from .admin_lists import KeysetListMixin, DateRangeFilter
+from .images import image_variant, store_image
+from .database import AsyncSessionLocal
+from .menu_cache import venue_directory
+from . import sales_rollup
 from fastapi_storages import FileSystemStorage
 
 API_URL = os.getenv("API_URL", "") # https://api.ezhcoffee.ru
 
-UPLOAD_DIR = "/app/uploads"
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads")
+# Свои шаблоны админки (дашборд продаж); стандартные sqladmin находит сам
+ADMIN_TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 storage = FileSystemStorage(path=UPLOAD_DIR)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+async def save_image_upload(data: Dict, field: str, request: Request) -> None:
+    """Загруженный файл -> копии разных размеров под хэшем (см. images.py); путь пишется в data[field]."""
+    file = data.get(field)
+    # Галочка "Clear" у поля в форме sqladmin: картинку убираем. Файлы на диске остаются -
+    # по хэшу их может использовать другая запись
+    if (await request.form()).get(f"{field}_checkbox"):
+        data[field] = None
+    elif isinstance(file, UploadFile) and file.filename:
+        # Декодирование и сжатие - работа CPU на секунды, не держим event loop
+        data[field] = await asyncio.to_thread(store_image, await file.read(), file.filename, UPLOAD_DIR)
+    # Файл в форме не выбирали - пустой UploadFile или "" (так Starlette разбирает пустой input type=file): путь в БД не трогаем
+    elif not file or isinstance(file, UploadFile):
+        data.pop(field, None)
+
+def image_tag(path: str, width: int) -> Markup:
+    # Превью в админке - из уменьшенной копии, а не из оригинала на несколько мегабайт
+    src = image_variant(path, width * 2)
+    return Markup(f'<img src="{API_URL if not src.startswith("http") else ""}{src}" width="{width}" style="border-radius: 4px;">')
+
 def bool_icon(value: bool) -> Markup:
     icon_class = "fa-solid fa-check-circle text-success" if value else "fa-solid fa-times-circle text-danger"
     return Markup(f'<i class="{icon_class}"></i>')
@@ -48,6 +77,14 @@ class AdminAuth(AuthenticationBackend):
     async def authenticate(self, request: Request) -> bool:
         return "token" in request.session
 
+class AdminPanel(Admin):
+    @staticmethod
+    async def _handle_form_data(request: Request, obj: Any = None):
+        # Для пустой загрузки sqladmin подставляет текущий файл колонки FileType (obj.<поле>.name),
+        # а у нас в колонке путь строкой. Без obj пустая загрузка остается пустой, и save_image_upload сохраняет прежний путь;
+        # галочку очистки save_image_upload проверяет по форме сам
+        return await Admin._handle_form_data(request)
+
 authentication_backend = AdminAuth(secret_key=os.getenv("SECRET_KEY", "your-super-secret-key-for-sessions"))
 
 class CafeAdmin(ModelView, model=Cafe):
@@ -60,7 +97,7 @@ class CafeAdmin(ModelView, model=Cafe):
     column_formatters = {
         "min_order_amount": lambda m, a: format_currency(m.min_order_amount / 100, 'RUB', locale='ru_RU'),
         # "logo_image": lambda m, a: Markup(f'<img src="{API_URL}{m.logo_image}" width="40" style="border-radius: 4px;">') if m.logo_image else "", # <-- УДАЛИТЕ ЭТУ СТРОКУ
-        "cover_image": lambda m, a: Markup(f'<img src="{API_URL}{m.cover_image}" width="100" style="border-radius: 4px;">') if m.cover_image else ""
+        "cover_image": lambda m, a: image_tag(m.cover_image, 100) if m.cover_image else ""
     }
     column_formatters_detail = {
         'min_order_amount': lambda m, a: format_currency(m.min_order_amount / 100, 'RUB', locale='ru_RU'),
@@ -82,20 +119,7 @@ class CafeAdmin(ModelView, model=Cafe):
         Обрабатывает загрузку файлов перед сохранением модели.
         """
         for field in ["cover_image"]:
-            file = data.get(field)
-
-            # Случай 1: Загружен новый файл.
-            if isinstance(file, UploadFile) and file.filename:
-                # Сохраняем файл и обновляем путь в данных для сохранения.
-                full_path = storage.write(name=file.filename, file=file.file)
-                data[field] = os.path.basename(full_path)
-            
-            # Случай 2: Файл не менялся (пришло строковое значение старого пути) или поле пустое.
-            # В этой ситуации мы ничего не делаем, чтобы не затереть существующий путь
-            # или не вызвать ошибку. SQLAlchemy сам разберется со строкой.
-            # Если же пришел пустой UploadFile (файл удалили через форму), его нужно убрать.
-            elif isinstance(file, UploadFile) and not file.filename:
-                data.pop(field, None)
+            await save_image_upload(data, field, request)
 
     def details_query(self, request: Request):
         pk = request.path_params["pk"]
@@ -130,6 +154,13 @@ class AppSettingAdmin(ModelView, model=AppSetting):
         "value": lambda m, a: Markup(f'<img src="{m.value}" width="40" style="border-radius: 4px;">') if m.key == 'logo_path' and m.value and m.value.startswith(('http', '/')) else m.value
     }
     
+    # Служебные ключи (хэш синхронизации каталога) пишут скрипты - в списке их нет, редактировать нельзя
+    def list_query(self, request: Request):
+        return super().list_query(request).where(AppSetting.key.notin_(SERVICE_SETTING_KEYS))
+
+    def form_edit_query(self, request: Request):
+        return super().form_edit_query(request).where(AppSetting.key.notin_(SERVICE_SETTING_KEYS))
+
     # Логика загрузки файла
     async def on_model_change(self, data: Dict, model: Any, is_created: bool, request: Request) -> None:
         file = data.get("value")
@@ -154,13 +185,15 @@ class GlobalProductAdmin(ModelView, model=GlobalProduct):
     form_ajax_refs = {"category": {"fields": ("name",), "order_by": "id"}, "addon_groups": {"fields": ("name",), "order_by": "id"}}
     form_overrides = {'image': FileField}
     form_columns = ["id", "name", "description", "image", "category", "sub_category", "is_popular", "addon_groups"]
+    # Популярное заведения считается по заказам (app/popularity.py); флаг закрепляет продукт в начале списка
+    column_labels = {"is_popular": "Закреплен в популярном"}
     
     column_formatters = {
         "is_popular": lambda m, a: bool_icon(m.is_popular),
-        "image": lambda m, a: Markup(f'<img src="{API_URL}{m.image}" width="100" style="border-radius: 4px;">') if m.image and not m.image.startswith('http') else (Markup(f'<img src="{m.image}" width="100" style="border-radius: 4px;">') if m.image else "")
+        "image": lambda m, a: image_tag(m.image, 100) if m.image else ""
     }
     column_formatters_detail = {
-        'image': lambda m, a: Markup(f'<img src="{API_URL}{m.image}" width="200" style="border-radius: 4px;">') if m.image and not m.image.startswith('http') else (Markup(f'<img src="{m.image}" width="200" style="border-radius: 4px;">') if m.image else "")
+        'image': lambda m, a: image_tag(m.image, 200) if m.image else ""
     }
 
     form_columns = [
@@ -168,6 +201,9 @@ class GlobalProductAdmin(ModelView, model=GlobalProduct):
         GlobalProduct.category, GlobalProduct.sub_category, GlobalProduct.is_popular,
         GlobalProduct.addon_groups
     ]
+
+    async def on_model_change(self, data: Dict, model: Any, is_created: bool, request: Request) -> None:
+        await save_image_upload(data, "image", request)
     
     # --- ИЗМЕНЕННЫЙ МЕТОД ---
     def details_query(self, request: Request):
@@ -180,17 +216,25 @@ class GlobalProductAdmin(ModelView, model=GlobalProduct):
         )
 
 
-class VenueMenuItemAdmin(ModelView, model=VenueMenuItem):
+class VenueMenuItemAdmin(KeysetListMixin, ModelView, model=VenueMenuItem):
     name = "Позиция Меню"; name_plural = "Цены и Наличие"; icon = "fa-solid fa-dollar-sign"; category = "Управление"
+    keyset_columns = (VenueMenuItem.id,)
+    column_filters = [ForeignKeyFilter(VenueMenuItem.venue_id, Cafe.name, title="Заведение"), BooleanFilter(VenueMenuItem.is_available, title="В наличии")]
     column_formatters = {"price": lambda m, a: format_currency(m.price / 100, 'RUB', locale='ru_RU'), "variant": lambda m, a: str(m.variant.product) + " - " + str(m.variant) if m.variant and m.variant.product else "", "is_available": lambda m, a: bool_icon(m.is_available)}
     column_list = [VenueMenuItem.venue, "variant", "price", "is_available"]
     form_ajax_refs = {"venue": {"fields": ("name",), "order_by": "id"}, "variant": {"fields": ("name", "id"), "order_by": "id"}}
     def list_query(self, request: Request):
         return select(self.model).options(selectinload(self.model.variant).selectinload(GlobalProductVariant.product), selectinload(self.model.venue))
 
-class OrderAdmin(ModelView, model=Order):
+class OrderAdmin(KeysetListMixin, ModelView, model=Order):
     name = "Заказ"; name_plural = "Заказы"; icon = "fa-solid fa-receipt"; category = "Управление"
     can_create = False; can_delete = True
+    keyset_columns = (Order.created_at, Order.id)
+    column_filters = [
+        ForeignKeyFilter(Order.cafe_id, Cafe.name, title="Заведение"),
+        StaticValuesFilter(Order.status, [('pending', 'Ожидает'), ('awaiting_payment', 'Ждет оплаты'), ('paid', 'Оплачен'), ('completed', 'Выполнен'), ('cancelled', 'Отменен')], title="Статус"),
+        DateRangeFilter(Order.created_at, title="Дата"),
+    ]
     _status_map = {'pending': Markup('<span class="badge bg-yellow-lt">🟡 Ожидает</span>'), 'paid': Markup('<span class="badge bg-green-lt">🟢 Оплачен</span>'), 'awaiting_payment': Markup('<span class="badge bg-blue-lt">🔵 Ждет оплаты</span>'), 'completed': Markup('<span class="badge bg-muted-lt">⚪️ Выполнен</span>'), 'cancelled': Markup('<span class="badge bg-red-lt">🔴 Отменен</span>')}
     column_labels = {"id": "ID", "cafe": "Заведение", "created_at": "Дата", "total_amount": "Сумма", "status": "Статус", "order_type": "Тип", "payment_method": "Оплата", "cart_items": "Состав Заказа", "user_info": "Клиент"}
     column_list = [Order.id, Order.cafe, "created_at", "total_amount", Order.status]
@@ -214,6 +258,8 @@ class OrderAdmin(ModelView, model=Order):
         return Markup("<br>".join(info))
     column_formatters_detail = {"status": lambda m, a: OrderAdmin._status_map.get(m.status, m.status.capitalize()), "cart_items": _format_cart_items, "user_info": _format_user_info}
     column_default_sort = ("created_at", True); form_columns = [Order.status]
+    # Состав заказа и данные клиента нужны только на странице заказа
+    def list_query(self, request: Request): return select(self.model).options(defer(self.model.cart_items), defer(self.model.user_info))
 
 class GlobalProductVariantAdmin(ModelView, model=GlobalProductVariant):
     name = "Вариант Продукта"; name_plural = "Варианты Продуктов"; icon = "fa-solid fa-tags"; category = "Каталог"
@@ -246,16 +292,58 @@ class GlobalAddonItemAdmin(ModelView, model=GlobalAddonItem):
     form_ajax_refs = {"group": {"fields": ("name",), "order_by": "id"}}
     def list_query(self, request: Request): return select(self.model).options(selectinload(self.model.group))
 
-class VenueAddonItemAdmin(ModelView, model=VenueAddonItem):
+class VenueAddonItemAdmin(KeysetListMixin, ModelView, model=VenueAddonItem):
     name = "Цена Добавки"; name_plural = "Цены на Добавки"; icon = "fa-solid fa-money-bill-wave"; category = "Управление"
+    keyset_columns = (VenueAddonItem.id,)
+    column_filters = [ForeignKeyFilter(VenueAddonItem.venue_id, Cafe.name, title="Заведение"), BooleanFilter(VenueAddonItem.is_available, title="В наличии")]
     column_formatters = {"price": lambda m, a: format_currency(m.price / 100, 'RUB', locale='ru_RU'), "addon": lambda m, a: str(m.addon) if m.addon else "", "is_available": lambda m, a: bool_icon(m.is_available)}
     column_list = [VenueAddonItem.venue, "addon", "price", "is_available"]
     form_ajax_refs = {"venue": {"fields": ("name",), "order_by": "id"},"addon": {"fields": ("name", "id"), "order_by": "id"}}
     def list_query(self, request: Request):
         return select(self.model).options(selectinload(self.model.addon), selectinload(self.model.venue))
 
+class NotificationOutboxAdmin(KeysetListMixin, ModelView, model=NotificationOutbox):
+    name = "Уведомление"; name_plural = "Очередь уведомлений"; icon = "fa-solid fa-paper-plane"; category = "Управление"
+    keyset_columns = (NotificationOutbox.id,)
+    column_filters = [StaticValuesFilter(NotificationOutbox.status, [('pending', 'В очереди'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], title="Статус")]
+    can_create = False; can_edit = False; can_delete = True
+    _status_map = {'pending': Markup('<span class="badge bg-yellow-lt">🟡 В очереди</span>'), 'sent': Markup('<span class="badge bg-green-lt">🟢 Отправлено</span>'), 'failed': Markup('<span class="badge bg-red-lt">🔴 Ошибка</span>')}
+    column_labels = {"id": "ID", "order_id": "Заказ", "chat_id": "Чат", "status": "Статус", "attempts": "Попытки", "next_attempt_at": "След. попытка", "last_error": "Ошибка", "created_at": "Создано", "sent_at": "Отправлено", "text": "Текст"}
+    column_list = [NotificationOutbox.id, NotificationOutbox.order_id, NotificationOutbox.chat_id, NotificationOutbox.status, NotificationOutbox.attempts, NotificationOutbox.created_at, NotificationOutbox.last_error]
+    column_details_list = [NotificationOutbox.id, NotificationOutbox.order_id, NotificationOutbox.chat_id, NotificationOutbox.status, NotificationOutbox.attempts, NotificationOutbox.next_attempt_at, NotificationOutbox.created_at, NotificationOutbox.sent_at, NotificationOutbox.last_error, NotificationOutbox.text]
+    column_formatters = {"status": lambda m, a: NotificationOutboxAdmin._status_map.get(m.status, m.status)}
+    column_default_sort = ("id", True)
+
+def rub(kopecks) -> str:
+    return format_currency((kopecks or 0) / 100, 'RUB', locale='ru_RU')
+
+class SalesDashboard(BaseView):
+    """Отчет по продажам. Читает только сводные таблицы (app/sales_rollup.py), таблицу заказов не сканирует."""
+    name = "Продажи"; icon = "fa-solid fa-chart-line"; category = "Аналитика"
+    periods = [(1, "Сегодня"), (7, "7 дней"), (30, "30 дней"), (90, "90 дней"), (365, "Год")]
+
+    @expose("/sales", methods=["GET"])
+    async def sales(self, request: Request):
+        try: days = max(1, min(int(request.query_params.get("days", "7")), 3660))
+        except ValueError: days = 7
+        venue_id = request.query_params.get("venue") or None
+        end = date.today(); start = end - timedelta(days=days - 1)
+        async with AsyncSessionLocal() as db:
+            venues = await sales_rollup.venue_totals(db, start, end, venue_id)
+            items = sum(row.items or 0 for row in venues)
+            context = {
+                "venues": venues, "daily": await sales_rollup.daily_totals(db, start, end, venue_id),
+                "variants": await sales_rollup.top_variants(db, start, end, venue_id),
+                "addons": await sales_rollup.addon_attach_rates(db, start, end, items, venue_id),
+            }
+        return await self.templates.TemplateResponse(request, "sales_dashboard.html", {
+            **context, "title": self.name, "days": days, "venue_id": venue_id, "periods": self.periods, "start": start, "end": end,
+            "venue_choices": sorted((v.id, v.name) for v in (await venue_directory.get()).values()), "rub": rub,
+            "total_orders": sum(row.orders or 0 for row in venues), "total_revenue": sum(row.revenue or 0 for row in venues), "total_items": items,
+        })
+
 def register_all_views(admin: Admin):
     admin.add_view(CafeAdmin); admin.add_view(VenueMenuItemAdmin); admin.add_view(VenueAddonItemAdmin)
     admin.add_view(OrderAdmin); admin.add_view(CategoryAdmin); admin.add_view(GlobalProductAdmin)
     admin.add_view(GlobalProductVariantAdmin); admin.add_view(GlobalAddonGroupAdmin); admin.add_view(GlobalAddonItemAdmin)
-    admin.add_view(AppSettingAdmin)
\ No newline at end of file
+    admin.add_view(AppSettingAdmin); admin.add_view(NotificationOutboxAdmin); admin.add_view(SalesDashboard)
\ No newline at end of file
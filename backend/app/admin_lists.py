@@ -0,0 +1,222 @@
+# backend/app/admin_lists.py
+"""
+Списки админки для больших таблиц (заказы, цены заведений, outbox).
+
+Стандартный список sqladmin листает через OFFSET и на каждой странице считает
+точный COUNT(*) по всей выборке - на сотнях тысяч заказов это полные проходы
+таблицы. KeysetListMixin листает по ключу сортировки (WHERE (created_at, id) <
+курсор ... LIMIT), что с индексом стоит одинаково на любой странице, а общее
+число строк берет из статистики PostgreSQL (pg_class.reltuples) или считает
+с ограничением, если заданы фильтры. Явная сортировка по колонке из шапки
+таблицы уходит в стандартный режим sqladmin.
+
+Публичного способа подменить запрос страницы у sqladmin нет, поэтому часть
+ModelView.list повторена здесь. Все обращения к внутренностям sqladmin собраны
+в SqladminListAdapter; его проверки срабатывают при создании представления.
+"""
+import base64
+import json
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, ClassVar, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqladmin.models import ModelView
+from sqladmin.pagination import PageControl, Pagination
+from sqlalchemy import DateTime, Integer, Uuid, and_, func, select, text, tuple_
+from sqlalchemy.orm import selectinload
+from starlette.datastructures import URL
+from starlette.requests import Request
+
+# До какого числа строк считаем точно; дальше показываем оценку из статистики
+EXACT_COUNT_LIMIT = 10000
+
+
+@dataclass
+class KeysetPagination(Pagination):
+    """Pagination для шаблона sqladmin: номер страницы только для отображения, переходы - по курсорам."""
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def add_pagination_urls(self, base_url: URL) -> None:
+        base_url = base_url.remove_query_params(["after", "before"])
+        if self.previous_cursor is not None:
+            self.page_controls.append(PageControl(self.page - 1, str(base_url.include_query_params(page=self.page - 1, before=self.previous_cursor))))
+        self.page_controls.append(PageControl(self.page, str(base_url.include_query_params(page=self.page))))
+        if self.next_cursor is not None:
+            self.page_controls.append(PageControl(self.page + 1, str(base_url.include_query_params(page=self.page + 1, after=self.next_cursor))))
+
+
+def _encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else str(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, columns: Sequence[Any]) -> Tuple[Any, ...]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        values = []
+        for column, value in zip(columns, raw, strict=True):
+            if isinstance(column.type, DateTime): values.append(datetime.fromisoformat(value))
+            elif isinstance(column.type, Integer): values.append(int(value))
+            elif isinstance(column.type, Uuid): values.append(uuid.UUID(value))
+            else: values.append(value)
+        return tuple(values)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+class SqladminListAdapter:
+    """
+    Единственное место, где списки опираются на непубличные части sqladmin (сверено с 0.32):
+    ModelView._list_relations, ModelView._run_query и bind у session_maker. При обновлении
+    sqladmin сверить с ModelView.list; если атрибуты пропали, представление не создастся.
+    """
+    REQUIRED = ("_list_relations", "_run_query")
+
+    def __init__(self, view: ModelView):
+        missing = [name for name in self.REQUIRED if not hasattr(view, name)]
+        if missing:
+            raise RuntimeError(f"{type(view).__name__}: sqladmin ModelView no longer has {', '.join(missing)}; update SqladminListAdapter.")
+        self.view = view
+
+    def list_relations(self) -> Sequence[Any]:
+        """Связи из column_list, которые ModelView.list подгружает через selectinload."""
+        return self.view._list_relations
+
+    async def rows(self, stmt) -> List[Any]:
+        """Объекты модели по запросу - так же, как их получает ModelView.list."""
+        return list(await self.view._run_query(stmt))
+
+    def dialect_name(self) -> Optional[str]:
+        bind = self.view.session_maker.kw.get("bind")
+        return bind.dialect.name if bind is not None else None
+
+
+class KeysetListMixin:
+    """
+    Keyset-пагинация для ModelView. keyset_columns - колонки сортировки (по убыванию),
+    последняя - уникальная (обычно первичный ключ); под них должен быть индекс,
+    и колонки не должны допускать NULL - такие строки не попали бы ни на одну страницу.
+    """
+    keyset_columns: ClassVar[Sequence[Any]] = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sqladmin = SqladminListAdapter(self)
+
+    async def list(self, request: Request) -> Pagination:
+        if request.query_params.get("sortBy"):
+            return await super().list(request)
+        page = self.validate_page_number(request.query_params.get("page"), 1)
+        page_size = min(self.validate_page_number(request.query_params.get("pageSize"), self.page_size), max(self.page_size_options))
+        if page_size < 1:
+            raise HTTPException(status_code=400, detail="Invalid page or pageSize parameter")
+
+        stmt = self.list_query(request)
+        for relation in self._sqladmin.list_relations():
+            stmt = stmt.options(selectinload(relation))
+        stmt, filtered = await self._apply_filters(stmt, request)
+        if search := request.query_params.get("search"):
+            stmt, filtered = self.search_query(stmt=stmt, term=search), True
+        count = await self._estimated_count(request, stmt, filtered)
+
+        key = tuple_(*self.keyset_columns)
+        after, before = request.query_params.get("after"), request.query_params.get("before")
+        if before:
+            # Назад: берем строки "выше" курсора в обратном порядке и разворачиваем
+            page_stmt = stmt.where(key > tuple_(*_decode_cursor(before, self.keyset_columns))).order_by(*(c.asc() for c in self.keyset_columns))
+        else:
+            page_stmt = stmt.order_by(*(c.desc() for c in self.keyset_columns))
+            if after: page_stmt = page_stmt.where(key < tuple_(*_decode_cursor(after, self.keyset_columns)))
+        rows = await self._sqladmin.rows(page_stmt.limit(page_size + 1))
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if before: rows.reverse()
+
+        if not rows:
+            page, has_previous, has_next = 1, False, False
+        elif before:
+            has_previous, has_next = more, True
+        else:
+            has_previous, has_next = bool(after), more
+        if not has_previous: page = 1
+        cursor = lambda row: _encode_cursor([getattr(row, column.key) for column in self.keyset_columns])
+        return KeysetPagination(
+            rows=rows, page=page, page_size=page_size,
+            # Оценка может отставать от реального числа строк - не даем ей быть меньше уже показанного
+            count=max(count, (page - 1) * page_size + len(rows)),
+            previous_cursor=cursor(rows[0]) if has_previous else None,
+            next_cursor=cursor(rows[-1]) if has_next else None,
+        )
+
+    async def _apply_filters(self, stmt, request: Request):
+        # Та же логика, что в ModelView.list sqladmin
+        filtered = False
+        for filter_ in self.get_filters():
+            value = request.query_params.get(filter_.parameter_name)
+            if getattr(filter_, "has_operator", False):
+                operation = request.query_params.get(f"{filter_.parameter_name}_op")
+                if value and operation:
+                    stmt, filtered = await filter_.get_filtered_query(stmt, operation, value, self.model), True
+            elif value or hasattr(filter_, "default_value"):
+                stmt = await filter_.get_filtered_query(stmt, value, self.model)
+                filtered = filtered or value not in (None, "", "__all", "all")
+        return stmt, filtered
+
+    async def _estimated_count(self, request: Request, stmt, filtered: bool) -> int:
+        if not filtered and self._sqladmin.dialect_name() == "postgresql":
+            # Оценка из статистики планировщика (обновляется autovacuum/ANALYZE); -1 - таблицу еще не анализировали
+            estimate = await self.count(request, text(
+                "SELECT coalesce((SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)), -1)"
+            ).bindparams(table=self.model.__tablename__))
+            if estimate >= EXACT_COUNT_LIMIT:
+                return estimate
+        # Маленькая таблица или фильтр: считаем точно, но не дальше EXACT_COUNT_LIMIT строк
+        limited = stmt.with_only_columns(*self.pk_columns).order_by(None).limit(EXACT_COUNT_LIMIT + 1).subquery()
+        return await self.count(request, select(func.count()).select_from(limited))
+
+
+class DateRangeFilter:
+    """
+    Фильтр по диапазону дат для колонки DateTime: готовые периоды в списке
+    и произвольный диапазон параметром ?<имя>=2024-01-01..2024-01-31 (границы включительно).
+    """
+    has_operator = False
+    template = "sqladmin/filters/lookup_filter.html"
+    periods = {"today": ("Сегодня", 0), "7d": ("7 дней", 6), "30d": ("30 дней", 29), "90d": ("90 дней", 89)}
+
+    def __init__(self, column, title: Optional[str] = None, parameter_name: Optional[str] = None):
+        self.column = column
+        self.title = title or column.key
+        self.parameter_name = parameter_name or column.key
+
+    async def lookups(self, request: Request, model: Any, run_query) -> List[Tuple[str, str]]:
+        return [("__all", "Все")] + [(key, label) for key, (label, _) in self.periods.items()]
+
+    async def get_filtered_query(self, query, value: Any, model: Any):
+        if not value or value == "__all":
+            return query
+        if value in self.periods:
+            start, end = date.today() - timedelta(days=self.periods[value][1]), date.today()
+        else:
+            try:
+                start_raw, _, end_raw = value.partition("..")
+                start = date.fromisoformat(start_raw) if start_raw else date.min
+                end = date.fromisoformat(end_raw) if end_raw else date.max - timedelta(days=1)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date range '{value}'")
+        # Полуинтервал [start, end + 1 день) использует индекс по колонке, в отличие от func.date(...)
+        return query.where(and_(
+            self.column >= datetime.combine(start, datetime.min.time()),
+            self.column < datetime.combine(end + timedelta(days=1), datetime.min.time()),
+        ))
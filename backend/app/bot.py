@@ -9,96 +9,31 @@ from telegram import Update, WebAppInfo, InlineKeyboardButton, InlineKeyboardMar
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, PreCheckoutQueryHandler, ContextTypes
 from telegram.error import TelegramError
 
-from .database import SessionLocal
-from .models import Order, Cafe
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+from .menu_cache import venue_directory
+from .metrics import ORDERS, timed
+from .models import Order
+from .notifications import render_order_messages, PARSE_MODE
+from .outbox import enqueue_message, outbox_dispatcher
+from .webhook_queue import capture_handler_error
 
 BOT_TOKEN, PAYMENT_PROVIDER_TOKEN, APP_URL, STAFF_GROUP_ID, SUPPORT_USERNAME = os.getenv('BOT_TOKEN'), os.getenv('PAYMENT_PROVIDER_TOKEN'), os.getenv('APP_URL'), os.getenv('STAFF_GROUP_ID'), os.getenv('SUPPORT_USERNAME')
 WEBHOOK_URL, WEBHOOK_PATH = os.getenv('WEBHOOK_URL'), '/bot'
+# Секрет, который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token с каждым апдейтом
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def format_order_for_message(order: Order) -> tuple[str, str]:
-    db = SessionLocal()
-    try:
-        cafe = db.query(Cafe).filter(Cafe.id == order.cafe_id).first()
-        order_id_short = str(order.id).split('-')[0]
-        total_amount_rub = order.total_amount / 100.0
-        user_info = order.user_info or {}
-        first_name = user_info.get('first_name', 'Клиент')
-        username = user_info.get('username', '')
-
-        # Словарь для перевода способов оплаты в понятный текст
-        payment_method_map = {
-            'online': 'Оплата онлайн',
-            'card_on_delivery': 'Оплата картой курьеру',
-            'cash_on_delivery': 'Оплата наличными'
-        }
-        # Если статус 'paid', всегда показываем "Оплачено онлайн"
-        payment_text = "Оплачено онлайн" if order.status == 'paid' else payment_method_map.get(order.payment_method, 'Не указан')
-
-        item_lines = []
-        for item in order.cart_items:
-            item_name = item.get('cafe_item', {}).get('name', 'Неизвестный товар')
-            variant_name = item.get('variant', {}).get('name', '')
-            quantity = item.get('quantity', 0)
-            line = f"  - {item_name} ({variant_name}) x {quantity}"
-            
-            addons = item.get('selected_addons', [])
-            if addons:
-                line += "\n" + "\n".join([f"     + {addon.get('name', 'добавка')}" for addon in addons])
-            item_lines.append(line)
-        items_text = "\n".join(item_lines)
-
-
-        if order.order_type == 'delivery':
-            address_info = user_info.get('shipping_address', {})
-            address_text = (
-                f"Способ получения: **Доставка**\n"
-                f"📍 **Адрес:** {address_info.get('city', '')}, {address_info.get('street', '')}, д. {address_info.get('house', '')}, кв./офис {address_info.get('apartment', '')}\n"
-                f"💬 **Комментарий:** {address_info.get('comment', 'нет')}"
-            )
-        else:
-            address_text = f"Способ получения: **Самовывоз**\n📍 **Кофейня:** {cafe.name if cafe else 'Не указана'}"
-
-        # --- Формирование сообщения для персонала ---
-        staff_header = f"🔥Новый заказ `#{order_id_short}`"
-        client_link = f"@{username}" if username else "N/A"
-        client_info = f"👤**Клиент:** {first_name} ({client_link})"
-
-        staff_text = (
-            f"{staff_header}\n\n"
-            f"🛍️**Состав заказа:**\n{items_text}\n\n"
-            f"💰**Сумма:** {total_amount_rub:.2f} RUB\n"
-            f"**Способ оплаты:** {payment_text}\n"
-            f"{client_info}\n\n"
-            f"{address_text}\n\n"
-            "Необходимо связаться с клиентом для подтверждения."
-        )
-
-        # --- Формирование сообщения для клиента ---
-        customer_text = (
-            f"🔥 Ваш заказ `#{order_id_short}` принят!\n\n"
-            f"🛍️**Состав заказа:**\n{items_text}\n\n"
-            f"💰**Итого:** {total_amount_rub:.2f} RUB\n"
-            f"💵**Способ оплаты:** {payment_text}\n\n"
-            f"{address_text.replace('**', '')}\n\n" 
-            "Мы скоро начнем готовить. Ожидайте, пожалуйста!\n\n"
-            "Для связи с поддержкой введите /help"
-        )
-        return staff_text, customer_text
-    finally:
-        db.close()
-
-async def send_new_order_notifications(order: Order, bot_instance: Bot, user_id_to_notify: Optional[int], staff_group_to_notify: Optional[str]):
-    staff_text, user_text = format_order_for_message(order)
+async def enqueue_new_order_notifications(db: AsyncSession, order: Order, user_id_to_notify: Optional[int], staff_group_to_notify: Optional[str]):
+    """Пишет уведомления о заказе в outbox. Отправятся после коммита транзакции заказа."""
+    # Справочник заведений обращается к БД только после изменения таблицы cafes
+    staff_text, user_text = render_order_messages(order, await venue_directory.get())
     if user_id_to_notify:
-        try:
-            await bot_instance.send_message(chat_id=user_id_to_notify, text=user_text, parse_mode='Markdown')
-        except TelegramError as e: logger.error(f"Failed to send confirmation to user {user_id_to_notify}: {e}")
+        enqueue_message(db, user_id_to_notify, user_text, parse_mode=PARSE_MODE, order_id=order.id)
     if staff_group_to_notify:
-        try:
-            await bot_instance.send_message(chat_id=staff_group_to_notify, text=staff_text, parse_mode='Markdown')
-        except TelegramError as e: logger.error(f"Failed to send order to staff group {staff_group_to_notify}: {e}")
+        enqueue_message(db, staff_group_to_notify, staff_text, parse_mode=PARSE_MODE, order_id=order.id)
 
 async def handle_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.effective_chat: return
@@ -122,15 +57,19 @@ async def handle_pre_checkout_query(update: Update, context: ContextTypes.DEFAUL
 async def successful_payment_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.message or not update.message.successful_payment: return
     payment_info, order_id_str = update.message.successful_payment, update.message.successful_payment.invoice_payload
-    db = SessionLocal()
-    try:
-        order = db.query(Order).filter(Order.id == uuid.UUID(order_id_str)).first()
-        if order:
+    async with AsyncSessionLocal() as db:
+        # Повторная доставка апдейта на другой воркер (окно update_id у каждого процесса свое) ждет
+        # на блокировке строки, пока первая обработка не закоммитит оплату, и дальше ничего не делает
+        order = await db.get(Order, uuid.UUID(order_id_str), with_for_update=True)
+        if order and order.telegram_payment_charge_id:
+            logger.info(f"Payment for order {order_id_str} is already recorded, skipping duplicate update.")
+        elif order:
             order.status, order.telegram_payment_charge_id = 'paid', payment_info.telegram_payment_charge_id
-            db.commit()
-            await send_new_order_notifications(order, context.bot, update.message.from_user.id, STAFF_GROUP_ID)
+            await enqueue_new_order_notifications(db, order, update.message.from_user.id, STAFF_GROUP_ID)
+            await db.commit()
+            outbox_dispatcher.wake()
+            ORDERS.labels(order.cafe_id, order.payment_method, order.status).inc()
         else: logger.error(f"Order with ID {order_id_str} not found after payment!")
-    finally: db.close()
 
 async def initialize_bot_app() -> Application:
     if not BOT_TOKEN: logger.error("BOT_TOKEN is not set!"); return Application.builder().build()
@@ -139,6 +78,7 @@ async def initialize_bot_app() -> Application:
     application.add_handler(CommandHandler("help", handle_help_command)) # Добавляем эту строку
     application.add_handler(PreCheckoutQueryHandler(handle_pre_checkout_query))
     application.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, successful_payment_handler))
+    application.add_error_handler(capture_handler_error)
     return application
 
 async def create_invoice_link(prices: list[LabeledPrice], payload: str, bot_instance: Bot) -> Optional[str]:
@@ -147,14 +87,15 @@ async def create_invoice_link(prices: list[LabeledPrice], payload: str, bot_inst
         logger.error("PAYMENT_PROVIDER_TOKEN is not set!")
         return None
     try:
-        return await bot_instance.create_invoice_link(
-            title='Заказ в EZH Cafe',
-            description='Ваш заказ почти готов к приготовлению!',
-            payload=payload,
-            provider_token=PAYMENT_PROVIDER_TOKEN,
-            currency='RUB',
-            prices=prices
-        )
+        with timed("telegram_create_invoice_link"):
+            return await bot_instance.create_invoice_link(
+                title='Заказ в EZH Cafe',
+                description='Ваш заказ почти готов к приготовлению!',
+                payload=payload,
+                provider_token=PAYMENT_PROVIDER_TOKEN,
+                currency='RUB',
+                prices=prices
+            )
     except TelegramError as e:
         logger.error(f"Failed to create invoice link for payload {payload}: {e}")
         return None
@@ -162,5 +103,5 @@ async def create_invoice_link(prices: list[LabeledPrice], payload: str, bot_inst
 async def setup_webhook(application: Application) -> None:
     if not WEBHOOK_URL: logger.warning("WEBHOOK_URL not set."); return
     full_webhook_url = f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}"
-    await application.bot.set_webhook(url=full_webhook_url)
+    await application.bot.set_webhook(url=full_webhook_url, secret_token=WEBHOOK_SECRET_TOKEN)
     logger.info(f"Webhook set to {full_webhook_url}")
\ No newline at end of file
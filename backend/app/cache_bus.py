@@ -0,0 +1,130 @@
+# backend/app/cache_bus.py
+"""
+Инвалидация кэшей между процессами через PostgreSQL LISTEN/NOTIFY.
+
+При нескольких воркерах uvicorn у каждого процесса свои кэши в памяти
+(menu_cache, venue_directory). Транзакция, изменившая каталог, делает
+pg_notify на том же соединении: PostgreSQL доставит уведомление только после
+коммита и отбросит его при откате. Каждый процесс держит отдельное соединение
+asyncpg с LISTEN и сбрасывает кэши, названные в уведомлении; свои уведомления
+процесс пропускает - он уже сбросил кэши в after_commit.
+
+Ключ инвалидации - "<кэш>" (сбросить целиком) или "<кэш>/<область>", например
+"menu/venue/ezh-1": обработчик кэша получает множество областей и сбрасывает
+только затронутую часть. Пока соединение
+разорвано, уведомления теряются, поэтому после (пере)подключения сбрасываются
+все кэши. На SQLite (один процесс) шина не запускается.
+"""
+import asyncio
+import logging
+import os
+import secrets
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from sqlalchemy import text
+
+from .database import async_engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+# Ограничение PostgreSQL на payload - 8000 байт; длинный список областей сворачивается до имен кэшей
+MAX_PAYLOAD_BYTES = 7000
+# Пауза перед переподключением LISTEN-соединения, с
+CACHE_BUS_RECONNECT_DELAY = float(os.getenv("CACHE_BUS_RECONNECT_DELAY", "2"))
+# Отличает уведомления этого процесса от чужих (pid может повториться в другом контейнере)
+PROCESS_ID = f"{os.getpid()}-{secrets.token_hex(4)}"
+
+_handlers: Dict[str, Callable[[Optional[Set[str]]], None]] = {}
+
+
+def register(name: str, invalidate: Callable[[Optional[Set[str]]], None]) -> None:
+    """invalidate(scopes) сбрасывает области кэша name; scopes=None - весь кэш."""
+    _handlers[name] = invalidate
+
+
+def dispatch(keys: Iterable[str]) -> None:
+    """Раздает ключи инвалидации обработчикам кэшей (и для локальных изменений, и для уведомлений)."""
+    scopes: Dict[str, Optional[Set[str]]] = {}
+    for key in keys:
+        name, _, scope = key.partition("/")
+        if not scope:
+            scopes[name] = None
+        elif scopes.get(name, ()) is not None:
+            scopes.setdefault(name, set()).add(scope)
+    for name, cache_scopes in scopes.items():
+        handler = _handlers.get(name)
+        if handler is not None: handler(cache_scopes)
+
+
+def publish(connection, keys: Iterable[str]) -> None:
+    """Ставит уведомление в текущую транзакцию connection (синхронное соединение SQLAlchemy)."""
+    if connection.dialect.name != "postgresql":
+        return
+    keys = sorted(keys)
+    payload = "\n".join(keys)
+    if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+        payload = "\n".join(sorted({key.partition("/")[0] for key in keys}))
+    connection.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANNEL, "payload": f"{PROCESS_ID}\n{payload}"},
+    )
+
+
+class CacheInvalidationListener:
+    """Фоновая задача, слушающая CHANNEL на отдельном соединении asyncpg."""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.reconnects = 0
+
+    def start(self) -> None:
+        if async_engine.dialect.name != "postgresql":
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try: await self._task
+        except asyncio.CancelledError: pass
+        self._task = None
+
+    def _on_notification(self, connection, pid, channel, payload: str) -> None:
+        sender, _, keys = payload.partition("\n")
+        if sender == PROCESS_ID:
+            return
+        self.received += 1
+        dispatch(keys.split("\n"))
+
+    async def _run(self) -> None:
+        import asyncpg
+        dsn = async_engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(CHANNEL, self._on_notification)
+                # Все, что изменилось до подписки (или пока соединение было разорвано), уже не придет
+                dispatch(list(_handlers))
+                logger.info(f"Listening for cache invalidations on '{CHANNEL}'.")
+                await closed.wait()
+                logger.warning("Cache invalidation listener connection lost.")
+            except asyncio.CancelledError:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation listener failed: {e}")
+            self.reconnects += 1
+            await asyncio.sleep(CACHE_BUS_RECONNECT_DELAY)
+
+    def stats(self) -> dict:
+        return {"running": self._task is not None, "received": self.received, "reconnects": self.reconnects}
+
+
+cache_listener = CacheInvalidationListener()
@@ -0,0 +1,122 @@
+# backend/app/dadata.py
+"""
+Клиент подсказок адресов Dadata.
+
+Один долгоживущий httpx.AsyncClient на процесс (создается и закрывается в lifespan)
+переиспользует TCP+TLS соединения. Ответы кэшируются (TTL + LRU) по нормализованной
+паре (город, запрос), а одновременные одинаковые запросы объединяются в один вызов
+к Dadata, что экономит и время ответа, и суточную квоту.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+DADATA_SUGGEST_URL = "https://suggestions.dadata.ru/suggestions/api/4_1/rs/suggest/address"
+DADATA_CACHE_TTL = float(os.getenv("DADATA_CACHE_TTL", "3600"))
+DADATA_CACHE_SIZE = int(os.getenv("DADATA_CACHE_SIZE", "5000"))
+DADATA_TIMEOUT = float(os.getenv("DADATA_TIMEOUT", "5"))
+
+CacheKey = Tuple[str, str]
+
+
+def normalize(value: str) -> str:
+    """Регистр и лишние пробелы на подсказки Dadata не влияют, а ключ кэша делают разным."""
+    return " ".join(value.split()).lower()
+
+
+class TTLCache:
+    """Небольшой LRU-кэш с временем жизни записей."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None: del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DadataClient:
+    def __init__(self, api_key: Optional[str], cache_size: int = DADATA_CACHE_SIZE, cache_ttl: float = DADATA_CACHE_TTL):
+        self.api_key = api_key
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+        self.upstream_calls = self.coalesced = 0
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(
+            timeout=DADATA_TIMEOUT,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+            headers={"Content-Type": "application/json", "Accept": "application/json", "Authorization": f"Token {self.api_key}"},
+        )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch(self, key: CacheKey) -> Dict[str, Any]:
+        city, query = key
+        payload = {"query": query, "locations": [{"city": city}], "from_bound": {"value": "street"}, "to_bound": {"value": "house"}}
+        self.upstream_calls += 1
+        with timed("dadata_suggest"):
+            response = await self._client.post(DADATA_SUGGEST_URL, json=payload)
+            response.raise_for_status()
+        result = response.json()
+        self.cache.set(key, result)
+        return result
+
+    async def suggest_address(self, query: str, city: str) -> Dict[str, Any]:
+        key = (normalize(city), normalize(query))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        # shield: отмена одного клиента (закрыл вкладку) не должна отменять общий запрос для остальных
+        return await asyncio.shield(task)
+
+    def _finish(self, key: CacheKey, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        # Забираем исключение, даже если все ожидавшие уже ушли, иначе asyncio ругается в лог
+        if not task.cancelled(): task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "cache_size": len(self.cache), "cache_hits": self.cache.hits, "cache_misses": self.cache.misses,
+            "upstream_calls": self.upstream_calls, "coalesced": self.coalesced, "inflight": len(self._inflight),
+        }
+
+
+dadata_client = DadataClient(api_key=os.getenv("DADATA_API_KEY"))
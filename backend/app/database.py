@@ -1,6 +1,14 @@
+import bisect
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 # Читаем DATABASE_URL из переменных окружения.
 # В Docker Compose env_file уже делает это, так что os.getenv() сработает.
@@ -13,13 +21,191 @@ if not DATABASE_URL:
     # В реальном приложении можно поднять исключение или логировать критическую ошибку
     # Для простоты примера пока оставим так, но создание engine, вероятно, упадет.
 
+# Настройки пула соединений (на каждый движок отдельно: синхронный - админка, асинхронный - API и бот)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Соединения старше этого числа секунд пересоздаются (обходит обрывы на стороне прокси/файрвола)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Сколько секунд ждать свободного соединения, прежде чем ответить ошибкой
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# statement_timeout на стороне PostgreSQL, мс; 0 - без ограничения
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# Границы гистограммы ожидания соединения из пула, мс
+POOL_WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolStats:
+    """Счетчики пула: выдачи соединений, время ожидания, выходы за pool_size и таймауты."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = self.overflow_events = self.timeouts = 0
+        self.wait_buckets = [0] * (len(POOL_WAIT_BUCKETS_MS) + 1)
+        self.wait_sum_ms = self.wait_max_ms = 0.0
+
+    def record_wait(self, wait_ms: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_buckets[bisect.bisect_left(POOL_WAIT_BUCKETS_MS, wait_ms)] += 1
+            self.wait_sum_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+
+    def record_overflow(self) -> None:
+        with self._lock: self.overflow_events += 1
+
+    def record_timeout(self) -> None:
+        with self._lock: self.timeouts += 1
+
+
+# (пул, момент начала выдачи соединения) для текущего вызова Pool.connect. ContextVar, а не
+# thread-local: в асинхронном движке выдачи разных задач идут в одном потоке
+_checkout_started: ContextVar[Optional[Tuple["_InstrumentedPoolMixin", float]]] = ContextVar("pool_checkout_started", default=None)
+
+
+class _InstrumentedPoolMixin:
+    """
+    Замеряет ожидание соединения по публичному API пула: таймер вокруг Pool.connect,
+    который закрывается событием checkout (соединение взято из пула) или do_connect
+    (пул начал создавать новое - время подключения в ожидание не входит).
+    Проверка pool_pre_ping идет до checkout и в ожидание входит.
+    """
+    stats: PoolStats
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        token = _checkout_started.set((self, time.perf_counter()))
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        finally:
+            _checkout_started.reset(token)
+
+    def recreate(self):
+        # engine.dispose() пересоздает пул; накопленная статистика переходит в новый
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def _checkout_waited(*args) -> None:
+    """Обработчик checkout и do_connect: ожидание закончилось; на выдачу считается один раз."""
+    started = _checkout_started.get()
+    if started is None: return
+    _checkout_started.set(None)
+    pool, started_at = started
+    pool.stats.record_wait((time.perf_counter() - started_at) * 1000)
+
+
+def _instrument_pool_events(target) -> None:
+    event.listen(target, "checkout", _checkout_waited)
+
+    @event.listens_for(target, "do_connect")
+    def _connection_creating(dialect, connection_record, cargs, cparams):
+        # do_connect идет сразу за увеличением overflow и до первого await подключения, так что
+        # соседние выдачи его еще не сдвинули. overflow() считается от -pool_size: положительное - сверх pool_size
+        if target.pool.overflow() > 0: target.pool.stats.record_overflow()
+        _checkout_waited()
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_stats(pool) -> Dict[str, Any]:
+    """Снимок состояния пула для служебного эндпоинта."""
+    stats: PoolStats = pool.stats
+    buckets, cumulative = {}, 0
+    for bound, count in zip((*POOL_WAIT_BUCKETS_MS, "+Inf"), stats.wait_buckets):
+        cumulative += count
+        buckets[str(bound)] = cumulative
+    return {
+        "pool_size": pool.size(), "checked_out": pool.checkedout(), "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0), "max_overflow": DB_MAX_OVERFLOW,
+        "checkouts": stats.checkouts, "overflow_events": stats.overflow_events, "timeouts": stats.timeouts,
+        "wait_ms_buckets": buckets, "wait_ms_sum": round(stats.wait_sum_ms, 3), "wait_ms_max": round(stats.wait_max_ms, 3),
+    }
+
+
+def _connect_args(async_driver: bool) -> Dict[str, Any]:
+    if not DB_STATEMENT_TIMEOUT_MS or make_url(DATABASE_URL).get_backend_name() != "postgresql":
+        return {}
+    if async_driver:
+        return {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+
+
+POOL_OPTIONS = dict(
+    pool_pre_ping=True,  # pool_pre_ping помогает избежать ошибок "server has gone away"
+    pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+    pool_recycle=DB_POOL_RECYCLE, pool_timeout=DB_POOL_TIMEOUT,
+)
+
 # Создаем движок SQLAlchemy.
-# disable_autoload_of_col=True - может быть полезно для некоторых версий SQLAlchemy/psycopg2
-engine = create_engine(DATABASE_URL, pool_pre_ping=True) # pool_pre_ping помогает избежать ошибок "server has gone away"
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, connect_args=_connect_args(async_driver=False), **POOL_OPTIONS)
+_instrument_pool_events(engine)
 
 # Создаем настроенный класс Session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def to_async_url(url: str) -> str:
+    """Подменяет синхронный драйвер в DATABASE_URL на асинхронный."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        return parsed.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return url
+
+
+# Асинхронный движок для FastAPI-эндпоинтов и обработчиков бота: запросы к БД
+# не блокируют event loop. Синхронный engine остается для админки и скриптов.
+async_engine = create_async_engine(
+    to_async_url(DATABASE_URL), poolclass=InstrumentedAsyncQueuePool, connect_args=_connect_args(async_driver=True), **POOL_OPTIONS
+)
+_instrument_pool_events(async_engine.sync_engine)
+
+
+class TimedSession(Session):
+    """
+    Session, которая считает, сколько времени держала соединение из пула (info["db_seconds"]).
+    Соединение берется при первом запросе к БД, а не при создании сессии, и возвращается
+    в пул по commit/rollback/close - сессия, не дошедшая до БД, пул не занимает.
+    """
+
+
+@event.listens_for(TimedSession, "after_begin")
+def _connection_acquired(session, transaction, connection):
+    session.info.setdefault("db_acquired_at", time.perf_counter())
+
+
+@event.listens_for(TimedSession, "after_transaction_end")
+def _connection_released(session, transaction):
+    acquired_at = session.info.pop("db_acquired_at", None) if transaction.parent is None else None
+    if acquired_at is not None:
+        session.info["db_seconds"] = session.info.get("db_seconds", 0.0) + time.perf_counter() - acquired_at
+
+
+def session_db_seconds(session: AsyncSession) -> Optional[float]:
+    """Сколько сессия держала соединение; None - до БД дело не дошло."""
+    return session.info.get("db_seconds")
+
+
+# expire_on_commit=False: объекты остаются доступными после commit без повторной загрузки,
+# иначе обращение к атрибутам вне await вызовет ленивый запрос.
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False, sync_session_class=TimedSession)
+
 # Импортируем Base из ваших моделей, чтобы она была зарегистрирована при создании движка
 # from .models import Base # Убедитесь, что этот импорт присутствует, если Base определена в models.py
 
@@ -0,0 +1,52 @@
+# backend/app/db_migrations.py
+"""
+Применение миграций Alembic (alembic/versions) при старте.
+
+Вызывается из entrypoint.sh перед наполнением данными и из lifespan
+приложения. Базы, созданные раньше через Base.metadata.create_all, не знают
+про Alembic: их схема совпадает с базовой ревизией, поэтому такая база
+помечается базовой ревизией (stamp) и дальше обновляется как обычно.
+"""
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+BASELINE_REVISION = "0001"
+# Ключ advisory-lock: несколько воркеров/контейнеров не должны мигрировать одновременно
+MIGRATION_LOCK_ID = 0x657a6863  # "ezhc"
+# entrypoint.sh мигрирует до запуска воркеров и выставляет 0, чтобы каждый воркер не повторял это в lifespan
+RUN_MIGRATIONS_ON_STARTUP = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "1") == "1"
+
+
+def _alembic_config(connection) -> Config:
+    config = Config(ALEMBIC_INI)
+    config.attributes["connection"] = connection
+    return config
+
+
+def upgrade_database() -> None:
+    """Доводит схему до последней ревизии. Повторный вызов на актуальной базе ничего не делает."""
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            # Держится до конца транзакции; остальные процессы ждут и затем видят актуальную схему
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        config = _alembic_config(connection)
+        tables = set(inspect(connection).get_table_names())
+        if "alembic_version" not in tables and "cafes" in tables:
+            logger.info(f"Existing schema without migration history, stamping baseline {BASELINE_REVISION}.")
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, "head")
+    logger.info("Database schema is up to date.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade_database()
@@ -0,0 +1,190 @@
+# backend/app/http_cache.py
+"""
+Условные GET-запросы (ETag / Last-Modified / 304) и готовые тела ответов
+для каталожных эндпоинтов.
+
+Версия ответа - дайджест содержимого снимка из menu_cache, поэтому проверка
+If-None-Match стоит одно сравнение строк: при совпадении отвечаем 304 без
+обращения к БД и без сериализации тела. Сами тела рендерятся в JSON один раз
+на версию каталога и хранятся вместе со сжатыми (gzip, br) вариантами.
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаем gzip
+    brotli = None
+
+# Сколько секунд клиент может использовать ответ без перепроверки
+CATALOG_CACHE_MAX_AGE = int(os.getenv("CATALOG_CACHE_MAX_AGE", "60"))
+# Сколько отрендеренных тел держать в памяти (ключ включает версию, устаревшие вытесняются)
+RENDERED_CACHE_SIZE = int(os.getenv("RENDERED_CACHE_SIZE", "512"))
+# Маленькие тела не сжимаем: заголовки и распаковка обойдутся дороже выигрыша
+MIN_COMPRESS_SIZE = 512
+# Уровни сжатия: максимальные (br 11, gzip 9) в разы медленнее при выигрыше в несколько процентов
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+
+def content_version(*parts) -> str:
+    """Короткий дайджест содержимого. Элементы снимков - frozen dataclass'ы с детерминированным repr."""
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def utcnow() -> datetime:
+    # Last-Modified передается с точностью до секунды
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _matching_etag(header: str, etag: str) -> Optional[str]:
+    """
+    ETag из If-None-Match, подтверждающий текущую версию, или None.
+
+    Сравнение слабое: префикс W/ игнорируется, а ETag любого сжатого варианта
+    ("<версия>-gzip") подтверждает ту же версию.
+    """
+    if header.strip() == "*":
+        return etag
+    version = etag.strip('"')
+    for candidate in header.split(","):
+        tag = candidate.strip().removeprefix("W/").strip('"')
+        if tag == version or tag.rsplit("-", 1)[0] == version:
+            return f'"{tag}"'
+    return None
+
+
+def _not_modified_since(header: str, last_modified: datetime) -> bool:
+    try: since = parsedate_to_datetime(header)
+    except (TypeError, ValueError): return False
+    if since.tzinfo is None: since = since.replace(tzinfo=timezone.utc)
+    return last_modified <= since
+
+
+def _validator_headers(version: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    headers = {"ETag": f'"{version}"', "Cache-Control": f"public, max-age={CATALOG_CACHE_MAX_AGE}, must-revalidate"}
+    if last_modified is not None: headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+
+def _not_modified_etag(request: Request, etag: str, last_modified: Optional[datetime]) -> Optional[str]:
+    """ETag для ответа 304, если у клиента уже есть текущая версия, иначе None."""
+    # If-Modified-Since учитывается только при отсутствии If-None-Match (RFC 9110)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _matching_etag(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified and _not_modified_since(if_modified_since, last_modified):
+        return etag
+    return None
+
+
+# --- Готовые тела ответов ---
+
+@dataclass(frozen=True, slots=True)
+class RenderedBody:
+    """JSON-тело одной версии ответа и его сжатые варианты."""
+    version: str
+    last_modified: Optional[datetime]
+    identity: bytes
+    encoded: Dict[str, bytes]
+
+
+def render_json(adapter: TypeAdapter, data: Any) -> bytes:
+    """Тот же JSON, что отдал бы FastAPI по response_model (camelCase, сериализаторы полей), но один раз."""
+    return adapter.dump_json(adapter.validate_python(data, from_attributes=True), by_alias=True)
+
+
+def _compress(body: bytes) -> Dict[str, bytes]:
+    if len(body) < MIN_COMPRESS_SIZE:
+        return {}
+    encoded = {"gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None: encoded["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return encoded
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try: quality = float(params.strip()[2:])
+            except ValueError: quality = 0.0
+        if coding: accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def _choose_encoding(request: Request, body: RenderedBody) -> Optional[str]:
+    if not body.encoded:
+        return None
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    candidates = [(accepted.get(coding, accepted.get("*", 0.0)), coding) for coding in ("br", "gzip") if coding in body.encoded]
+    quality, coding = max(candidates, key=lambda c: c[0])
+    return coding if quality > 0 else None
+
+
+class RenderedCache:
+    """LRU готовых тел по ключу (маршрут, параметры, версия)."""
+
+    def __init__(self, maxsize: int = RENDERED_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._bodies: "OrderedDict[Tuple[Hashable, str], RenderedBody]" = OrderedDict()
+        self.hits = self.misses = 0
+
+    async def get(self, key: Hashable, version: str, last_modified: Optional[datetime], render: Callable[[], bytes]) -> RenderedBody:
+        cache_key = (key, version)
+        body = self._bodies.get(cache_key)
+        if body is not None:
+            self._bodies.move_to_end(cache_key)
+            self.hits += 1
+            return body
+        self.misses += 1
+        payload = render()
+        # Сжатие большого тела (меню) - десятки миллисекунд CPU: в потоке, чтобы не держать event loop
+        encoded = await asyncio.to_thread(_compress, payload) if len(payload) >= MIN_COMPRESS_SIZE else {}
+        body = RenderedBody(version=version, last_modified=last_modified, identity=payload, encoded=encoded)
+        self._bodies[cache_key] = body
+        while len(self._bodies) > self.maxsize:
+            self._bodies.popitem(last=False)
+        return body
+
+    def __len__(self) -> int:
+        return len(self._bodies)
+
+    def stats(self) -> dict:
+        return {"size": len(self._bodies), "hits": self.hits, "misses": self.misses}
+
+
+rendered_cache = RenderedCache()
+
+
+async def rendered_response(request: Request, key: Hashable, version: str, last_modified: Optional[datetime], render: Callable[[], bytes]) -> Response:
+    """
+    Отдает готовое тело версии version (рендерит его при первом обращении).
+
+    Ответ - сырые байты в кодировке, подходящей под Accept-Encoding, без валидации
+    Pydantic и сжатия на пути запроса. 304 - без тела, если версия у клиента совпадает.
+    """
+    headers = _validator_headers(version, last_modified)
+    headers["Vary"] = "Accept-Encoding"
+    if not_modified_etag := _not_modified_etag(request, headers["ETag"], last_modified):
+        # 304 подтверждает именно то представление (сжатое или нет), что лежит у клиента
+        return Response(status_code=304, headers={**headers, "ETag": not_modified_etag})
+    body = await rendered_cache.get(key, version, last_modified, render)
+    coding = _choose_encoding(request, body)
+    if coding is None:
+        return Response(content=body.identity, media_type="application/json", headers=headers)
+    # Сжатый вариант - другое представление, поэтому и ETag у него свой
+    headers.update({"ETag": f'"{version}-{coding}"', "Content-Encoding": coding})
+    return Response(content=body.encoded[coding], media_type="application/json", headers=headers)
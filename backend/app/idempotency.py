@@ -0,0 +1,165 @@
+# backend/app/idempotency.py
+"""
+Ключи идемпотентности для создания заказа.
+
+Двойное нажатие "Оплатить" или повтор запроса сетью не должны создавать второй
+заказ, второй счет и второе уведомление персоналу. Запрос с ключом сначала
+занимает строку idempotency_keys (отдельной закоммиченной транзакцией - ее видят
+все воркеры), затем выполняется, а ответ записывается в ту же строку в транзакции
+самого заказа: заказ и сохраненный ответ появляются атомарно. Повтор с тем же
+ключом получает сохраненный ответ без обращения к Telegram и без записи в БД.
+
+Одновременные повторы ждут первую попытку: в том же процессе - на asyncio.Future
+(и получают ее результат или ее ошибку), в другом процессе - опрашивая строку.
+Если первая попытка упала, строка удаляется и следующий повтор выполняет запрос
+заново; строку процесса, упавшего посреди запроса, можно перехватить через
+IDEMPOTENCY_LOCK_SECONDS. Ответы хранятся IDEMPOTENCY_TTL_SECONDS.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+# Сколько повтор ждет попытку из другого процесса, прежде чем ответить 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "15"))
+# Незавершенная дольше этого попытка считается брошенной (процесс упал) и может быть перехвачена
+IDEMPOTENCY_LOCK_SECONDS = 60
+MAX_KEY_LENGTH = 200
+_POLL_INTERVAL = 0.2
+# Просроченные строки удаляются не чаще раза в столько секунд
+_PURGE_INTERVAL = 60
+
+Record = Callable[[AsyncSession, Dict[str, Any]], Awaitable[None]]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def request_fingerprint(*parts) -> str:
+    """Дайджест содержимого запроса (JSON-совместимые части)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self):
+        # Ключ -> (отпечаток, результат первой попытки) для попыток, выполняющихся в этом процессе
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._purged_at = 0.0
+        self.executed = self.replayed = self.waited = 0
+
+    async def run(self, key: str, fingerprint: str, call: Callable[[Record], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Выполняет call(record) не больше одного раза на ключ. call обязан вызвать
+        await record(db, ответ) перед коммитом своей транзакции; сохраненный ответ - JSON.
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            if inflight[0] != fingerprint: raise self._mismatch()
+            self.waited += 1
+            # shield: отключившийся клиент-повтор не отменяет исходную попытку
+            return await asyncio.shield(inflight[1])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        claimed = False
+        try:
+            stored = await self._claim_or_wait(key, fingerprint)
+            if stored is not None:
+                self.replayed += 1
+                response = stored
+            else:
+                claimed = True
+                response = await call(partial(self._record, key))
+                self.executed += 1
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError): future.cancel()
+            else: future.set_exception(e); future.exception()  # ошибку получат ожидающие; без них - не логировать "never retrieved"
+            if claimed: await asyncio.shield(self._release(key))
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _claim_or_wait(self, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """None - ключ занят этим запросом; иначе сохраненный ответ первой попытки."""
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            async with AsyncSessionLocal() as db:
+                await self._purge(db)
+                now = _utcnow()
+                values = {"fingerprint": fingerprint, "response": None, "locked_at": now, "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)}
+                insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+                result = await db.execute(insert(IdempotencyKey.__table__).values(key=key, **values).on_conflict_do_nothing(index_elements=["key"]))
+                if result.rowcount == 1:
+                    await db.commit()
+                    return None
+                row = await db.get(IdempotencyKey, key)
+                if row is not None:
+                    if row.expires_at > now:
+                        if row.fingerprint != fingerprint: raise self._mismatch()
+                        if row.response is not None: return row.response
+                    if row.expires_at <= now or row.locked_at <= now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS):
+                        # Просрочена или брошена: перехватываем, если никто не успел раньше
+                        taken = await db.execute(
+                            update(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.locked_at == row.locked_at).values(**values)
+                        )
+                        if taken.rowcount == 1:
+                            await db.commit()
+                            logger.warning(f"Idempotency key {key!r} taken over from a stale attempt.")
+                            return None
+                    elif time.monotonic() > deadline:
+                        raise HTTPException(409, "A request with this idempotency key is still being processed.")
+                    else:
+                        self.waited += 1
+            # Строку только что удалили (попытка упала) - сразу пробуем занять сами
+            if row is not None: await asyncio.sleep(_POLL_INTERVAL)
+
+    async def _record(self, key: str, db: AsyncSession, response: Dict[str, Any]) -> None:
+        await db.execute(
+            update(IdempotencyKey).where(IdempotencyKey.key == key)
+            .values(response=response, expires_at=_utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS))
+        )
+
+    async def _release(self, key: str) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.response.is_(None)))
+                await db.commit()
+        except Exception as e:
+            # Не освободили - повтор перехватит ключ через IDEMPOTENCY_LOCK_SECONDS
+            logger.error(f"Could not release idempotency key {key!r}: {e}")
+
+    async def _purge(self, db: AsyncSession) -> None:
+        if time.monotonic() - self._purged_at < _PURGE_INTERVAL:
+            return
+        self._purged_at = time.monotonic()
+        await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < _utcnow()))
+        await db.commit()
+
+    @staticmethod
+    def _mismatch() -> HTTPException:
+        return HTTPException(422, "Idempotency key was already used with a different request.")
+
+    def stats(self) -> dict:
+        return {"inflight": len(self._inflight), "executed": self.executed, "replayed": self.replayed, "waited": self.waited}
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,145 @@
+# backend/app/images.py
+"""
+Обработка картинок, загруженных через админку.
+
+Оригинал декодируется один раз и сохраняется в нескольких ширинах (IMAGE_WIDTHS)
+в WebP и JPEG под именами из хэша содержимого: img/<хэш>-<ширина>.webp. Картинка
+не увеличивается: копии делаются только уже оригинала, плюс копия в его собственной
+ширине, поэтому ширина в имени - всегда реальная ширина файла. Та же
+картинка, загруженная повторно, дает те же имена и не обрабатывается заново.
+Раз имя меняется вместе с содержимым, /media/img/ отдается с Cache-Control
+immutable на год (MediaFiles). В БД пишется путь к самому большому WebP;
+нужный размер для конкретного места получается из него (image_variant/image_srcset).
+
+SVG Pillow не декодирует: такой файл сохраняется как есть - тоже под хэшем,
+но без уменьшенных копий.
+"""
+import hashlib
+import io
+import os
+import re
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from starlette.staticfiles import StaticFiles
+
+# Ширины копий, px: превью в списках, карточка товара, обложка на всю ширину экрана (с запасом на retina)
+IMAGE_WIDTHS = (320, 640, 1280)
+# Миниатюра в списках (карточки ~100 px, корзина); крупнее браузер выбирает сам по srcset
+THUMBNAIL_WIDTH = IMAGE_WIDTHS[0]
+IMAGE_DIR = "img"
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "82"))
+# Защита от "бомб" декомпрессии: больше этого числа пикселей Pillow откажется декодировать
+Image.MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "50000000"))
+# Векторные форматы Pillow не читает; они и так легкие - сохраняются без копий
+PASSTHROUGH_EXTENSIONS = (".svg",)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ORIENTATION_TAG = 0x0112
+
+_VARIANT = re.compile(rf"^(?P<base>.*/{IMAGE_DIR}/[0-9a-f]{{16}})-(?P<width>\d+)\.(?P<ext>webp|jpg)$")
+
+
+def _widths(largest: int) -> Tuple[int, ...]:
+    """Ширины копий картинки, самая большая копия которой - largest px."""
+    return tuple(w for w in IMAGE_WIDTHS if w < largest) + (largest,)
+
+
+def _variant_name(digest: str, width: int, ext: str) -> str:
+    return f"{IMAGE_DIR}/{digest}-{width}.{ext}"
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        if image.mode in ("RGBA", "LA", "P"):
+            # У JPEG нет прозрачности - подкладываем белый фон
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, "white")
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        image.convert("RGB").save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def _write(upload_dir: str, name: str, data: bytes) -> None:
+    path = os.path.join(upload_dir, name)
+    # Запись во временный файл и rename: /media не отдаст недописанный файл
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def store_image(data: bytes, filename: str, upload_dir: str) -> str:
+    """
+    Сохраняет загрузку и ее уменьшенные копии; возвращает путь для БД относительно
+    upload_dir (префикс /media/ добавит модель). Синхронная и тяжелая по CPU -
+    из async-кода вызывать через to_thread.
+    """
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    os.makedirs(os.path.join(upload_dir, IMAGE_DIR), exist_ok=True)
+    try:
+        # open читает только заголовок: размер известен до декодирования пикселей
+        image = Image.open(io.BytesIO(data))
+        # Ориентации 5-8 по EXIF поворачивают картинку на 90°: шириной станет высота
+        width = image.height if image.getexif().get(ORIENTATION_TAG, 1) in (5, 6, 7, 8) else image.width
+        widths = _widths(min(width, IMAGE_WIDTHS[-1]))
+        largest = _variant_name(digest, widths[-1], "webp")
+        if os.path.exists(os.path.join(upload_dir, largest)):
+            return largest
+        image.load()
+    except UnidentifiedImageError:
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in PASSTHROUGH_EXTENSIONS:
+            raise ValueError(f"Не удалось прочитать изображение '{filename}'.")
+        name = f"{IMAGE_DIR}/{digest}{ext}"
+        if not os.path.exists(os.path.join(upload_dir, name)): _write(upload_dir, name, data)
+        return name
+    except Image.DecompressionBombError:
+        raise ValueError("Изображение слишком большое.")
+
+    # Оригинал остается для повторной нарезки, если набор ширин поменяется
+    _write(upload_dir, f"{IMAGE_DIR}/{digest}{os.path.splitext(filename)[1].lower()}", data)
+    # Поворот по EXIF: телефоны пишут ориентацию тегом, а не поворачивают пиксели
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    # Самый большой вариант пишется последним: по нему проверяется, что обработка уже была
+    for width in widths:
+        variant = image if image.width <= width else image.resize(
+            (width, round(image.height * width / image.width)), Image.Resampling.LANCZOS, reducing_gap=3.0
+        )
+        _write(upload_dir, _variant_name(digest, width, "jpg"), _encode(variant, "JPEG"))
+        _write(upload_dir, _variant_name(digest, width, "webp"), _encode(variant, "WEBP"))
+    return largest
+
+
+def image_variant(path: Optional[str], width: int, ext: str = "webp") -> Optional[str]:
+    """Путь к копии не уже width (или к самой большой); пути не из пайплайна возвращаются как есть."""
+    match = _VARIANT.match(path) if path else None
+    if match is None:
+        return path
+    # В БД хранится путь к самой большой копии: из ее ширины понятно, какие копии есть
+    widths = _widths(int(match["width"]))
+    fitting = next((w for w in widths if w >= width), widths[-1])
+    return f"{match['base']}-{fitting}.{ext}"
+
+
+def image_srcset(path: Optional[str], to_url=lambda p: p) -> Optional[str]:
+    """Значение srcset с реальными ширинами копий; None, если у картинки нет копий."""
+    match = _VARIANT.match(path) if path else None
+    if match is None:
+        return None
+    return ", ".join(f"{to_url(image_variant(path, width))} {width}w" for width in _widths(int(match["width"])))
+
+
+class MediaFiles(StaticFiles):
+    """StaticFiles для /media: файлы пайплайна неизменяемы и кэшируются клиентами и CDN на год."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if os.path.basename(os.path.dirname(full_path)) == IMAGE_DIR:
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
@@ -1,4 +1,5 @@
 # backend/app/main.py
+import hmac
 import json
 import os
 import logging
@@ -7,31 +8,46 @@ from typing import List, Optional
 
 import httpx
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi import FastAPI, Request, Response, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session, joinedload, selectinload
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 from telegram import Update, Bot, LabeledPrice
 from telegram.ext import Application
 from urllib.parse import parse_qs
 from starlette.middleware.sessions import SessionMiddleware
-from sqladmin import Admin
 
 # --- ИЗМЕНЕНИЯ ЗДЕСЬ ---
 # 1. Импортируем все необходимое из нашего нового файла admin.py
-from .admin import authentication_backend, register_all_views
+from .admin import AdminPanel, ADMIN_TEMPLATES_DIR, authentication_backend, register_all_views
 # -------------------------
 
 from . import auth
-from .bot import initialize_bot_app, create_invoice_link, WEBHOOK_PATH, send_new_order_notifications
-from .database import engine, SessionLocal
+from . import sales_rollup  # noqa: F401 - обработчик сессии, ведущий сводные таблицы продаж
+from .bot import initialize_bot_app, create_invoice_link, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN, enqueue_new_order_notifications
+from .db_migrations import upgrade_database, RUN_MIGRATIONS_ON_STARTUP
+from .database import engine, async_engine, AsyncSessionLocal, pool_stats, session_db_seconds
+from .sql_profiler import SQL_PROFILING, SQLProfilerMiddleware, install as install_sql_profiler
+from .metrics import MetricsMiddleware, ORDERS, observe_db_session, register_cache, register_gauges, register_pool, render_metrics
+from .menu_cache import menu_cache, venue_directory, diff_menus
+from .cache_bus import cache_listener
+from .http_cache import rendered_response, rendered_cache, render_json
+from .images import MediaFiles
+from .idempotency import idempotency_store, request_fingerprint, MAX_KEY_LENGTH, Record
+from .outbox import outbox_dispatcher
+from .popularity import popularity_ranking
+from .dadata import dadata_client
+from .promotions import promotion_store
+from .webhook_queue import update_ingestor, UpdateQueueFull, WEBHOOK_MODE, process_update_checked
+from .pricing import quote_cart
 from .models import (
-    Base, Cafe, Category, GlobalProduct, GlobalProductVariant,
+    Cafe, Category, GlobalProduct, GlobalProductVariant,
     VenueMenuItem, Order, GlobalAddonGroup, GlobalAddonItem, VenueAddonItem, AppSetting 
 )
 from .schemas import (
     CategorySchema, MenuItemSchema, OrderRequest, CafeSettingsSchema, CafeSchema,
-    AddressSuggestionRequest, DadataSuggestionResponse, PromotionSchema
+    AddressSuggestionRequest, DadataSuggestionResponse, PromotionSchema, CartQuoteRequest, CartQuoteSchema,
+    VenueMenuSchema
 )
 
 load_dotenv()
@@ -41,7 +57,7 @@ logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s
 logger = logging.getLogger(__name__)
 
 # Путь для загруженных файлов из админки
-UPLOAD_DIR = "/app/uploads"
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads")
 API_URL = os.getenv("API_URL", "")
 
 def create_full_image_url(path: Optional[str]) -> Optional[str]:
@@ -55,25 +71,30 @@ def create_full_image_url(path: Optional[str]) -> Optional[str]:
             logger.warning(f"API_URL is not set. Returning relative path: {path}")
     return path
 
-def _truncate_label(base: str, suffix: str) -> str:
-    max_base_len = 32 - len(suffix)
-    if len(base) > max_base_len:
-        return base[:max_base_len - 3] + "..." + suffix
-    return base + suffix
-
 _application_instance: Optional[Application] = None
 _bot_instance: Optional[Bot] = None
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("FastAPI startup.")
-    Base.metadata.create_all(bind=engine)
+    if RUN_MIGRATIONS_ON_STARTUP: upgrade_database()
     global _application_instance, _bot_instance
+    await dadata_client.start()
+    cache_listener.start()
     _application_instance = await initialize_bot_app()
     _bot_instance = _application_instance.bot
     await _application_instance.initialize()
+    outbox_dispatcher.start(_bot_instance)
+    popularity_ranking.start()
+    if WEBHOOK_MODE == 'queue': update_ingestor.start(_application_instance)
     yield
+    if WEBHOOK_MODE == 'queue': await update_ingestor.stop()
+    await popularity_ranking.stop()
+    await outbox_dispatcher.stop()
     if _application_instance: await _application_instance.shutdown()
+    await cache_listener.stop()
+    await dadata_client.close()
+    await async_engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -84,12 +105,12 @@ app.add_middleware(
 )
 # -------------------------
 
-# Монтируем статическую директорию для доступа к загруженным файлам
-app.mount("/media", StaticFiles(directory=UPLOAD_DIR), name="media")
+# Монтируем статическую директорию для доступа к загруженным файлам (копии картинок из админки - с immutable-кэшем)
+app.mount("/media", MediaFiles(directory=UPLOAD_DIR), name="media")
 
 # --- ИЗМЕНЕНИЯ ЗДЕСЬ ---
 # 3. Инициализируем админ-панель и регистрируем наши представления
-admin = Admin(app, engine, authentication_backend=authentication_backend)
+admin = AdminPanel(app, engine, authentication_backend=authentication_backend, templates_dir=ADMIN_TEMPLATES_DIR)
 register_all_views(admin)
 # -------------------------
 
@@ -110,8 +131,29 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if SQL_PROFILING:
+    install_sql_profiler(engine, async_engine.sync_engine)
+    app.add_middleware(SQLProfilerMiddleware)
+# Снаружи всех остальных middleware, чтобы в задержку попадала вся обработка запроса
+app.add_middleware(MetricsMiddleware)
+
+register_cache("menu", lambda: (menu_cache.hits, menu_cache.misses, menu_cache.stats()["venues"]))
+register_cache("rendered", lambda: (rendered_cache.hits, rendered_cache.misses, len(rendered_cache)))
+register_cache("dadata", lambda: (dadata_client.cache.hits, dadata_client.cache.misses, len(dadata_client.cache)))
+register_gauges("webhook_queue", lambda: update_ingestor.stats())
+register_gauges("cache_bus", lambda: cache_listener.stats())
+register_gauges("popularity", lambda: popularity_ranking.stats())
+register_gauges("idempotency", lambda: idempotency_store.stats())
+register_gauges("dadata", lambda: {"upstream_calls": dadata_client.upstream_calls, "coalesced": dadata_client.coalesced})
+register_pool("async", lambda: async_engine.pool)
+register_pool("sync", lambda: engine.pool)
 
-def get_db_session(): db = SessionLocal(); yield db; db.close()
+async def get_db_session(request: Request):
+    # Соединение из пула берется при первом запросе к БД; ошибка в обработчике откатывает транзакцию
+    db = AsyncSessionLocal()
+    try: yield db
+    except Exception: await db.rollback(); raise
+    finally: await db.close(); observe_db_session(request.scope, session_db_seconds(db))
 def get_bot_instance() -> Bot:
     if _bot_instance is None: raise HTTPException(500, "Bot not ready.")
     return _bot_instance
@@ -119,142 +161,182 @@ def get_application_instance() -> Application:
     if _application_instance is None: raise HTTPException(500, "Bot app not initialized.")
     return _application_instance
 
-# ... (ОСТАЛЬНАЯ ЧАСТЬ ФАЙЛА main.py ОСТАЕТСЯ БЕЗ ИЗМЕНЕНИЙ) ...
-# (весь код от assemble_menu_items до конца файла остается прежним)
-
-def assemble_menu_items(venue_menu_items: List[VenueMenuItem], db: Session, cafe_id: str) -> List[dict]:
-    products_dict = {}
-    for item in venue_menu_items:
-        if not item.variant or not item.variant.product: continue
-        product = item.variant.product
-        if product.id not in products_dict: products_dict[product.id] = {"id": product.id, "name": product.name, "description": product.description, "image": product.image, "category_id": product.category_id, "sub_category": product.sub_category, "variants": [], "addons": []}
-        products_dict[product.id]["variants"].append({"id": item.variant.id, "name": item.variant.name, "cost": str(item.price), "weight": item.variant.weight})
-    if not products_dict: return []
-    product_ids = list(products_dict.keys())
-    addon_groups = db.query(GlobalAddonGroup).join(GlobalAddonGroup.products).filter(GlobalProduct.id.in_(product_ids)).options(selectinload(GlobalAddonGroup.items)).all()
-    venue_addons = db.query(VenueAddonItem).filter(VenueAddonItem.venue_id == cafe_id).all()
-    venue_addons_map = {va.addon_id: va for va in venue_addons}
-    for product_id, product_data in products_dict.items():
-        product_addons = []
-        for group in addon_groups:
-            if any(p.id == product_id for p in group.products):
-                addon_group_for_response = {"id": group.id, "name": group.name, "items": []}
-                for addon_item in group.items:
-                    venue_addon = venue_addons_map.get(addon_item.id)
-                    if venue_addon and venue_addon.is_available: addon_group_for_response["items"].append({"id": addon_item.id, "name": addon_item.name, "cost": str(venue_addon.price)})
-                if addon_group_for_response["items"]: product_addons.append(addon_group_for_response)
-        product_data["addons"] = product_addons
-    return list(products_dict.values())
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+def require_internal_access(request: Request) -> None:
+    """
+    Служебные эндпоинты доступны только с заголовком X-Internal-Token (или Authorization: Bearer,
+    который умеет отправлять Prometheus); без INTERNAL_API_TOKEN они выключены.
+    """
+    token = request.headers.get("X-Internal-Token") or request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not INTERNAL_API_TOKEN or not hmac.compare_digest(token, INTERNAL_API_TOKEN):
+        raise HTTPException(404, "Not Found")
 
 @app.get("/")
 async def read_root(): return {"message": "Welcome to EZH Cafe API!"}
 
 @app.post(WEBHOOK_PATH)
 async def bot_webhook(request: Request, application_instance: Application = Depends(get_application_instance)):
-    try: await application_instance.process_update(Update.de_json(await request.json(), application_instance.bot))
-    except Exception as e: logger.error(f"Error in webhook: {e}", exc_info=True); raise HTTPException(500, "Error processing update.")
+    if WEBHOOK_SECRET_TOKEN and not hmac.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), WEBHOOK_SECRET_TOKEN):
+        raise HTTPException(403, "Invalid secret token.")
+    try: update = Update.de_json(await request.json(), application_instance.bot)
+    except Exception as e: logger.error(f"Invalid update in webhook: {e}"); raise HTTPException(400, "Invalid update.")
+    if WEBHOOK_MODE == 'queue':
+        # Отвечаем сразу, обработка идет в воркерах; при переполнении Telegram повторит доставку
+        try: update_ingestor.submit(update)
+        except UpdateQueueFull: logger.warning("Webhook queue is full, rejecting update."); raise HTTPException(503, "Update queue is full.")
+        return {"message": "OK"}
+    if update_ingestor.is_duplicate(update): return {"message": "OK"}
+    try: await process_update_checked(application_instance, update)
+    except Exception as e:
+        update_ingestor.forget(update); logger.error(f"Error in webhook: {e}", exc_info=True); raise HTTPException(500, "Error processing update.")
     return {"message": "OK"}
 
+@app.get("/internal/webhook/stats", dependencies=[Depends(require_internal_access)])
+async def get_webhook_stats(): return update_ingestor.stats()
+
+@app.get("/internal/dadata/stats", dependencies=[Depends(require_internal_access)])
+async def get_dadata_stats(): return dadata_client.stats()
+
+@app.get("/internal/http-cache/stats", dependencies=[Depends(require_internal_access)])
+async def get_http_cache_stats(): return rendered_cache.stats()
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_internal_access)])
+async def get_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/internal/db/pool/stats", dependencies=[Depends(require_internal_access)])
+async def get_db_pool_stats(): return {"async": pool_stats(async_engine.pool), "sync": pool_stats(engine.pool)}
+
+# Готовые JSON-тела каталога рендерятся этими адаптерами один раз на версию (см. http_cache)
+CATEGORIES_JSON, MENU_ITEMS_JSON, MENU_ITEM_JSON = TypeAdapter(List[CategorySchema]), TypeAdapter(List[MenuItemSchema]), TypeAdapter(MenuItemSchema)
+CAFES_JSON, LOGO_JSON, VENUE_MENU_JSON = TypeAdapter(List[CafeSchema]), TypeAdapter(str), TypeAdapter(VenueMenuSchema)
+
 @app.get("/settings/logo", response_model=str)
-def get_app_logo(db: Session = Depends(get_db_session)):
-    setting = db.query(AppSetting).filter_by(key='logo_path').first()
-    if not setting or not setting.value:
-        # Возвращаем путь по умолчанию, если настройка не найдена
-        return "/icons/logo-laurel.svg"
-    return setting.value
+async def get_app_logo(request: Request):
+    directory = await venue_directory.snapshot()
+    return await rendered_response(request, "logo", directory.logo_version, directory.logo_last_modified, lambda: render_json(LOGO_JSON, directory.logo_path))
 
 @app.get("/cafes", response_model=List[CafeSchema])
-def get_all_cafes(db: Session = Depends(get_db_session)): return db.query(Cafe).all()
+async def get_all_cafes(request: Request):
+    directory = await venue_directory.snapshot()
+    return await rendered_response(request, "cafes", directory.venues_version, directory.venues_last_modified, lambda: render_json(CAFES_JSON, list(directory.venues.values())))
 
 @app.get("/cafes/{cafe_id}/promotions", response_model=List[PromotionSchema])
-def get_promotions_by_cafe(cafe_id: str, db: Session = Depends(get_db_session)):
-    available_category_ids_query = (
-        db.query(Category.id)
-        .join(GlobalProduct)
-        .join(GlobalProductVariant)
-        .join(VenueMenuItem)
-        .filter(VenueMenuItem.venue_id == cafe_id, VenueMenuItem.is_available == True)
-        .distinct()
-    )
-    available_category_ids = {c.id for c in available_category_ids_query.all()}
-    if not available_category_ids: return []
-    try:
-        with open('data/promotions.json', 'r', encoding='utf-8') as f: all_promotions = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        logger.error("Не удалось загрузить или обработать файл promotions.json"); return []
-    valid_promotions = [p for p in all_promotions if p.get("linkedCategoryId") in available_category_ids]
-    return [{"id": p.get("id"), "title": p.get("title"), "subtitle": p.get("subtitle"), "image_url": p.get("imageUrl"), "linked_category_id": p.get("linkedCategoryId")} for p in valid_promotions]
+async def get_promotions_by_cafe(cafe_id: str):
+    return promotion_store.for_categories(category.id for category in (await menu_cache.get(cafe_id)).categories)
 
 @app.get("/cafes/{cafe_id}/categories", response_model=List[CategorySchema])
-def get_categories_by_cafe(cafe_id: str, db: Session = Depends(get_db_session)): return db.query(Category).join(GlobalProduct).join(GlobalProductVariant).join(VenueMenuItem).filter(VenueMenuItem.venue_id == cafe_id, VenueMenuItem.is_available == True).distinct().all()
+async def get_categories_by_cafe(cafe_id: str, request: Request):
+    menu = await menu_cache.get(cafe_id)
+    return await rendered_response(request, ("categories", cafe_id), menu.version, menu.last_modified, lambda: render_json(CATEGORIES_JSON, menu.categories))
 
 @app.get("/cafes/{cafe_id}/popular", response_model=List[MenuItemSchema])
-def get_popular_menu_by_cafe(cafe_id: str, db: Session = Depends(get_db_session)):
-    venue_menu_items = db.query(VenueMenuItem).join(GlobalProductVariant).join(GlobalProduct).filter(VenueMenuItem.venue_id == cafe_id, VenueMenuItem.is_available == True, GlobalProduct.is_popular == True).options(joinedload(VenueMenuItem.variant).joinedload(GlobalProductVariant.product)).all()
-    return assemble_menu_items(venue_menu_items, db, cafe_id)
+async def get_popular_menu_by_cafe(cafe_id: str, request: Request):
+    menu = await menu_cache.get(cafe_id)
+    # Закрепленные в админке позиции и рейтинг по заказам (см. popularity); версия учитывает оба
+    popular, version, last_modified = popularity_ranking.popular(menu)
+    return await rendered_response(request, ("popular", cafe_id), version, last_modified, lambda: render_json(MENU_ITEMS_JSON, popular))
+
+@app.get("/cafes/{cafe_id}/menu", response_model=VenueMenuSchema)
+async def get_venue_menu_by_cafe(cafe_id: str, request: Request, since: Optional[str] = None):
+    menu = await menu_cache.get(cafe_id)
+    # Неизвестная (устаревшая или чужая) версия - отдаем меню целиком
+    base = menu_cache.find_version(cafe_id, since) if since else None
+    popular, popular_version, last_modified = popularity_ranking.popular(menu)
+    def render() -> bytes:
+        document = {"version": menu.version, "categories": menu.categories, "popular_ids": [p.id for p in popular]}
+        if base is None: return render_json(VENUE_MENU_JSON, {**document, "products": menu.products})
+        changed, removed = diff_menus(base, menu)
+        return render_json(VENUE_MENU_JSON, {**document, "is_delta": True, "base_version": since, "products": changed, "removed_product_ids": removed, "product_ids": [p.id for p in menu.products]})
+    # version в теле - версия меню для ?since=; ETag меняется и при смене популярного
+    return await rendered_response(request, ("menu", cafe_id, base.version if base else None), popular_version, last_modified, render)
 
 @app.get("/cafes/{cafe_id}/menu/{category_id}", response_model=List[MenuItemSchema])
-def get_category_menu_by_cafe(cafe_id: str, category_id: str, db: Session = Depends(get_db_session)):
-    venue_menu_items = db.query(VenueMenuItem).join(GlobalProductVariant).join(GlobalProduct).filter(VenueMenuItem.venue_id == cafe_id, VenueMenuItem.is_available == True, GlobalProduct.category_id == category_id).options(joinedload(VenueMenuItem.variant).joinedload(GlobalProductVariant.product)).all()
-    return assemble_menu_items(venue_menu_items, db, cafe_id)
+async def get_category_menu_by_cafe(cafe_id: str, category_id: str, request: Request):
+    menu = await menu_cache.get(cafe_id)
+    # У категории своя версия: правка в другой категории не заставляет клиентов перекачивать эту
+    stamp = menu.category_stamps.get(category_id)
+    version, last_modified = (stamp.version, stamp.last_modified) if stamp else (menu.version, menu.last_modified)
+    return await rendered_response(request, ("category", cafe_id, category_id), version, last_modified, lambda: render_json(MENU_ITEMS_JSON, menu.products_by_category.get(category_id, ())))
 
 @app.get("/cafes/{cafe_id}/menu/details/{menu_item_id}", response_model=MenuItemSchema)
-def get_menu_item_details_by_cafe(cafe_id: str, menu_item_id: str, db: Session = Depends(get_db_session)):
-    venue_menu_items = db.query(VenueMenuItem).join(VenueMenuItem.variant).filter(VenueMenuItem.venue_id == cafe_id, VenueMenuItem.is_available == True, GlobalProductVariant.global_product_id == menu_item_id).options(joinedload(VenueMenuItem.variant).joinedload(GlobalProductVariant.product)).all()
-    if not venue_menu_items: raise HTTPException(404, f"Menu item '{menu_item_id}' not found.")
-    return assemble_menu_items(venue_menu_items, db, cafe_id)[0]
+async def get_menu_item_details_by_cafe(cafe_id: str, menu_item_id: str, request: Request):
+    menu = await menu_cache.get(cafe_id)
+    product = menu.products_by_id.get(menu_item_id)
+    if not product: raise HTTPException(404, f"Menu item '{menu_item_id}' not found.")
+    return await rendered_response(request, ("details", cafe_id, menu_item_id), menu.version, menu.last_modified, lambda: render_json(MENU_ITEM_JSON, product))
 
 @app.get("/cafes/{cafe_id}/settings", response_model=CafeSettingsSchema)
-def get_cafe_settings_by_id(cafe_id: str, db: Session = Depends(get_db_session)):
-    cafe = db.query(Cafe).filter(Cafe.id == cafe_id).first()
+async def get_cafe_settings_by_id(cafe_id: str):
+    # Из справочника заведений в памяти: эндпоинт не занимает соединение из пула
+    cafe = (await venue_directory.get()).get(cafe_id)
     if not cafe: raise HTTPException(404, f"Cafe '{cafe_id}' not found.")
     return CafeSettingsSchema(min_order_amount=cafe.min_order_amount)
 
 @app.post("/suggest-address", response_model=DadataSuggestionResponse)
 async def get_address_suggestions(request_data: AddressSuggestionRequest):
     if not DADATA_API_KEY: raise HTTPException(status_code=500, detail="Dadata API key is not configured.")
-    url, headers = "https://suggestions.dadata.ru/suggestions/api/4_1/rs/suggest/address", {"Content-Type": "application/json", "Accept": "application/json", "Authorization": f"Token {DADATA_API_KEY}"}
-    payload = {"query": request_data.query, "locations": [{"city": request_data.city}], "from_bound": {"value": "street"}, "to_bound": {"value": "house"}}
-    async with httpx.AsyncClient() as client:
-        try: response = await client.post(url, json=payload, headers=headers); response.raise_for_status(); return response.json()
-        except httpx.HTTPStatusError as e: logger.error(f"Dadata API request failed: {e.response.status_code} - {e.response.text}"); raise HTTPException(status_code=502, detail="Address suggestion service is unavailable.")
-        except Exception as e: logger.error(f"An unexpected error occurred while calling Dadata API: {e}"); raise HTTPException(status_code=500, detail="Internal server error.")
+    try: return await dadata_client.suggest_address(request_data.query, request_data.city)
+    except httpx.HTTPStatusError as e: logger.error(f"Dadata API request failed: {e.response.status_code} - {e.response.text}"); raise HTTPException(status_code=502, detail="Address suggestion service is unavailable.")
+    except Exception as e: logger.error(f"An unexpected error occurred while calling Dadata API: {e}"); raise HTTPException(status_code=500, detail="Internal server error.")
+
+@app.post("/cafes/{cafe_id}/cart/quote", response_model=CartQuoteSchema)
+async def quote_cart_by_cafe(cafe_id: str, quote_request: CartQuoteRequest):
+    quote = quote_cart(await menu_cache.get(cafe_id), quote_request.cart_items)
+    return CartQuoteSchema(lines=quote.lines, total_amount=quote.total_amount, is_valid=quote.is_valid, errors=quote.errors)
+
+def order_idempotency_key(request: Request, cafe_id: str, order_data: OrderRequest, parsed_auth: dict) -> Optional[tuple]:
+    """
+    (ключ, отпечаток) запроса заказа или None. Ключ - заголовок Idempotency-Key от клиента, иначе
+    query_id из initData вместе с отпечатком: в одной сессии Mini App можно оформить и другой заказ.
+    """
+    fingerprint = request_fingerprint(cafe_id, order_data.model_dump(mode="json", exclude={"auth"}))
+    user_id = parsed_auth.get('user', ['{}'])[0]
+    try: user_id = json.loads(user_id).get('id')
+    except Exception: user_id = None
+    if header := request.headers.get("Idempotency-Key"):
+        if len(header) > MAX_KEY_LENGTH: raise HTTPException(400, "Idempotency key is too long.")
+        return f"order:{user_id}:{header}", fingerprint
+    if query_id := parsed_auth.get('query_id', [None])[0]:
+        return f"order:{user_id}:q:{query_id}:{fingerprint}", fingerprint
+    return None
 
 @app.post("/cafes/{cafe_id}/order")
-async def create_order(cafe_id: str, order_data: OrderRequest, db: Session = Depends(get_db_session), bot_instance: Bot = Depends(get_bot_instance)):
+async def create_order(cafe_id: str, order_data: OrderRequest, request: Request, db: AsyncSession = Depends(get_db_session), bot_instance: Bot = Depends(get_bot_instance)):
     if not auth.validate_auth_data(BOT_TOKEN, order_data.auth): raise HTTPException(401, "Invalid auth data.")
-    labeled_prices, total_amount = [], 0
-    for item in order_data.cart_items:
-        venue_item = db.query(VenueMenuItem).options(joinedload(VenueMenuItem.variant).joinedload(GlobalProductVariant.product)).filter(VenueMenuItem.venue_id == cafe_id, VenueMenuItem.variant_id == item.variant.id, VenueMenuItem.is_available == True).first()
-        if not venue_item: raise HTTPException(400, f"Item variant '{item.variant.id}' unavailable.")
-        single_item_price = venue_item.price
-        if item.selected_addons:
-            for addon_data in item.selected_addons:
-                venue_addon = db.query(VenueAddonItem).filter(VenueAddonItem.venue_id == cafe_id, VenueAddonItem.addon_id == addon_data.id, VenueAddonItem.is_available == True).first()
-                if not venue_addon: raise HTTPException(400, f"Addon '{addon_data.id}' unavailable.")
-                single_item_price += venue_addon.price
-        item_total_price = single_item_price * item.quantity; total_amount += item_total_price
-        base_label = f"{venue_item.variant.product.name} ({item.variant.name})"
-        if item.selected_addons: base_label += f" + {', '.join([a.name for a in item.selected_addons])}"
-        final_label = _truncate_label(base_label, f" x{item.quantity}")
-        if item_total_price > 0: labeled_prices.append(LabeledPrice(label=final_label, amount=item_total_price))
+    parsed_auth = parse_qs(order_data.auth)
+    # Повтор того же запроса (двойное нажатие, ретрай сети) получает ответ первой попытки (см. idempotency)
+    key = order_idempotency_key(request, cafe_id, order_data, parsed_auth)
+    if key is None: return await place_order(cafe_id, order_data, parsed_auth, db, bot_instance)
+    return await idempotency_store.run(*key, lambda record: place_order(cafe_id, order_data, parsed_auth, db, bot_instance, record))
+
+async def place_order(cafe_id: str, order_data: OrderRequest, parsed_auth: dict, db: AsyncSession, bot_instance: Bot, record: Optional[Record] = None) -> dict:
+    quote = quote_cart(await menu_cache.get(cafe_id), order_data.cart_items)
+    if not quote.is_valid: raise HTTPException(400, quote.errors[0])
+    labeled_prices, total_amount = [LabeledPrice(label=label, amount=amount) for label, amount in quote.labeled_lines()], quote.total_amount
     if order_data.payment_method == 'online' and not labeled_prices: raise HTTPException(status_code=400, detail="Cannot process online payment for a free order.")
     user_info_dict, user_id = {}, None
-    try: parsed_auth = parse_qs(order_data.auth); user_data = json.loads(parsed_auth['user'][0]); user_info_dict, user_id = user_data, user_data.get('id')
+    try: user_data = json.loads(parsed_auth['user'][0]); user_info_dict, user_id = user_data, user_data.get('id')
     except Exception as e: logger.error(f"Could not parse user info: {e}")
     order_type = "delivery" if order_data.address else "pickup"
     if order_data.address: user_info_dict['shipping_address'] = order_data.address.model_dump()
     new_order = Order(cafe_id=cafe_id, user_info=user_info_dict, cart_items=[item.model_dump() for item in order_data.cart_items], total_amount=total_amount, currency="RUB", order_type=order_type, payment_method=order_data.payment_method, status='pending' if order_data.payment_method != 'online' else 'awaiting_payment')
-    db.add(new_order); db.flush()
+    db.add(new_order); await db.flush()
     try:
         if order_data.payment_method == 'online':
             invoice_url = await create_invoice_link(prices=labeled_prices, payload=str(new_order.id), bot_instance=bot_instance)
             if not invoice_url: raise HTTPException(500, "Could not create invoice.")
-            db.commit(); return {'invoiceUrl': invoice_url}
+            response = {'invoiceUrl': invoice_url}
+            if record: await record(db, response)
+            await db.commit(); ORDERS.labels(cafe_id, new_order.payment_method, new_order.status).inc(); return response
         else:
-            await send_new_order_notifications(order=new_order, bot_instance=bot_instance, user_id_to_notify=user_id, staff_group_to_notify=STAFF_GROUP_ID)
-            db.commit(); return {"message": "Order accepted"}
+            # Уведомления уходят фоновыми воркерами после коммита, ответ не ждет Telegram
+            await enqueue_new_order_notifications(db, new_order, user_id_to_notify=user_id, staff_group_to_notify=STAFF_GROUP_ID)
+            response = {"message": "Order accepted"}
+            if record: await record(db, response)
+            await db.commit(); outbox_dispatcher.wake(); ORDERS.labels(cafe_id, new_order.payment_method, new_order.status).inc(); return response
     except Exception as e:
-        db.rollback(); logger.error(f"Failed to process order {new_order.id}: {e}", exc_info=True)
+        await db.rollback(); logger.error(f"Failed to process order {new_order.id}: {e}", exc_info=True)
         if isinstance(e, HTTPException): raise e
-        raise HTTPException(status_code=500, detail="An internal error occurred while processing the order.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="An internal error occurred while processing the order.")
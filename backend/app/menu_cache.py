@@ -0,0 +1,520 @@
+# backend/app/menu_cache.py
+"""
+Процессный кэш меню заведений.
+
+Для каждого заведения один раз собирается неизменяемый снимок каталога
+(категории -> продукты -> варианты/добавки) с индексами популярных позиций
+и продуктов по id. Снимки пересобираются лениво после изменения каталожных
+строк, которые в них входят (см. _change_keys), поэтому "горячие" эндпоинты
+меню не ходят в БД, а правка цены в одном заведении не сбрасывает остальные.
+Здесь же живет справочник заведений (VenueDirectory) с той же схемой инвалидации.
+"""
+import asyncio
+import dataclasses
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+
+from . import cache_bus
+from .database import AsyncSessionLocal
+from .http_cache import content_version, utcnow
+from .models import (
+    AppSetting, Cafe, Category, GlobalProduct, GlobalProductVariant, VenueMenuItem,
+    GlobalAddonGroup, GlobalAddonItem, VenueAddonItem, product_addon_groups_association
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних версий меню заведения хранить для ответов ?since= (дельты)
+MENU_HISTORY_DEPTH = int(os.getenv("MENU_HISTORY_DEPTH", "10"))
+
+
+# --- Неизменяемые элементы снимка. Имена полей совпадают со схемами из schemas.py ---
+
+@dataclass(frozen=True, slots=True)
+class MenuVariant:
+    id: str
+    name: str
+    cost: str
+    weight: Optional[str]
+    price: int
+
+
+@dataclass(frozen=True, slots=True)
+class MenuAddonItem:
+    id: str
+    name: str
+    cost: str
+    price: int
+
+
+@dataclass(frozen=True, slots=True)
+class MenuAddonGroup:
+    id: str
+    name: str
+    items: Tuple[MenuAddonItem, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class MenuProduct:
+    id: str
+    name: Optional[str]
+    description: Optional[str]
+    image: Optional[str]
+    category_id: str
+    sub_category: Optional[str]
+    is_popular: bool
+    variants: Tuple[MenuVariant, ...]
+    addons: Tuple[MenuAddonGroup, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class MenuCategory:
+    id: str
+    name: str
+    icon: Optional[str]
+    background_color: Optional[str]
+
+
+@dataclass(frozen=True, slots=True)
+class CategoryStamp:
+    """Версия одной категории меню заведения: ответ по категории не меняет ETag из-за правок в соседних."""
+    version: str
+    last_modified: datetime
+
+
+@dataclass(frozen=True, slots=True)
+class VenueMenu:
+    """Снимок меню одного заведения. Содержит только доступные позиции."""
+    venue_id: str
+    categories: Tuple[MenuCategory, ...]
+    products: Tuple[MenuProduct, ...]
+    products_by_category: Mapping[str, Tuple[MenuProduct, ...]]
+    products_by_id: Mapping[str, MenuProduct]
+    variants_by_id: Mapping[str, Tuple[MenuProduct, MenuVariant]]
+    popular: Tuple[MenuProduct, ...]
+    # Дайджест содержимого (категории + продукты): меняется только если меню заведения реально изменилось
+    version: str
+    last_modified: datetime
+    category_stamps: Mapping[str, CategoryStamp]
+
+
+async def assemble_menu_items(venue_menu_items: List[VenueMenuItem], db: AsyncSession, cafe_id: str) -> List[MenuProduct]:
+    """
+    Группирует цены заведения по продуктам и подставляет добавки.
+
+    Добавки резолвятся через индекс продукт -> группы, прочитанный напрямую
+    из product_addon_groups, и карту цен добавок заведения. Независимо от
+    размера каталога это ровно два SQL-запроса, без ленивых загрузок.
+    """
+    products_dict = {}
+    for item in venue_menu_items:
+        if not item.variant or not item.variant.product: continue
+        product = item.variant.product
+        if product.id not in products_dict: products_dict[product.id] = {"product": product, "variants": []}
+        products_dict[product.id]["variants"].append(MenuVariant(id=item.variant.id, name=item.variant.name, cost=str(item.price), weight=item.variant.weight, price=item.price))
+    if not products_dict: return []
+
+    # 1. Индекс продукт -> [id групп] из ассоциативной таблицы
+    groups_by_product: Dict[str, List[str]] = {}
+    for product_id, group_id in await db.execute(
+        select(product_addon_groups_association.c.product_id, product_addon_groups_association.c.addon_group_id)
+        .where(product_addon_groups_association.c.product_id.in_(list(products_dict.keys())))
+        .order_by(product_addon_groups_association.c.product_id, product_addon_groups_association.c.addon_group_id)
+    ):
+        groups_by_product.setdefault(product_id, []).append(group_id)
+
+    # 2. Доступные в заведении добавки этих групп вместе с ценой и названием группы
+    addon_groups: Dict[str, MenuAddonGroup] = {}
+    group_ids = {group_id for ids in groups_by_product.values() for group_id in ids}
+    if group_ids:
+        priced_items: Dict[str, List[MenuAddonItem]] = {}
+        group_names: Dict[str, str] = {}
+        rows = await db.execute(
+            select(GlobalAddonItem.group_id, GlobalAddonGroup.name, GlobalAddonItem.id, GlobalAddonItem.name, VenueAddonItem.price)
+            .join(GlobalAddonGroup, GlobalAddonGroup.id == GlobalAddonItem.group_id)
+            .join(VenueAddonItem, VenueAddonItem.addon_id == GlobalAddonItem.id)
+            .where(GlobalAddonItem.group_id.in_(group_ids), VenueAddonItem.venue_id == cafe_id, VenueAddonItem.is_available == True)
+            .order_by(VenueAddonItem.id)
+        )
+        for group_id, group_name, addon_id, addon_name, price in rows:
+            group_names[group_id] = group_name
+            priced_items.setdefault(group_id, []).append(MenuAddonItem(id=addon_id, name=addon_name, cost=str(price), price=price))
+        # Группы без единой доступной добавки в ответ не попадают
+        addon_groups = {
+            group_id: MenuAddonGroup(id=group_id, name=group_names[group_id], items=tuple(items))
+            for group_id, items in priced_items.items()
+        }
+
+    result = []
+    for product_id, product_data in products_dict.items():
+        product = product_data["product"]
+        product_addons = tuple(addon_groups[g] for g in groups_by_product.get(product_id, ()) if g in addon_groups)
+        result.append(MenuProduct(
+            id=product.id, name=product.name, description=product.description, image=product.image,
+            category_id=product.category_id, sub_category=product.sub_category, is_popular=bool(product.is_popular),
+            variants=tuple(product_data["variants"]), addons=product_addons
+        ))
+    return result
+
+
+async def build_venue_menu(db: AsyncSession, venue_id: str) -> VenueMenu:
+    """Собирает снимок меню заведения из БД."""
+    venue_menu_items = (await db.execute(
+        select(VenueMenuItem)
+        .where(VenueMenuItem.venue_id == venue_id, VenueMenuItem.is_available == True)
+        .options(joinedload(VenueMenuItem.variant).joinedload(GlobalProductVariant.product))
+        # Стабильный порядок нужен, чтобы версия снимка не менялась при пересборке без изменений
+        .order_by(VenueMenuItem.id)
+    )).scalars().all()
+    products = await assemble_menu_items(venue_menu_items, db, venue_id)
+
+    by_category: Dict[str, List[MenuProduct]] = {}
+    for product in products:
+        by_category.setdefault(product.category_id, []).append(product)
+
+    categories = []
+    if by_category:
+        loaded = {
+            c.id: MenuCategory(id=c.id, name=c.name, icon=c.icon, background_color=c.background_color)
+            for c in (await db.execute(select(Category).where(Category.id.in_(list(by_category.keys()))))).scalars()
+        }
+        # Категории идут в порядке первого продукта в них
+        categories = [loaded[category_id] for category_id in by_category if category_id in loaded]
+
+    last_modified = utcnow()
+    return VenueMenu(
+        venue_id=venue_id,
+        categories=tuple(categories),
+        products=tuple(products),
+        products_by_category=MappingProxyType({k: tuple(v) for k, v in by_category.items()}),
+        products_by_id=MappingProxyType({p.id: p for p in products}),
+        variants_by_id=MappingProxyType({v.id: (p, v) for p in products for v in p.variants}),
+        popular=tuple(p for p in products if p.is_popular),
+        version=content_version(venue_id, categories, products),
+        last_modified=last_modified,
+        category_stamps=MappingProxyType({
+            category_id: CategoryStamp(content_version(venue_id, category_id, tuple(items)), last_modified)
+            for category_id, items in by_category.items()
+        }),
+    )
+
+
+def diff_menus(base: VenueMenu, current: VenueMenu) -> Tuple[List[MenuProduct], List[str]]:
+    """(добавленные или измененные продукты, id удаленных продуктов) между двумя снимками."""
+    changed = [p for p in current.products if base.products_by_id.get(p.id) != p]
+    removed = [product_id for product_id in base.products_by_id if product_id not in current.products_by_id]
+    return changed, removed
+
+
+class MenuCache:
+    """
+    Хранилище снимков по заведениям.
+
+    Чтение - один поиск в словаре без блокировок. Сборка идет под asyncio-блокировкой
+    конкретного заведения (параллельные запросы ждут одну сборку), а готовый снимок
+    подменяется целиком, поэтому читатели никогда не видят частично собранное меню.
+    Если во время сборки каталог изменился, результат отдается вызвавшему, но в кэш
+    не попадает. Инвалидация может прийти из потока админки, поэтому она под threading-блокировкой.
+    """
+
+    def __init__(self):
+        self._menus: Dict[str, VenueMenu] = {}
+        self._build_locks: Dict[str, asyncio.Lock] = {}
+        # Последние версии снимков заведения переживают invalidate(): по ним считаются дельты,
+        # а пересборка без изменений не сдвигает Last-Modified
+        self._history: Dict[str, "OrderedDict[str, VenueMenu]"] = {}
+        self._guard = threading.Lock()
+        self._generation = 0
+        self.hits = self.misses = 0
+
+    async def get(self, venue_id: str) -> VenueMenu:
+        menu = self._menus.get(venue_id)
+        if menu is not None:
+            self.hits += 1
+            return menu
+        self.misses += 1
+        lock = self._build_locks.setdefault(venue_id, asyncio.Lock())
+        async with lock:
+            menu = self._menus.get(venue_id)
+            if menu is not None:
+                return menu
+            generation = self._generation
+            async with AsyncSessionLocal() as db:
+                # Для несуществующих заведений снимок не кэшируем, чтобы кэш не рос от мусорных id
+                if not await db.scalar(select(Cafe.id).where(Cafe.id == venue_id)):
+                    self._build_locks.pop(venue_id, None)
+                    return await build_venue_menu(db, venue_id)
+                menu = await build_venue_menu(db, venue_id)
+            menu = self._remember(menu)
+            with self._guard:
+                if generation == self._generation:
+                    self._menus[venue_id] = menu
+            logger.info(f"Menu snapshot for venue '{venue_id}' built: {len(menu.products)} products, version {menu.version}.")
+            return menu
+
+    def _remember(self, menu: VenueMenu) -> VenueMenu:
+        history = self._history.setdefault(menu.venue_id, OrderedDict())
+        # Last-Modified сохраняется, только если содержимое совпало с последней версией (возврат A->B->A - это изменение)
+        latest = history[next(reversed(history))] if history else None
+        if latest is not None and latest.version == menu.version:
+            menu = dataclasses.replace(menu, last_modified=latest.last_modified, category_stamps=latest.category_stamps)
+        elif latest is not None:
+            # Меню изменилось, но нетронутые категории сохраняют свой Last-Modified
+            stamps = {
+                category_id: latest.category_stamps[category_id]
+                if latest.category_stamps.get(category_id, stamp).version == stamp.version else stamp
+                for category_id, stamp in menu.category_stamps.items()
+            }
+            menu = dataclasses.replace(menu, category_stamps=MappingProxyType(stamps))
+        history[menu.version] = menu
+        history.move_to_end(menu.version)
+        while len(history) > MENU_HISTORY_DEPTH:
+            history.popitem(last=False)
+        return menu
+
+    def find_version(self, venue_id: str, version: str) -> Optional[VenueMenu]:
+        """Снимок заведения указанной версии, если он еще хранится в истории."""
+        history = self._history.get(venue_id)
+        return history.get(version) if history else None
+
+    def stats(self) -> dict:
+        return {"venues": len(self._menus), "generation": self._generation, "hits": self.hits, "misses": self.misses}
+
+    def invalidate(self, scopes: Optional[Set[str]] = None) -> None:
+        """
+        Сбрасывает снимки, затронутые областями scopes ("venue/<id>", "product/<id>", ...),
+        или все снимки при scopes=None. Следующие запросы соберут их заново.
+        """
+        with self._guard:
+            # Сборки, начатые до инвалидации, в кэш не попадут (какое заведение они затронут, еще неизвестно)
+            self._generation += 1
+            if scopes is None:
+                self._menus = {}
+            else:
+                # Копия при записи: читатели берут снимки из словаря без блокировки
+                self._menus = {venue_id: menu for venue_id, menu in self._menus.items() if not _menu_affected(menu, scopes)}
+
+
+def _menu_affected(menu: VenueMenu, scopes: Set[str]) -> bool:
+    """Входит ли в снимок хотя бы одна сущность из scopes. Сущность, которой нет в снимке, на него не влияет."""
+    addon_ids = addon_group_ids = None
+    for scope in scopes:
+        kind, _, entity_id = scope.partition("/")
+        if kind == "venue":
+            found = entity_id == menu.venue_id
+        elif kind == "category":
+            found = entity_id in menu.products_by_category
+        elif kind == "product":
+            found = entity_id in menu.products_by_id
+        elif kind == "variant":
+            found = entity_id in menu.variants_by_id
+        elif kind in ("addon_group", "addon"):
+            if addon_ids is None:
+                groups = [group for product in menu.products for group in product.addons]
+                addon_group_ids = {group.id for group in groups}
+                addon_ids = {item.id for group in groups for item in group.items}
+            found = entity_id in (addon_ids if kind == "addon" else addon_group_ids)
+        else:
+            found = True  # Неизвестная область - сбрасываем на всякий случай
+        if found:
+            return True
+    return False
+
+
+menu_cache = MenuCache()
+
+
+@dataclass(frozen=True, slots=True)
+class VenueInfo:
+    id: str
+    name: str
+    cover_image: Optional[str]
+    kitchen_categories: Optional[str]
+    rating: Optional[str]
+    cooking_time: Optional[str]
+    status: Optional[str]
+    opening_hours: Optional[str]
+    min_order_amount: Optional[int]
+
+
+# Логотип по умолчанию, если в app_settings нет logo_path
+DEFAULT_LOGO_PATH = "/icons/logo-laurel.svg"
+
+
+@dataclass(frozen=True, slots=True)
+class DirectorySnapshot:
+    venues: Mapping[str, VenueInfo]
+    venues_version: str
+    venues_last_modified: datetime
+    logo_path: str
+    logo_version: str
+    logo_last_modified: datetime
+
+
+class VenueDirectory:
+    """
+    Справочник заведений (таблица cafes целиком, она маленькая) и логотип приложения.
+
+    Загружается один раз и перечитывается только после изменения Cafe или AppSetting,
+    поэтому уведомления и другие частые пути получают название заведения без запроса к БД.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[DirectorySnapshot] = None
+        self._stamps: Dict[str, Tuple[str, datetime]] = {}
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._guard = threading.Lock()
+        self._generation = 0
+
+    async def get(self) -> Mapping[str, VenueInfo]:
+        return (await self.snapshot()).venues
+
+    async def snapshot(self) -> DirectorySnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if self._snapshot is not None:
+                return self._snapshot
+            generation = self._generation
+            async with AsyncSessionLocal() as db:
+                cafes = (await db.execute(select(Cafe))).scalars().all()
+                logo_path = await db.scalar(select(AppSetting.value).where(AppSetting.key == 'logo_path')) or DEFAULT_LOGO_PATH
+            venues = MappingProxyType({
+                c.id: VenueInfo(
+                    id=c.id, name=c.name, cover_image=c.cover_image, kitchen_categories=c.kitchen_categories,
+                    rating=c.rating, cooking_time=c.cooking_time, status=c.status,
+                    opening_hours=c.opening_hours, min_order_amount=c.min_order_amount
+                ) for c in cafes
+            })
+            venues_version, venues_last_modified = self._stamp("venues", content_version(tuple(venues.values())))
+            logo_version, logo_last_modified = self._stamp("logo", content_version(logo_path))
+            snapshot = DirectorySnapshot(
+                venues=venues, venues_version=venues_version, venues_last_modified=venues_last_modified,
+                logo_path=logo_path, logo_version=logo_version, logo_last_modified=logo_last_modified
+            )
+            with self._guard:
+                if generation == self._generation:
+                    self._snapshot = snapshot
+            return snapshot
+
+    def _stamp(self, key: str, version: str) -> Tuple[str, datetime]:
+        """Время появления версии; повторная загрузка того же содержимого его не сдвигает."""
+        stamp = self._stamps.get(key)
+        if stamp is None or stamp[0] != version:
+            stamp = self._stamps[key] = (version, utcnow())
+        return stamp
+
+    def invalidate(self, scopes: Optional[Set[str]] = None) -> None:
+        # Справочник маленький и читается целиком - области не различаем
+        with self._guard:
+            self._generation += 1
+            self._snapshot = None
+
+
+venue_directory = VenueDirectory()
+
+
+# --- Отслеживание изменений каталога через события сессии SQLAlchemy ---
+# Ключи инвалидации (см. cache_bus) копятся в session.info при flush и применяются только после успешного commit.
+# Ловятся все пути записи: админка (sqladmin коммитит через ORM-сессию), бот и API.
+
+_CHANGES_KEY = "catalog_cache_changes"
+_MENU, _VENUES = "menu", "venues"
+
+cache_bus.register(_MENU, menu_cache.invalidate)
+cache_bus.register(_VENUES, venue_directory.invalidate)
+
+# Модель -> вид области меню; область строится по id сущности
+_MENU_SCOPES = {
+    Category: "category", GlobalProduct: "product", GlobalProductVariant: "variant",
+    GlobalAddonGroup: "addon_group", GlobalAddonItem: "addon",
+}
+
+
+def _values(obj, attribute: str) -> set:
+    """Текущее и прежнее (до изменения в этой транзакции) значения атрибута."""
+    history = inspect(obj).attrs[attribute].history
+    return {value for value in (*history.added, *history.unchanged, *history.deleted) if value is not None}
+
+
+def _change_keys(obj) -> set:
+    """Ключи инвалидации для измененного объекта: какие заведения и категории он затрагивает."""
+    if isinstance(obj, (Cafe, AppSetting)):
+        return {_VENUES}
+    if isinstance(obj, (VenueMenuItem, VenueAddonItem)):
+        kind, ids = "venue", _values(obj, "venue_id")
+    elif isinstance(obj, GlobalAddonItem) and inspect(obj).attrs.group_id.history.deleted:
+        # Добавка переехала в другую группу: где она появится, по снимкам не понять
+        return {_MENU}
+    else:
+        kind = next((kind for model, kind in _MENU_SCOPES.items() if isinstance(obj, model)), None)
+        if kind is None:
+            return set()
+        ids = _values(obj, "id")
+    if not ids:
+        # Атрибут не был загружен (объект истек) - область не определить
+        return {_MENU}
+    keys = {f"{_MENU}/{kind}/{entity_id}" for entity_id in ids}
+    if isinstance(obj, GlobalAddonGroup):
+        # Привязка группы к продуктам со стороны группы меняет меню этих продуктов
+        history = inspect(obj).attrs.products.history
+        keys |= {f"{_MENU}/product/{product.id}" for product in (*history.added, *history.deleted)}
+    return keys
+
+
+def _bulk_change_keys(model_class) -> set:
+    # Какие строки задел массовый UPDATE/DELETE, неизвестно - сбрасываем кэш целиком
+    if issubclass(model_class, (Cafe, AppSetting)): return {_VENUES}
+    if issubclass(model_class, (VenueMenuItem, VenueAddonItem, *_MENU_SCOPES)): return {_MENU}
+    return set()
+
+
+def _record_changes(session, keys: set) -> None:
+    changes = session.info.setdefault(_CHANGES_KEY, set())
+    new = keys - changes
+    if new:
+        changes |= new
+        # Другие воркеры узнают об изменении после коммита этой же транзакции
+        cache_bus.publish(session.connection(), new)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_catalog_changes(session, flush_context):
+    keys = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        keys |= _change_keys(obj)
+    _record_changes(session, keys)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_catalog_changes(orm_execute_state):
+    # Массовые query(...).update()/delete() не проходят через flush
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is not None:
+        _record_changes(orm_execute_state.session, _bulk_change_keys(orm_execute_state.bind_mapper.class_))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if changes:
+        cache_bus.dispatch(changes)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _reset_after_rollback(session, previous_transaction):
+    # Откат SAVEPOINT не отменяет изменений внешней транзакции
+    if previous_transaction.parent is None:
+        session.info.pop(_CHANGES_KEY, None)
@@ -0,0 +1,165 @@
+# backend/app/metrics.py
+"""
+Метрики сервиса в формате Prometheus (эндпоинт /metrics).
+
+На пути запроса работают только счетчики и гистограммы prometheus_client
+(инкремент под локом, без аллокаций). Состояние кэшей, пулов соединений и
+очередей не дублируется в метриках: коллектор читает их stats() в момент
+опроса Prometheus, поэтому горячие пути за это ничего не платят.
+"""
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+from prometheus_client.registry import Collector
+
+from .database import POOL_WAIT_BUCKETS_MS
+
+# --- HTTP ---
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP-запросы по маршруту и коду ответа", ["method", "route", "status"])
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ["method", "route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP-запросы в обработке")
+
+# --- Сессии БД эндпоинтов ---
+DB_SESSIONS = Counter("db_sessions_total", "Сессии БД эндпоинтов: понадобилось ли соединение из пула", ["route", "connected"])
+DB_SESSION_TIME = Histogram(
+    "db_session_connection_seconds", "Сколько эндпоинт держал соединение из пула", ["route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+# --- Внешние вызовы (Telegram, Dadata) ---
+EXTERNAL_CALL_LATENCY = Histogram(
+    "external_call_duration_seconds", "Время внешних вызовов", ["operation", "outcome"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# --- Бизнес-счетчики ---
+ORDERS = Counter("orders_total", "Заказы по заведению, способу оплаты и статусу", ["venue", "payment_method", "status"])
+OUTBOX_DELIVERIES = Counter("outbox_deliveries_total", "Попытки доставки уведомлений из outbox", ["result"])
+
+
+@contextmanager
+def timed(operation: str) -> Iterator[None]:
+    """Замеряет вызов; outcome="error", если блок завершился исключением."""
+    started, outcome = time.perf_counter(), "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_CALL_LATENCY.labels(operation, outcome).observe(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка, коды ответов и число запросов в обработке."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start": status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = route_label(scope)
+            HTTP_LATENCY.labels(scope["method"], route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status)).inc()
+
+
+def observe_db_session(scope, db_seconds: Optional[float]) -> None:
+    """db_seconds - время из session_db_seconds(); None - сессия так и не взяла соединение."""
+    route = route_label(scope)
+    DB_SESSIONS.labels(route, "false" if db_seconds is None else "true").inc()
+    if db_seconds is not None: DB_SESSION_TIME.labels(route).observe(db_seconds)
+
+
+def route_label(scope) -> str:
+    # Шаблон пути ("/cafes/{cafe_id}/menu"), а не сам путь: иначе число рядов метрики не ограничено.
+    # Роутер Starlette записывает найденный маршрут в scope; для смонтированных приложений
+    # (админка, /media) префикс монтирования лежит в root_path.
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        return "unmatched"
+    return f"{scope.get('root_path', '')}{path}"
+
+
+# --- Состояние кэшей, пулов и очередей, читаемое при опросе ---
+
+_caches: Dict[str, Callable[[], Tuple[int, int, int]]] = {}
+_gauges: Dict[str, Callable[[], Dict[str, float]]] = {}
+_pools: Dict[str, Callable[[], object]] = {}
+
+
+def register_cache(name: str, read: Callable[[], Tuple[int, int, int]]) -> None:
+    """read() -> (попадания, промахи, записей в кэше)."""
+    _caches[name] = read
+
+
+def register_gauges(prefix: str, read: Callable[[], Dict[str, float]]) -> None:
+    """Числовые значения read() экспортируются как <prefix>_<ключ>."""
+    _gauges[prefix] = read
+
+
+def register_pool(name: str, get_pool: Callable[[], object]) -> None:
+    """Пул с PoolStats из database.py; берется функцией, так как engine.dispose() пересоздает пул."""
+    _pools[name] = get_pool
+
+
+class _StatsCollector(Collector):
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Попадания в кэш", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Промахи кэша", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Доля попаданий в кэш с момента запуска", labels=["cache"])
+        entries = GaugeMetricFamily("cache_entries", "Записей в кэше", labels=["cache"])
+        for name, read in _caches.items():
+            cache_hits, cache_misses, size = read()
+            hits.add_metric([name], cache_hits)
+            misses.add_metric([name], cache_misses)
+            ratio.add_metric([name], cache_hits / (cache_hits + cache_misses) if cache_hits + cache_misses else 0.0)
+            entries.add_metric([name], size)
+        yield from (hits, misses, ratio, entries)
+
+        for prefix, read in _gauges.items():
+            for key, value in read().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield GaugeMetricFamily(f"{prefix}_{key}", f"{prefix}: {key}", value=value)
+
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Соединений выдано из пула", labels=["engine"])
+        overflow = CounterMetricFamily("db_pool_overflow_events", "Соединений, открытых сверх pool_size", labels=["engine"])
+        timeouts = CounterMetricFamily("db_pool_timeouts", "Таймауты ожидания соединения", labels=["engine"])
+        wait = HistogramMetricFamily("db_pool_wait_seconds", "Ожидание соединения из пула", labels=["engine"])
+        for name, get_pool in _pools.items():
+            pool = get_pool()
+            stats = pool.stats
+            checked_out.add_metric([name], pool.checkedout())
+            overflow.add_metric([name], stats.overflow_events)
+            timeouts.add_metric([name], stats.timeouts)
+            buckets, cumulative = [], 0
+            for bound, count in zip((*POOL_WAIT_BUCKETS_MS, None), stats.wait_buckets):
+                cumulative += count
+                buckets.append(("+Inf" if bound is None else str(bound / 1000), cumulative))
+            wait.add_metric([name], buckets, sum_value=stats.wait_sum_ms / 1000)
+        yield from (checked_out, overflow, timeouts, wait)
+
+
+REGISTRY.register(_StatsCollector())
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
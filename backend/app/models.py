@@ -1,6 +1,6 @@
 # backend/app/models.py
 from sqlalchemy import (
-    Column, Integer, String, JSON, ForeignKey, DateTime, func, Boolean, Table, event
+    Column, Integer, BigInteger, Float, String, JSON, ForeignKey, DateTime, Date, func, Boolean, Table, Index, event, text
 )
 import uuid
 from sqlalchemy.dialects.postgresql import UUID
@@ -14,6 +14,12 @@ product_addon_groups_association = Table(
     Column('addon_group_id', String, ForeignKey('global_addon_groups.id'), primary_key=True)
 )
 
+def with_media_prefix(path):
+    # Добавляем префикс, только если это не полный URL и префикса еще нет
+    if path and not path.startswith(('http', '/media/')):
+        return f'/media/{path}'
+    return path
+
 # --- Улучшение: Добавим __str__ для красивого отображения в админке ---
 class Cafe(Base):
     __tablename__ = 'cafes'
@@ -38,9 +44,11 @@ class Cafe(Base):
 @event.listens_for(Cafe, 'before_insert')
 @event.listens_for(Cafe, 'before_update')
 def prepend_media_prefix_to_cafe_images(mapper, connection, target):
-    # Добавляем префикс, только если это не полный URL и префикса еще нет
-    if target.cover_image and not target.cover_image.startswith(('http', '/media/')):
-        target.cover_image = f'/media/{target.cover_image}'
+    target.cover_image = with_media_prefix(target.cover_image)
+
+# Хэш файлов каталога последней синхронизации (migrate_data.py). Служебный ключ: в админке не показывается
+CATALOG_SYNC_HASH_KEY = "catalog_sync_hash"
+SERVICE_SETTING_KEYS = (CATALOG_SYNC_HASH_KEY,)
 
 class AppSetting(Base):
     __tablename__ = 'app_settings'
@@ -64,6 +72,9 @@ class Category(Base):
 
 class GlobalProduct(Base):
     __tablename__ = 'global_products'
+    __table_args__ = (
+        Index('ix_global_products_category_popular', 'category_id', 'is_popular'),
+    )
     id = Column(String, primary_key=True, index=True)
     name = Column(String, nullable=False)
     description = Column(String)
@@ -83,9 +94,7 @@ class GlobalProduct(Base):
 @event.listens_for(GlobalProduct, 'before_insert')
 @event.listens_for(GlobalProduct, 'before_update')
 def prepend_media_prefix_to_product_image(mapper, connection, target):
-    # Добавляем префикс, только если это не полный URL и префикса еще нет
-    if target.image and not target.image.startswith(('http', '/media/')):
-        target.image = f'/media/{target.image}'
+    target.image = with_media_prefix(target.image)
 
 
 class GlobalProductVariant(Base):
@@ -108,6 +117,11 @@ class GlobalProductVariant(Base):
 
 class VenueMenuItem(Base):
     __tablename__ = 'venue_menu_items'
+    # Снимок меню выбирает доступные позиции заведения (venue_id = ? AND is_available) и джойнит по variant_id
+    __table_args__ = (
+        Index('uq_venue_menu_items_venue_variant', 'venue_id', 'variant_id', unique=True),
+        Index('ix_venue_menu_items_venue_available', 'venue_id', 'is_available', 'variant_id'),
+    )
     id = Column(Integer, primary_key=True)
     venue_id = Column(String, ForeignKey('cafes.id'))
     variant_id = Column(String, ForeignKey('global_product_variants.id'))
@@ -148,6 +162,9 @@ class GlobalAddonItem(Base):
 
 class VenueAddonItem(Base):
     __tablename__ = 'venue_addon_items'
+    __table_args__ = (
+        Index('uq_venue_addon_items_venue_addon', 'venue_id', 'addon_id', unique=True),
+    )
     id = Column(Integer, primary_key=True)
     venue_id = Column(String, ForeignKey('cafes.id'))
     addon_id = Column(String, ForeignKey('global_addon_items.id'))
@@ -166,9 +183,15 @@ class VenueAddonItem(Base):
 
 class Order(Base):
     __tablename__ = 'orders'
+    __table_args__ = (
+        Index('ix_orders_cafe_created', 'cafe_id', 'created_at'),
+        # Ключ постраничного списка заказов в админке (ORDER BY created_at DESC, id DESC)
+        Index('ix_orders_created_id', 'created_at', 'id'),
+        Index('ix_orders_status', 'status'),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     cafe_id = Column(String, ForeignKey('cafes.id'), nullable=False)
-    created_at = Column(DateTime, server_default=func.now())
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
     user_info = Column(JSON)
     cart_items = Column(JSON)
     total_amount = Column(Integer)
@@ -179,3 +202,101 @@ class Order(Base):
     payment_method = Column(String, default='online')
 
     cafe = relationship("Cafe", back_populates="orders")
+
+
+class NotificationOutbox(Base):
+    """
+    Транзакционный outbox уведомлений Telegram.
+
+    Строки пишутся в той же транзакции, что и заказ, а доставляются фоновыми
+    воркерами из app/outbox.py с повторами и экспоненциальной задержкой.
+    """
+    __tablename__ = 'notification_outbox'
+    # Воркеры выбирают только ожидающие доставки строки, отправленные в индекс не попадают
+    __table_args__ = (
+        Index('ix_notification_outbox_pending', 'next_attempt_at',
+              postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")),
+    )
+    id = Column(Integer, primary_key=True)
+    order_id = Column(UUID(as_uuid=True), ForeignKey('orders.id', ondelete='CASCADE'), nullable=True)
+    chat_id = Column(String, nullable=False)
+    text = Column(String, nullable=False)
+    parse_mode = Column(String, nullable=True)
+    status = Column(String, default='pending', nullable=False)  # pending / sent / failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+
+    def __str__(self):
+        return f"Уведомление #{self.id}"
+
+
+# --- Сводные таблицы продаж (ведет app/sales_rollup.py, читает дашборд админки) ---
+# Ссылок на каталог нет: сводка переживает удаление варианта или добавки из меню.
+
+class SalesVenueDaily(Base):
+    """Заказы, выручка и число позиций заведения за день."""
+    __tablename__ = 'sales_venue_daily'
+    __table_args__ = (Index('ix_sales_venue_daily_day', 'day'),)
+    venue_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    orders_count = Column(Integer, default=0, nullable=False)
+    revenue = Column(BigInteger, default=0, nullable=False)  # в копейках, как Order.total_amount
+    items_count = Column(Integer, default=0, nullable=False)
+
+
+class SalesVariantDaily(Base):
+    """Сколько штук варианта продано в заведении за день и в скольких заказах."""
+    __tablename__ = 'sales_variant_daily'
+    __table_args__ = (Index('ix_sales_variant_daily_day', 'day'),)
+    venue_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    variant_id = Column(String, primary_key=True)
+    quantity = Column(Integer, default=0, nullable=False)
+    orders_count = Column(Integer, default=0, nullable=False)
+
+
+class SalesAddonDaily(Base):
+    """Сколько позиций заказано с добавкой (доля от SalesVenueDaily.items_count - attach rate)."""
+    __tablename__ = 'sales_addon_daily'
+    __table_args__ = (Index('ix_sales_addon_daily_day', 'day'),)
+    venue_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    addon_id = Column(String, primary_key=True)
+    quantity = Column(Integer, default=0, nullable=False)
+
+
+class ProductPopularity(Base):
+    """
+    Популярность продукта в заведении: проданные штуки с экспоненциальным затуханием
+    (см. app/popularity.py). score приведен к моменту scored_at.
+    """
+    __tablename__ = 'product_popularity'
+    venue_id = Column(String, primary_key=True)
+    product_id = Column(String, primary_key=True)
+    score = Column(Float, default=0, nullable=False)
+    scored_at = Column(DateTime, nullable=False)
+
+
+class JobWatermark(Base):
+    """Граница, до которой фоновая задача уже обработала данные: одна строка на задачу."""
+    __tablename__ = 'job_watermarks'
+    name = Column(String, primary_key=True)
+    processed_until = Column(DateTime, nullable=False)
+
+
+class IdempotencyKey(Base):
+    """
+    Запрос с ключом идемпотентности (app/idempotency.py): пока response пуст, запрос
+    выполняется; после - повторы получают сохраненный ответ до expires_at.
+    """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (Index('ix_idempotency_keys_expires_at', 'expires_at'),)
+    key = Column(String, primary_key=True)
+    # Дайджест тела запроса: тот же ключ с другим телом - ошибка клиента, а не повтор
+    fingerprint = Column(String, nullable=False)
+    response = Column(JSON(none_as_null=True), nullable=True)
+    locked_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
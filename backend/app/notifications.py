@@ -0,0 +1,128 @@
+# backend/app/notifications.py
+"""
+Рендеринг уведомлений о заказе для персонала и клиента.
+
+Шаблоны компилируются один раз при импорте, а название заведения берется из
+закэшированного справочника, так что рендеринг не обращается к БД. Все
+пользовательские данные экранируются под parse_mode='Markdown' Telegram.
+"""
+from dataclasses import dataclass, field
+from string import Template
+from typing import Any, Dict, List, Mapping, Tuple
+import uuid
+
+from telegram.helpers import escape_markdown
+
+from .menu_cache import VenueInfo
+
+PARSE_MODE = 'Markdown'
+
+# Словарь для перевода способов оплаты в понятный текст
+PAYMENT_METHOD_TEXT = {
+    'online': 'Оплата онлайн',
+    'card_on_delivery': 'Оплата картой курьеру',
+    'cash_on_delivery': 'Оплата наличными'
+}
+
+STAFF_TEMPLATE = Template(
+    "🔥Новый заказ `#$order_id`\n\n"
+    "🛍️*Состав заказа:*\n$items\n\n"
+    "💰*Сумма:* $total RUB\n"
+    "*Способ оплаты:* $payment\n"
+    "👤*Клиент:* $client_name ($client_link)\n\n"
+    "$receiving\n\n"
+    "Необходимо связаться с клиентом для подтверждения."
+)
+
+CUSTOMER_TEMPLATE = Template(
+    "🔥 Ваш заказ `#$order_id` принят!\n\n"
+    "🛍️*Состав заказа:*\n$items\n\n"
+    "💰*Итого:* $total RUB\n"
+    "💵*Способ оплаты:* $payment\n\n"
+    "$receiving\n\n"
+    "Мы скоро начнем готовить. Ожидайте, пожалуйста!\n\n"
+    "Для связи с поддержкой введите /help"
+)
+
+# Блок способа получения: для персонала с выделением, для клиента - простым текстом
+STAFF_DELIVERY_TEMPLATE = Template(
+    "Способ получения: *Доставка*\n"
+    "📍 *Адрес:* $city, $street, д. $house, кв./офис $apartment\n"
+    "💬 *Комментарий:* $comment"
+)
+CUSTOMER_DELIVERY_TEMPLATE = Template(
+    "Способ получения: Доставка\n"
+    "📍 Адрес: $city, $street, д. $house, кв./офис $apartment\n"
+    "💬 Комментарий: $comment"
+)
+STAFF_PICKUP_TEMPLATE = Template("Способ получения: *Самовывоз*\n📍 *Кофейня:* $venue")
+CUSTOMER_PICKUP_TEMPLATE = Template("Способ получения: Самовывоз\n📍 Кофейня: $venue")
+
+ITEM_TEMPLATE = Template("  - $name ($variant) x $quantity")
+ADDON_TEMPLATE = Template("     + $name")
+
+
+@dataclass(frozen=True)
+class OrderNotificationData:
+    """Минимальный набор полей заказа для рендеринга. Order из models.py подходит напрямую."""
+    id: uuid.UUID
+    cafe_id: str
+    total_amount: int
+    status: str
+    payment_method: str
+    order_type: str
+    user_info: Dict[str, Any] = field(default_factory=dict)
+    cart_items: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def _md(value: Any) -> str:
+    return escape_markdown(str(value), version=1)
+
+
+def _render_items(cart_items: List[Dict[str, Any]]) -> str:
+    item_lines = []
+    for item in cart_items or []:
+        line = ITEM_TEMPLATE.substitute(
+            name=_md(item.get('cafe_item', {}).get('name') or 'Неизвестный товар'),
+            variant=_md(item.get('variant', {}).get('name') or ''),
+            quantity=item.get('quantity', 0)
+        )
+        addons = item.get('selected_addons') or []
+        if addons:
+            line += "\n" + "\n".join(ADDON_TEMPLATE.substitute(name=_md(addon.get('name', 'добавка'))) for addon in addons)
+        item_lines.append(line)
+    return "\n".join(item_lines)
+
+
+def render_order_messages(order: OrderNotificationData, venues: Mapping[str, VenueInfo]) -> Tuple[str, str]:
+    """Возвращает (текст для персонала, текст для клиента)."""
+    user_info = order.user_info or {}
+    username = user_info.get('username', '')
+    # Если статус 'paid', всегда показываем "Оплачено онлайн"
+    payment_text = "Оплачено онлайн" if order.status == 'paid' else PAYMENT_METHOD_TEXT.get(order.payment_method, 'Не указан')
+
+    if order.order_type == 'delivery':
+        address_info = user_info.get('shipping_address', {})
+        address = {key: _md(address_info.get(key, '')) for key in ('city', 'street', 'house', 'apartment')}
+        address['comment'] = _md(address_info.get('comment') or 'нет')
+        staff_receiving = STAFF_DELIVERY_TEMPLATE.substitute(address)
+        customer_receiving = CUSTOMER_DELIVERY_TEMPLATE.substitute(address)
+    else:
+        venue = venues.get(order.cafe_id)
+        venue_name = _md(venue.name) if venue else 'Не указана'
+        staff_receiving = STAFF_PICKUP_TEMPLATE.substitute(venue=venue_name)
+        customer_receiving = CUSTOMER_PICKUP_TEMPLATE.substitute(venue=venue_name)
+
+    common = {
+        "order_id": str(order.id).split('-')[0],
+        "items": _render_items(order.cart_items),
+        "total": f"{order.total_amount / 100.0:.2f}",
+        "payment": payment_text,
+    }
+    staff_text = STAFF_TEMPLATE.substitute(
+        common, receiving=staff_receiving,
+        client_name=_md(user_info.get('first_name', 'Клиент')),
+        client_link=_md(f"@{username}") if username else "N/A"
+    )
+    customer_text = CUSTOMER_TEMPLATE.substitute(common, receiving=customer_receiving)
+    return staff_text, customer_text
@@ -0,0 +1,147 @@
+# backend/app/outbox.py
+"""
+Доставка уведомлений через транзакционный outbox.
+
+Эндпоинт заказа только записывает сообщения в таблицу notification_outbox в той
+же транзакции, что и сам заказ, и сразу отвечает клиенту. Фоновые asyncio-воркеры
+забирают готовые к отправке строки, отправляют их в Telegram и при ошибках
+повторяют попытки с экспоненциальной задержкой. Гарантия доставки - at-least-once:
+если процесс упал во время отправки, строка снова станет доступной после аренды.
+"""
+import asyncio
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from .database import AsyncSessionLocal
+from .metrics import OUTBOX_DELIVERIES, timed
+from .models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "10"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+# Сколько секунд строка считается занятой воркером, прежде чем ее можно забрать повторно
+OUTBOX_LEASE_SECONDS = 60
+BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS = 2, 600
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _backoff(attempts: int) -> float:
+    """Экспоненциальная задержка с джиттером: 2, 4, 8 ... секунд, но не больше 10 минут."""
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def enqueue_message(db: AsyncSession, chat_id, text: str, parse_mode: Optional[str] = None, order_id: Optional[uuid.UUID] = None) -> None:
+    """Добавляет сообщение в outbox. Коммит - на стороне вызывающего кода."""
+    db.add(NotificationOutbox(
+        order_id=order_id, chat_id=str(chat_id), text=text, parse_mode=parse_mode,
+        status='pending', attempts=0, next_attempt_at=_utcnow()
+    ))
+
+
+class OutboxDispatcher:
+    """Пул фоновых воркеров, разбирающих notification_outbox."""
+
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self, bot: Bot, workers: int = OUTBOX_WORKERS) -> None:
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run(i), name=f"outbox-worker-{i}") for i in range(workers)]
+        logger.info(f"Outbox dispatcher started with {workers} workers.")
+
+    async def stop(self) -> None:
+        for task in self._tasks: task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        """Будит воркеров сразу после коммита, не дожидаясь очередного опроса."""
+        if self._wakeup is not None: self._wakeup.set()
+
+    async def _run(self, worker_id: int) -> None:
+        while True:
+            try:
+                processed = await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker {worker_id} failed: {e}", exc_info=True); processed = 0
+            if processed:
+                continue
+            self._wakeup.clear()
+            try: await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError: pass
+
+    async def _claim(self) -> List[NotificationOutbox]:
+        # SKIP LOCKED позволяет нескольким воркерам (и процессам) разбирать очередь без двойной отправки,
+        # а повторная проверка условий в UPDATE делает захват атомарным и там, где SKIP LOCKED не поддерживается.
+        async with AsyncSessionLocal() as db:
+            now = _utcnow()
+            due = (NotificationOutbox.status == 'pending', NotificationOutbox.next_attempt_at <= now)
+            ids = (await db.execute(
+                select(NotificationOutbox.id).where(*due)
+                .order_by(NotificationOutbox.id)
+                .limit(OUTBOX_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )).scalars().all()
+            if not ids:
+                return []
+            rows = (await db.scalars(
+                update(NotificationOutbox)
+                .where(NotificationOutbox.id.in_(ids), *due)
+                .values(attempts=NotificationOutbox.attempts + 1, next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+                .returning(NotificationOutbox)
+            )).all()
+            await db.commit()
+            return sorted(rows, key=lambda row: row.id)
+
+    async def process_batch(self) -> int:
+        rows = await self._claim()
+        for row in rows:
+            await self._deliver(row)
+        return len(rows)
+
+    async def _deliver(self, row: NotificationOutbox) -> None:
+        try:
+            with timed("telegram_send_message"):
+                await self._bot.send_message(chat_id=row.chat_id, text=row.text, parse_mode=row.parse_mode)
+            values = {"status": 'sent', "sent_at": _utcnow(), "last_error": None}
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            values = {"next_attempt_at": _utcnow() + timedelta(seconds=retry_after), "last_error": str(e)}
+        except (BadRequest, Forbidden) as e:
+            # Чат не найден, бот заблокирован, неверная разметка - повтор не поможет
+            logger.error(f"Outbox message {row.id} to {row.chat_id} rejected: {e}")
+            values = {"status": 'failed', "last_error": str(e)}
+        except TelegramError as e:
+            logger.warning(f"Outbox message {row.id} to {row.chat_id} failed (attempt {row.attempts}): {e}")
+            if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                values = {"status": 'failed', "last_error": str(e)}
+            else:
+                values = {"next_attempt_at": _utcnow() + timedelta(seconds=_backoff(row.attempts)), "last_error": str(e)}
+        OUTBOX_DELIVERIES.labels(values.get("status", 'retry')).inc()
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(NotificationOutbox).where(NotificationOutbox.id == row.id).values(**values))
+            await db.commit()
+
+
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,221 @@
+# backend/app/popularity.py
+"""
+Популярные позиции заведения по истории заказов.
+
+Счет продукта в заведении - сумма проданных штук, где каждый заказ весит
+2^(-возраст / POPULARITY_HALF_LIFE_DAYS): недельной давности продажа весит меньше
+сегодняшней, а давно не заказываемое уходит вниз само. Счет хранится вместе
+с моментом, к которому он приведен (product_popularity.score, scored_at), поэтому
+пересчитывать всю историю не нужно: фоновая задача раз в POPULARITY_INTERVAL
+секунд берет только заказы после отметки в job_watermarks, затухает старый счет
+до новой отметки и прибавляет вклад новых заказов.
+
+Заказ учитывается спустя POPULARITY_SETTLE_MINUTES после создания и только
+в статусах sales_rollup.COUNTED_STATUSES: онлайн-заказ к этому времени обычно
+оплачен или брошен. Оплаченный позже или отмененный потом заказ счет не меняет -
+для рейтинга это допустимая погрешность.
+
+Каждый процесс держит в памяти top-N продуктов по заведениям (PopularityRanking)
+и перечитывает его после каждого прохода; обновляет таблицу в каждом цикле только
+один процесс (блокировка строки отметки). Флаг GlobalProduct.is_popular остается
+ручным закреплением: такие продукты всегда идут первыми.
+"""
+import asyncio
+import logging
+import math
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+from .http_cache import content_version, utcnow
+from .menu_cache import MenuProduct, VenueMenu
+from .models import GlobalProductVariant, JobWatermark, Order, ProductPopularity
+from .sales_rollup import COUNTED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Через сколько дней продажа весит вдвое меньше
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", "14"))
+# Период фоновой задачи, с
+POPULARITY_INTERVAL = float(os.getenv("POPULARITY_INTERVAL", "300"))
+# Заказ моложе этого еще может поменять статус (ожидает оплаты) - его берет следующий проход
+POPULARITY_SETTLE_MINUTES = int(os.getenv("POPULARITY_SETTLE_MINUTES", "30"))
+# За сколько дней учитываются заказы при первом проходе (пустая отметка)
+POPULARITY_BACKFILL_DAYS = int(os.getenv("POPULARITY_BACKFILL_DAYS", "90"))
+POPULARITY_BATCH = int(os.getenv("POPULARITY_BATCH", "1000"))
+# Сколько позиций отдает /cafes/{id}/popular вместе с закрепленными
+POPULAR_LIMIT = int(os.getenv("POPULAR_LIMIT", "10"))
+# Сколько лучших продуктов заведения держать в памяти: с запасом на недоступные сейчас в меню
+_KEPT_PER_VENUE = POPULAR_LIMIT * 3
+
+_WATERMARK = "popularity"
+_HALF_LIFE_SECONDS = POPULARITY_HALF_LIFE_DAYS * 86400
+
+
+async def _db_now(db: AsyncSession) -> datetime:
+    """
+    Текущее время БД без часового пояса - в той же шкале, что created_at заказа. now() в PostgreSQL
+    возвращает timestamptz (aware datetime), а колонка DateTime хранит его как LOCALTIMESTAMP;
+    CURRENT_TIMESTAMP в SQLite и так без пояса.
+    """
+    return await db.scalar(select(func.localtimestamp() if db.bind.dialect.name == "postgresql" else func.now()))
+
+
+def decayed(score: float, since: datetime, until: datetime) -> float:
+    """Счет, приведенный от момента since к until."""
+    return score * 2 ** (-(until - since).total_seconds() / _HALF_LIFE_SECONDS)
+
+
+async def _claim_watermark(db: AsyncSession) -> Optional[JobWatermark]:
+    """Строка отметки под блокировкой до конца транзакции; None - ее уже обрабатывает другой процесс."""
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    start = await _db_now(db) - timedelta(days=POPULARITY_BACKFILL_DAYS)
+    await db.execute(insert(JobWatermark.__table__).values(name=_WATERMARK, processed_until=start).on_conflict_do_nothing(index_elements=["name"]))
+    return await db.scalar(select(JobWatermark).where(JobWatermark.name == _WATERMARK).with_for_update(skip_locked=True))
+
+
+async def update_scores(db: AsyncSession) -> int:
+    """Один проход: учитывает заказы с последней отметки; возвращает их число. Коммитит сам."""
+    watermark = await _claim_watermark(db)
+    if watermark is None:
+        await db.rollback()
+        return 0
+    # Время БД, а не процесса: с ним сравнивается created_at, который ставит сервер БД
+    cutoff = await _db_now(db) - timedelta(minutes=POPULARITY_SETTLE_MINUTES)
+    if cutoff <= watermark.processed_until:
+        await db.rollback()
+        return 0
+
+    # Вклад заказов в (заведение, вариант), приведенный к cutoff
+    by_variant: Dict[Tuple[str, str], float] = defaultdict(float)
+    counted, last_id = 0, None
+    while True:
+        stmt = (
+            select(Order.id, Order.cafe_id, Order.created_at, Order.cart_items)
+            .where(Order.created_at >= watermark.processed_until, Order.created_at < cutoff, Order.status.in_(COUNTED_STATUSES))
+            .order_by(Order.id).limit(POPULARITY_BATCH)
+        )
+        if last_id is not None: stmt = stmt.where(Order.id > last_id)
+        rows = (await db.execute(stmt)).all()
+        if not rows:
+            break
+        for row in rows:
+            weight = decayed(1.0, row.created_at, cutoff)
+            for line in row.cart_items or ():
+                try: by_variant[(row.cafe_id, line["variant"]["id"])] += int(line["quantity"]) * weight
+                except (KeyError, TypeError, ValueError): continue
+        counted, last_id = counted + len(rows), rows[-1].id
+
+    if by_variant:
+        # Продукт берется по варианту из каталога, а не из cafe_item корзины, присланной клиентом
+        products = dict((await db.execute(
+            select(GlobalProductVariant.id, GlobalProductVariant.global_product_id)
+            .where(GlobalProductVariant.id.in_({variant_id for _, variant_id in by_variant}))
+        )).all())
+        added: Dict[Tuple[str, str], float] = defaultdict(float)
+        for (venue_id, variant_id), score in by_variant.items():
+            if variant_id in products: added[(venue_id, products[variant_id])] += score
+        if added:
+            current = {
+                (row.venue_id, row.product_id): decayed(row.score, row.scored_at, cutoff)
+                for row in (await db.execute(
+                    select(ProductPopularity.venue_id, ProductPopularity.product_id, ProductPopularity.score, ProductPopularity.scored_at)
+                    .where(ProductPopularity.venue_id.in_({venue_id for venue_id, _ in added}))
+                )).all()
+            }
+            table = ProductPopularity.__table__
+            stmt = (postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert)(table)
+            stmt = stmt.on_conflict_do_update(index_elements=["venue_id", "product_id"], set_={"score": stmt.excluded.score, "scored_at": stmt.excluded.scored_at})
+            await db.execute(stmt, [
+                {"venue_id": venue_id, "product_id": product_id, "score": current.get((venue_id, product_id), 0.0) + score, "scored_at": cutoff}
+                for (venue_id, product_id), score in added.items()
+            ])
+
+    await db.execute(update(JobWatermark).where(JobWatermark.name == _WATERMARK).values(processed_until=cutoff))
+    await db.commit()
+    return counted
+
+
+class PopularityRanking:
+    """
+    Top-N продуктов по заведениям в памяти процесса и фоновая задача, которая его обновляет.
+
+    Рейтинг подменяется целиком, читатели берут его без блокировок. Сравниваются
+    логарифмы счета, приведенные к общей шкале времени: порядок не зависит от того,
+    к какому моменту приведен каждый счет, и не требует часов процесса.
+    """
+
+    def __init__(self):
+        self._ranked: Mapping[str, Tuple[str, ...]] = MappingProxyType({})
+        # Когда у заведения в последний раз поменялся порядок: Last-Modified ответа /popular
+        self._changed_at: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.runs = self.orders_counted = 0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="popularity")
+
+    async def stop(self) -> None:
+        if self._task is None: return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    counted = await update_scores(db)
+                if counted: logger.info(f"Popularity scores updated from {counted} orders.")
+                self.runs += 1; self.orders_counted += counted
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Popularity update failed: {e}", exc_info=True)
+            await asyncio.sleep(POPULARITY_INTERVAL)
+
+    async def refresh(self) -> None:
+        """Перечитывает product_popularity и пересобирает рейтинг."""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(ProductPopularity).where(ProductPopularity.score > 0))).scalars().all()
+        by_venue: Dict[str, List[Tuple[float, str]]] = defaultdict(list)
+        for row in rows:
+            # log2(score * 2^(-(t - scored_at)/H)) = log2(score) + scored_at/H - t/H, последнее слагаемое общее
+            by_venue[row.venue_id].append((math.log2(row.score) + row.scored_at.timestamp() / _HALF_LIFE_SECONDS, row.product_id))
+        ranked = {
+            venue_id: tuple(product_id for _, product_id in sorted(scores, key=lambda s: (-s[0], s[1]))[:_KEPT_PER_VENUE])
+            for venue_id, scores in by_venue.items()
+        }
+        now = utcnow()
+        for venue_id in ranked.keys() | self._ranked.keys():
+            if ranked.get(venue_id) != self._ranked.get(venue_id): self._changed_at[venue_id] = now
+        self._ranked = MappingProxyType(ranked)
+
+    def popular(self, menu: VenueMenu) -> Tuple[Tuple[MenuProduct, ...], str, datetime]:
+        """
+        Популярное меню заведения: закрепленные (is_popular) в порядке меню, затем лучшие
+        по рейтингу доступные позиции до POPULAR_LIMIT. Возвращает (продукты, версия, Last-Modified).
+        """
+        products = list(menu.popular)
+        pinned = {p.id for p in products}
+        for product_id in self._ranked.get(menu.venue_id, ()):
+            if len(products) >= POPULAR_LIMIT: break
+            product = menu.products_by_id.get(product_id)
+            if product is not None and product_id not in pinned: products.append(product)
+        changed_at = self._changed_at.get(menu.venue_id)
+        last_modified = max(menu.last_modified, changed_at) if changed_at else menu.last_modified
+        return tuple(products), content_version(menu.version, tuple(p.id for p in products)), last_modified
+
+    def stats(self) -> dict:
+        return {"venues": len(self._ranked), "runs": self.runs, "orders_counted": self.orders_counted}
+
+
+popularity_ranking = PopularityRanking()
@@ -0,0 +1,91 @@
+# backend/app/pricing.py
+"""
+Расчет стоимости корзины по снимку меню заведения.
+
+Цены вариантов и добавок берутся из menu_cache, поэтому расчет корзины любого
+размера не делает ни одного запроса к БД. Используется при создании заказа
+и в эндпоинте предварительного расчета корзины.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .menu_cache import VenueMenu, MenuAddonItem
+from .schemas import CartItemRequest
+
+# Ограничение Telegram на длину подписи позиции в счете
+MAX_LABEL_LENGTH = 32
+
+
+def _truncate_label(base: str, suffix: str) -> str:
+    max_base_len = MAX_LABEL_LENGTH - len(suffix)
+    if len(base) > max_base_len:
+        return base[:max_base_len - 3] + "..." + suffix
+    return base + suffix
+
+
+@dataclass(frozen=True, slots=True)
+class QuotedLine:
+    variant_id: str
+    product_id: Optional[str]
+    quantity: int
+    unit_price: int
+    total_price: int
+    label: str
+    error: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class CartQuote:
+    lines: Tuple[QuotedLine, ...]
+    total_amount: int
+
+    @property
+    def errors(self) -> List[str]:
+        return [line.error for line in self.lines if line.error]
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+    def labeled_lines(self) -> List[Tuple[str, int]]:
+        """Пары (подпись, сумма) для счета Telegram. Бесплатные позиции в счет не попадают."""
+        return [(line.label, line.total_price) for line in self.lines if not line.error and line.total_price > 0]
+
+
+def _quote_line(menu: VenueMenu, item: CartItemRequest) -> QuotedLine:
+    def unavailable(message: str) -> QuotedLine:
+        return QuotedLine(variant_id=item.variant.id, product_id=None, quantity=item.quantity,
+                          unit_price=0, total_price=0, label="", error=message)
+
+    if item.quantity < 1:
+        return unavailable(f"Invalid quantity for item variant '{item.variant.id}'.")
+    found = menu.variants_by_id.get(item.variant.id)
+    if not found:
+        return unavailable(f"Item variant '{item.variant.id}' unavailable.")
+    product, variant = found
+
+    single_item_price = variant.price
+    addon_names = []
+    if item.selected_addons:
+        # Добавку можно выбрать только из групп, привязанных к продукту
+        product_addons: Dict[str, MenuAddonItem] = {a.id: a for group in product.addons for a in group.items}
+        for addon_data in item.selected_addons:
+            addon = product_addons.get(addon_data.id)
+            if not addon:
+                return unavailable(f"Addon '{addon_data.id}' unavailable.")
+            single_item_price += addon.price
+            addon_names.append(addon.name)
+
+    base_label = f"{product.name} ({variant.name})"
+    if addon_names: base_label += f" + {', '.join(addon_names)}"
+    return QuotedLine(
+        variant_id=variant.id, product_id=product.id, quantity=item.quantity,
+        unit_price=single_item_price, total_price=single_item_price * item.quantity,
+        label=_truncate_label(base_label, f" x{item.quantity}")
+    )
+
+
+def quote_cart(menu: VenueMenu, cart_items: List[CartItemRequest]) -> CartQuote:
+    """Считает каждую строку корзины по актуальным ценам заведения."""
+    lines = tuple(_quote_line(menu, item) for item in cart_items)
+    return CartQuote(lines=lines, total_amount=sum(line.total_price for line in lines if not line.error))
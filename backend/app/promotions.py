@@ -0,0 +1,69 @@
+# backend/app/promotions.py
+"""
+Кэш промо-акций из data/promotions.json.
+
+Файл читается и валидируется один раз, акции индексируются по linkedCategoryId.
+Перечитывается он только при изменении mtime, поэтому правка файла на сервере
+подхватывается без перезапуска, а обычный запрос стоит один os.stat.
+"""
+import json
+import logging
+import os
+import threading
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from pydantic import ValidationError
+
+from .schemas import PromotionSchema
+
+logger = logging.getLogger(__name__)
+
+PROMOTIONS_PATH = os.getenv("PROMOTIONS_PATH", "data/promotions.json")
+_NOT_LOADED = object()
+
+
+class PromotionStore:
+    def __init__(self, path: str = PROMOTIONS_PATH):
+        self.path = path
+        self._mtime: object = _NOT_LOADED
+        # (акции в порядке файла, linkedCategoryId -> позиции акций); подменяется целиком
+        self._state: Tuple[Tuple[PromotionSchema, ...], Mapping[str, Tuple[int, ...]]] = ((), MappingProxyType({}))
+        self._lock = threading.Lock()
+
+    def _load(self, mtime: Optional[Tuple[int, int]]) -> None:
+        promotions: List[PromotionSchema] = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Не удалось загрузить или обработать файл promotions.json: {e}"); raw = []
+        for entry in raw if isinstance(raw, list) else []:
+            try: promotions.append(PromotionSchema.model_validate(entry))
+            except ValidationError as e: logger.warning(f"Пропущена некорректная акция {entry.get('id') if isinstance(entry, dict) else entry!r}: {e}")
+        by_category: Dict[str, List[int]] = {}
+        for position, promotion in enumerate(promotions):
+            by_category.setdefault(promotion.linked_category_id, []).append(position)
+        self._state = (tuple(promotions), MappingProxyType({k: tuple(v) for k, v in by_category.items()}))
+        self._mtime = mtime
+        logger.info(f"Promotions loaded: {len(promotions)} from {self.path}.")
+
+    def _refresh(self) -> None:
+        # Размер в отметке ловит правки в пределах одного тика mtime. Отсутствующий файл (None) -
+        # это пустой список акций, загруженный один раз, а не ошибка на каждый запрос.
+        try: stat = os.stat(self.path); mtime: Optional[Tuple[int, int]] = (stat.st_mtime_ns, stat.st_size)
+        except OSError: mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime != self._mtime:
+                self._load(mtime)
+
+    def for_categories(self, category_ids: Iterable[str]) -> List[PromotionSchema]:
+        """Акции, привязанные к указанным категориям, в порядке файла."""
+        self._refresh()
+        promotions, by_category = self._state
+        positions = sorted(i for category_id in set(category_ids) for i in by_category.get(category_id, ()))
+        return [promotions[i] for i in positions]
+
+
+promotion_store = PromotionStore()
@@ -0,0 +1,228 @@
+# backend/app/sales_rollup.py
+"""
+Сводные таблицы продаж: заведение x день, вариант x заведение x день, добавка x заведение x день.
+
+Отчеты (дашборд "Продажи" в админке) читают только эти таблицы и не
+разбирают cart_items всех заказов. Сводка обновляется приращениями в той же
+транзакции, что и заказ: обработчик after_flush сравнивает прежнее и новое
+состояние каждого измененного заказа и добавляет разницу через
+INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x. В сводку входят
+заказы в статусах COUNTED_STATUSES: онлайн-заказ попадает в нее при оплате,
+отмененный - вычитается. День - дата created_at заказа, как в админке.
+
+Массовые UPDATE/DELETE заказов мимо ORM сводку не обновляют; после них (или
+при подозрении на расхождение) сводка пересобирается целиком:
+    python -m app.sales_rollup --rebuild
+"""
+import argparse
+import logging
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .database import engine
+from .models import (
+    Cafe, GlobalAddonItem, GlobalProduct, GlobalProductVariant, Order,
+    SalesAddonDaily, SalesVariantDaily, SalesVenueDaily,
+)
+
+logger = logging.getLogger(__name__)
+
+# Заказы, которые считаются продажей (awaiting_payment - еще не оплачен, cancelled - отменен)
+COUNTED_STATUSES = frozenset({"pending", "paid", "completed"})
+# Сколько заказов читать за раз при пересборке
+ROLLUP_REBUILD_BATCH = int(os.getenv("ROLLUP_REBUILD_BATCH", "1000"))
+
+_TRACKED_ATTRIBUTES = ("status", "cafe_id", "created_at", "total_amount", "cart_items")
+
+
+@dataclass(frozen=True)
+class _OrderFacts:
+    venue_id: str
+    day: date
+    total_amount: int
+    cart_items: Any
+
+
+class RollupDeltas:
+    """Приращения строк сводки, накопленные по нескольким заказам."""
+
+    def __init__(self):
+        self.venue: Dict[Tuple, List[int]] = defaultdict(lambda: [0, 0, 0])    # orders_count, revenue, items_count
+        self.variant: Dict[Tuple, List[int]] = defaultdict(lambda: [0, 0])     # quantity, orders_count
+        self.addon: Dict[Tuple, List[int]] = defaultdict(lambda: [0])          # quantity
+
+    def add(self, facts: _OrderFacts, sign: int) -> None:
+        key = (facts.venue_id, facts.day)
+        items, variants = 0, set()
+        for line in facts.cart_items or ():
+            try:
+                quantity, variant_id = int(line["quantity"]), line["variant"]["id"]
+            except (KeyError, TypeError, ValueError):
+                continue
+            items += quantity
+            self.variant[(*key, variant_id)][0] += sign * quantity
+            variants.add(variant_id)
+            for addon in line.get("selected_addons") or ():
+                if isinstance(addon, dict) and addon.get("id"):
+                    self.addon[(*key, addon["id"])][0] += sign * quantity
+        for variant_id in variants:
+            self.variant[(*key, variant_id)][1] += sign
+        venue = self.venue[key]
+        venue[0] += sign; venue[1] += sign * (facts.total_amount or 0); venue[2] += sign * items
+
+    def __bool__(self) -> bool:
+        return bool(self.venue)
+
+
+def _facts(order: Order, previous: bool = False) -> Optional[_OrderFacts]:
+    """Вклад заказа в сводку: текущий или (previous=True) до изменений этой транзакции; None - не считается."""
+    values = {}
+    for attribute in _TRACKED_ATTRIBUTES:
+        history = inspect(order).attrs[attribute].history
+        values[attribute] = history.deleted[0] if previous and history.deleted else getattr(order, attribute)
+    if values["status"] not in COUNTED_STATUSES or values["created_at"] is None:
+        return None
+    return _OrderFacts(values["cafe_id"], values["created_at"].date(), values["total_amount"], values["cart_items"])
+
+
+def _upsert_increment(connection, table, keys: Tuple[str, ...], counters: Tuple[str, ...], deltas: Dict[Tuple, List[int]]) -> None:
+    rows = [
+        {**dict(zip(keys, key)), **dict(zip(counters, values))}
+        for key, values in deltas.items() if any(values)
+    ]
+    if not rows:
+        return
+    stmt = (postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert)(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys), set_={name: table.c[name] + stmt.excluded[name] for name in counters}
+    )
+    connection.execute(stmt, rows)
+
+
+def apply_deltas(connection, deltas: RollupDeltas) -> None:
+    _upsert_increment(connection, SalesVenueDaily.__table__, ("venue_id", "day"), ("orders_count", "revenue", "items_count"), deltas.venue)
+    _upsert_increment(connection, SalesVariantDaily.__table__, ("venue_id", "day", "variant_id"), ("quantity", "orders_count"), deltas.variant)
+    _upsert_increment(connection, SalesAddonDaily.__table__, ("venue_id", "day", "addon_id"), ("quantity",), deltas.addon)
+
+
+@event.listens_for(Session, "after_flush")
+def _roll_up_orders(session, flush_context):
+    # Здесь new/dirty/deleted и история атрибутов еще описывают только что записанные изменения
+    deltas = RollupDeltas()
+    for order in session.new:
+        if isinstance(order, Order) and (facts := _facts(order)):
+            deltas.add(facts, +1)
+    for order in session.dirty:
+        if isinstance(order, Order) and session.is_modified(order, include_collections=False):
+            before, after = _facts(order, previous=True), _facts(order)
+            if before != after:
+                if before: deltas.add(before, -1)
+                if after: deltas.add(after, +1)
+    for order in session.deleted:
+        if isinstance(order, Order) and (facts := _facts(order, previous=True)):
+            deltas.add(facts, -1)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def rebuild(connection, batch_size: int = ROLLUP_REBUILD_BATCH) -> int:
+    """Пересобирает сводку из заказов пачками по batch_size; возвращает число учтенных заказов."""
+    if connection.dialect.name == "postgresql":
+        # До конца транзакции заказы не меняются, иначе приращение от параллельной записи
+        # задвоится или потеряется; новые заказы просто подождут окончания пересборки
+        connection.execute(text("LOCK TABLE orders IN SHARE MODE"))
+    for model in (SalesVenueDaily, SalesVariantDaily, SalesAddonDaily):
+        connection.execute(delete(model))
+    columns = (Order.id, Order.cafe_id, Order.created_at, Order.total_amount, Order.cart_items)
+    counted, last_id = 0, None
+    while True:
+        stmt = select(*columns).where(Order.status.in_(COUNTED_STATUSES), Order.created_at.is_not(None)).order_by(Order.id).limit(batch_size)
+        if last_id is not None: stmt = stmt.where(Order.id > last_id)
+        rows = connection.execute(stmt).all()
+        if not rows:
+            return counted
+        deltas = RollupDeltas()
+        for row in rows:
+            deltas.add(_OrderFacts(row.cafe_id, row.created_at.date(), row.total_amount, row.cart_items), +1)
+        apply_deltas(connection, deltas)
+        counted, last_id = counted + len(rows), rows[-1].id
+
+
+def needs_backfill(connection) -> bool:
+    """Сводка пуста, а учитываемые заказы есть - например, сразу после миграции, добавившей таблицы."""
+    if connection.execute(select(SalesVenueDaily.venue_id).limit(1)).first() is not None:
+        return False
+    return connection.execute(select(Order.id).where(Order.status.in_(COUNTED_STATUSES)).limit(1)).first() is not None
+
+
+# --- Запросы дашборда: только сводные таблицы и справочники каталога ---
+
+async def venue_totals(db, start: date, end: date, venue_id: Optional[str] = None) -> List[Any]:
+    stmt = (
+        select(SalesVenueDaily.venue_id, Cafe.name.label("venue_name"),
+               func.sum(SalesVenueDaily.orders_count).label("orders"), func.sum(SalesVenueDaily.revenue).label("revenue"),
+               func.sum(SalesVenueDaily.items_count).label("items"))
+        .outerjoin(Cafe, Cafe.id == SalesVenueDaily.venue_id)
+        .where(SalesVenueDaily.day.between(start, end))
+        .group_by(SalesVenueDaily.venue_id, Cafe.name).order_by(func.sum(SalesVenueDaily.revenue).desc())
+    )
+    if venue_id: stmt = stmt.where(SalesVenueDaily.venue_id == venue_id)
+    return (await db.execute(stmt)).all()
+
+
+async def daily_totals(db, start: date, end: date, venue_id: Optional[str] = None) -> List[Any]:
+    stmt = (
+        select(SalesVenueDaily.day, func.sum(SalesVenueDaily.orders_count).label("orders"),
+               func.sum(SalesVenueDaily.revenue).label("revenue"), func.sum(SalesVenueDaily.items_count).label("items"))
+        .where(SalesVenueDaily.day.between(start, end))
+        .group_by(SalesVenueDaily.day).order_by(SalesVenueDaily.day.desc())
+    )
+    if venue_id: stmt = stmt.where(SalesVenueDaily.venue_id == venue_id)
+    return (await db.execute(stmt)).all()
+
+
+async def top_variants(db, start: date, end: date, venue_id: Optional[str] = None, limit: int = 20) -> List[Any]:
+    stmt = (
+        select(SalesVariantDaily.variant_id, GlobalProduct.name.label("product_name"), GlobalProductVariant.name.label("variant_name"),
+               func.sum(SalesVariantDaily.quantity).label("quantity"), func.sum(SalesVariantDaily.orders_count).label("orders"))
+        .outerjoin(GlobalProductVariant, GlobalProductVariant.id == SalesVariantDaily.variant_id)
+        .outerjoin(GlobalProduct, GlobalProduct.id == GlobalProductVariant.global_product_id)
+        .where(SalesVariantDaily.day.between(start, end))
+        .group_by(SalesVariantDaily.variant_id, GlobalProduct.name, GlobalProductVariant.name)
+        .order_by(func.sum(SalesVariantDaily.quantity).desc()).limit(limit)
+    )
+    if venue_id: stmt = stmt.where(SalesVariantDaily.venue_id == venue_id)
+    return (await db.execute(stmt)).all()
+
+
+async def addon_attach_rates(db, start: date, end: date, items: int, venue_id: Optional[str] = None) -> List[Any]:
+    """Добавки по числу позиций с ними; items - всего позиций за период (из venue_totals) для доли."""
+    stmt = (
+        select(SalesAddonDaily.addon_id, GlobalAddonItem.name.label("addon_name"), func.sum(SalesAddonDaily.quantity).label("quantity"))
+        .outerjoin(GlobalAddonItem, GlobalAddonItem.id == SalesAddonDaily.addon_id)
+        .where(SalesAddonDaily.day.between(start, end))
+        .group_by(SalesAddonDaily.addon_id, GlobalAddonItem.name).order_by(func.sum(SalesAddonDaily.quantity).desc())
+    )
+    if venue_id: stmt = stmt.where(SalesAddonDaily.venue_id == venue_id)
+    return [(row, row.quantity / items if items else 0.0) for row in (await db.execute(stmt)).all()]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Пересборка сводных таблиц продаж из заказов.")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--rebuild", action="store_true", help="пересобрать сводку целиком")
+    mode.add_argument("--backfill", action="store_true", help="пересобрать, только если сводка пуста, а заказы есть")
+    args = parser.parse_args()
+    with engine.begin() as connection:
+        if args.rebuild or needs_backfill(connection):
+            logger.info(f"Sales rollups rebuilt from {rebuild(connection)} orders.")
+        else:
+            logger.info("Sales rollups are already populated.")
@@ -1,7 +1,8 @@
 # backend/app/schemas.py
-from pydantic import BaseModel, ConfigDict, field_serializer
+from pydantic import BaseModel, ConfigDict, computed_field, field_serializer
 from pydantic.alias_generators import to_camel
 from typing import List, Optional
+from .images import THUMBNAIL_WIDTH, image_srcset
 from .utils import create_full_image_url 
 
 
@@ -33,6 +34,12 @@ class CafeSchema(CustomBaseModel):
     def serialize_cover_image(self, value: Optional[str]) -> Optional[str]:
         return create_full_image_url(value)
 
+    # Все ширины обложки для <img srcset>: браузер сам выберет копию под экран
+    @computed_field
+    @property
+    def cover_image_srcset(self) -> Optional[str]:
+        return image_srcset(self.cover_image, create_full_image_url)
+
 
 class CategorySchema(CustomBaseModel):
     id: str
@@ -66,9 +73,15 @@ class MenuItemSchema(CustomBaseModel):
     addons: Optional[List[AddonGroupSchema]] = []
     sub_category: Optional[str] = None
 
+    # image - миниатюра для карточки в списке и корзины; для крупного показа (страница товара) есть image_srcset
     @field_serializer('image')
     def serialize_image(self, value: Optional[str]) -> Optional[str]:
-        return create_full_image_url(value)
+        return create_full_image_url(value, width=THUMBNAIL_WIDTH)
+
+    @computed_field
+    @property
+    def image_srcset(self) -> Optional[str]:
+        return image_srcset(self.image, create_full_image_url)
 
 
 class CafeSettingsSchema(CustomBaseModel):
@@ -113,6 +126,24 @@ class OrderRequest(CustomBaseModel):
     address: Optional[DeliveryAddress] = None
     payment_method: str
 
+class CartQuoteRequest(CustomBaseModel):
+    cart_items: List[CartItemRequest]
+
+class CartQuoteLineSchema(CustomBaseModel):
+    variant_id: str
+    product_id: Optional[str] = None
+    quantity: int
+    unit_price: int
+    total_price: int
+    label: str
+    error: Optional[str] = None
+
+class CartQuoteSchema(CustomBaseModel):
+    lines: List[CartQuoteLineSchema]
+    total_amount: int
+    is_valid: bool
+    errors: List[str]
+
 class AddressSuggestionRequest(CustomBaseModel):
     query: str
     city: str
@@ -125,4 +156,17 @@ class PromotionSchema(CustomBaseModel):
     title: str
     subtitle: str
     image_url: str
-    linked_category_id: str
\ No newline at end of file
+    linked_category_id: str
+
+# --- Полное меню заведения одним документом (/cafes/{cafe_id}/menu) ---
+class VenueMenuSchema(CustomBaseModel):
+    version: str
+    # Дельта относительно base_version: в products только добавленные и измененные позиции
+    is_delta: bool = False
+    base_version: Optional[str] = None
+    categories: List[CategorySchema]
+    products: List[MenuItemSchema]
+    removed_product_ids: List[str] = []
+    # В дельте - id всех продуктов меню в порядке снимка: по ним клиент восстанавливает порядок списка
+    product_ids: Optional[List[str]] = None
+    popular_ids: List[str]
@@ -0,0 +1,122 @@
+# backend/app/sql_profiler.py
+"""
+Профилировщик SQL по запросам (включается SQL_PROFILING=1).
+
+Слушатели событий движков SQLAlchemy относят каждый SQL-запрос к текущему
+HTTP-запросу через contextvar, пишут в лог медленные запросы с параметрами и
+помечают запросы одной формы, повторившиеся в пределах HTTP-запроса не меньше
+SQL_N_PLUS_ONE_THRESHOLD раз, как вероятный N+1. Сводка возвращается в
+заголовке X-SQL-Profile. Выключенный профилировщик не регистрирует слушателей
+и ничего не стоит.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import route_label
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILING = os.getenv("SQL_PROFILING", "0") == "1"
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+PROFILE_HEADER = b"x-sql-profile"
+# Сколько символов параметров писать в лог медленного запроса
+MAX_LOGGED_PARAMS = 500
+
+# Списки плейсхолдеров (раскрытый IN, executemany) сворачиваются, чтобы IN из 3 и из 30 id были одной формой
+_PLACEHOLDER = r"(?:\?|%\(\w+\)s|%s|\$\d+(?:::\w+)?|:\w+)"
+_PLACEHOLDER_LIST = re.compile(rf"\((?:\s*{_PLACEHOLDER}\s*,)+\s*{_PLACEHOLDER}\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    return _PLACEHOLDER_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+class RequestProfile:
+    __slots__ = ("scope", "queries", "total_ms", "shapes")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.total_ms = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.queries += 1
+        self.total_ms += elapsed_ms
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated_shapes(self) -> List[tuple]:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= SQL_N_PLUS_ONE_THRESHOLD]
+
+    def summary(self) -> str:
+        return f"queries={self.queries}; db_ms={self.total_ms:.1f}; n_plus_one={len(self.repeated_shapes())}"
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("sql_profile", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sql_profiler_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["sql_profiler_started"].pop()) * 1000
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.record(statement, elapsed_ms)
+    if elapsed_ms >= SQL_SLOW_QUERY_MS:
+        origin = route_label(profile.scope) if profile is not None else "background"
+        logger.warning(
+            f"Slow SQL ({elapsed_ms:.1f} ms, {origin}): {_WHITESPACE.sub(' ', statement)} | params: {str(parameters)[:MAX_LOGGED_PARAMS]}"
+        )
+
+
+def _handle_error(exception_context):
+    # Запрос упал - снимаем отметку времени, иначе стек сместится для следующих запросов соединения
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("sql_profiler_started"):
+        connection.info["sql_profiler_started"].pop()
+
+
+def install(*engines: Engine) -> None:
+    """Подключает профилировщик к движкам (для AsyncEngine передается .sync_engine)."""
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+    logger.info(f"SQL profiling enabled: slow query >= {SQL_SLOW_QUERY_MS} ms, N+1 threshold {SQL_N_PLUS_ONE_THRESHOLD}.")
+
+
+class SQLProfilerMiddleware:
+    """Заводит профиль на каждый HTTP-запрос и отдает сводку в заголовке X-SQL-Profile."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = RequestProfile(scope)
+        token = _current_profile.set(profile)
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (PROFILE_HEADER, profile.summary().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _current_profile.reset(token)
+            for shape, count in profile.repeated_shapes():
+                logger.warning(f"Possible N+1 in {scope['method']} {route_label(scope)}: {count}x {shape[:300]}")
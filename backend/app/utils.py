@@ -3,14 +3,17 @@ import os
 import logging
 from typing import Optional
 
+from .images import image_variant
+
 # Выносим общую логику сюда
 API_URL = os.getenv("API_URL", "")
 logger = logging.getLogger(__name__)
 
-def create_full_image_url(path: Optional[str]) -> Optional[str]:
-    """Преобразует относительный путь к медиа-файлу в абсолютный URL."""
+def create_full_image_url(path: Optional[str], width: Optional[int] = None) -> Optional[str]:
+    """Преобразует относительный путь к медиа-файлу в абсолютный URL; width - нужная ширина копии (см. images)."""
     if not path or path.startswith('http'):
         return path
+    if width: path = image_variant(path, width)
     
     if path.startswith('/media/'):
         if API_URL:
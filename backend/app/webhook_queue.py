@@ -0,0 +1,159 @@
+# backend/app/webhook_queue.py
+"""
+Прием апдейтов Telegram через ограниченную очередь.
+
+Вебхук только валидирует апдейт, отбрасывает повторные доставки по update_id
+и кладет апдейт в очередь, после чего сразу отвечает Telegram. Обработчики
+(оплата, команды) выполняются N воркерами параллельно. Если очередь заполнена,
+вебхук отвечает 503, и Telegram повторит доставку позже.
+
+Telegram уже получил ответ, поэтому упавший апдейт воркер повторяет сам с
+растущей паузой; обработчики должны быть идемпотентны (оплата проверяет
+telegram_payment_charge_id). Исключения обработчиков PTB не пробрасывает из
+process_update, а отдает error-хендлерам, поэтому их собирает process_update_checked.
+"""
+import asyncio
+import logging
+import os
+from contextvars import ContextVar
+from collections import OrderedDict
+from typing import List, Optional
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "queue")  # queue | inline
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+# Сколько последних update_id помнить для отсечения повторных доставок. Окно свое у каждого воркера uvicorn:
+# дубль, попавший в другой процесс, отсекает уже обработчик оплаты (повторная оплата заказа игнорируется)
+WEBHOOK_DEDUP_WINDOW = int(os.getenv("WEBHOOK_DEDUP_WINDOW", "10000"))
+# Сколько секунд при остановке ждать обработки уже принятых апдейтов
+SHUTDOWN_DRAIN_TIMEOUT = 10
+# Сколько раз повторить упавший апдейт в режиме очереди и пауза перед первым повтором (дальше удваивается)
+WEBHOOK_RETRY_ATTEMPTS = int(os.getenv("WEBHOOK_RETRY_ATTEMPTS", "3"))
+WEBHOOK_RETRY_BACKOFF = float(os.getenv("WEBHOOK_RETRY_BACKOFF", "1.0"))
+
+# Ошибки обработчиков текущего апдейта; error-хендлер вызывается в той же задаче, что и process_update
+_handler_errors: ContextVar[Optional[List[Exception]]] = ContextVar("handler_errors", default=None)
+
+
+class UpdateQueueFull(Exception):
+    pass
+
+
+async def capture_handler_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Error-хендлер PTB: передает ошибку в process_update_checked, вне его - логирует."""
+    errors = _handler_errors.get()
+    if errors is None: logger.error(f"Unhandled error in bot handler: {context.error}", exc_info=context.error)
+    else: errors.append(context.error)
+
+
+async def process_update_checked(application: Application, update: Update) -> None:
+    """process_update, который поднимает первое исключение обработчиков, а не глушит его."""
+    errors: List[Exception] = []
+    token = _handler_errors.set(errors)
+    try:
+        with timed("telegram_process_update"):
+            await application.process_update(update)
+    finally:
+        _handler_errors.reset(token)
+    if errors:
+        raise errors[0]
+
+
+class UpdateIngestor:
+    def __init__(self, maxsize: int = WEBHOOK_QUEUE_SIZE, workers: int = WEBHOOK_WORKERS, dedup_window: int = WEBHOOK_DEDUP_WINDOW):
+        self.maxsize, self.workers, self.dedup_window = maxsize, workers, dedup_window
+        self._application: Optional[Application] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self._in_progress = 0
+        self._counters = {"accepted": 0, "duplicates": 0, "rejected": 0, "processed": 0, "retried": 0, "failed": 0, "max_depth": 0}
+
+    def start(self, application: Application) -> None:
+        self._application = application
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"webhook-worker-{i}") for i in range(self.workers)]
+        logger.info(f"Webhook ingestion started: {self.workers} workers, queue size {self.maxsize}.")
+
+    async def stop(self) -> None:
+        if self._queue is not None and not self._queue.empty():
+            try: await asyncio.wait_for(self._queue.join(), timeout=SHUTDOWN_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError: logger.warning(f"Webhook queue not drained on shutdown: {self._queue.qsize()} updates dropped.")
+        for task in self._tasks: task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def is_duplicate(self, update: Update) -> bool:
+        """Запоминает update_id и сообщает, видели ли мы его раньше."""
+        if update.update_id in self._seen:
+            self._seen.move_to_end(update.update_id)
+            self._counters["duplicates"] += 1
+            return True
+        self._seen[update.update_id] = None
+        if len(self._seen) > self.dedup_window:
+            self._seen.popitem(last=False)
+        return False
+
+    def forget(self, update: Update) -> None:
+        # Апдейт не приняли - Telegram пришлет его снова, и его нельзя считать дублем
+        self._seen.pop(update.update_id, None)
+
+    def submit(self, update: Update) -> bool:
+        """Ставит апдейт в очередь. False - это повторная доставка, апдейт отброшен."""
+        if self.is_duplicate(update):
+            return False
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.forget(update)
+            self._counters["rejected"] += 1
+            raise UpdateQueueFull()
+        self._counters["accepted"] += 1
+        self._counters["max_depth"] = max(self._counters["max_depth"], self._queue.qsize())
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            self._in_progress += 1
+            try:
+                await self._process_with_retry(update)
+            finally:
+                self._in_progress -= 1
+                self._queue.task_done()
+
+    async def _process_with_retry(self, update: Update) -> None:
+        # Пока идут повторы, update_id остается в окне, и повторная доставка того же апдейта отбрасывается
+        for attempt in range(WEBHOOK_RETRY_ATTEMPTS + 1):
+            try:
+                await process_update_checked(self._application, update)
+                self._counters["processed"] += 1
+                return
+            except Exception as e:
+                if attempt == WEBHOOK_RETRY_ATTEMPTS:
+                    # Повторы исчерпаны: отпускаем update_id, чтобы новую доставку не сочли дублем
+                    self.forget(update)
+                    self._counters["failed"] += 1
+                    logger.error(f"Error processing update {update.update_id}, giving up after {attempt + 1} attempts: {e}", exc_info=True)
+                    return
+                delay = WEBHOOK_RETRY_BACKOFF * 2 ** attempt
+                self._counters["retried"] += 1
+                logger.warning(f"Error processing update {update.update_id} (attempt {attempt + 1}), retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        depth = self._queue.qsize() if self._queue is not None else 0
+        return {
+            "mode": WEBHOOK_MODE, "workers": self.workers, "capacity": self.maxsize,
+            "depth": depth, "in_progress": self._in_progress, **self._counters
+        }
+
+
+update_ingestor = UpdateIngestor()
@@ -18,15 +18,27 @@ while ! nc -z $DB_HOST $DB_PORT; do
 done
 echo "Database at $DB_HOST:$DB_PORT is available."
 
-# Запуск миграций (создание таблиц и наполнение данными)
+# Миграции схемы (Alembic), затем наполнение данными
 echo "Running database migrations..."
-python /app/migrate_data.py
+python -m app.db_migrations
+# Синхронизация каталога из data/ (пропускается, если файлы не менялись;
+# при ошибках в файлах БД не трогается и приложение стартует со старым каталогом)
+echo "Syncing catalog data..."
+python /app/migrate_data.py || echo "Catalog sync failed, keeping the current catalog."
+
+# Сводка продаж для дашборда админки: заполняется из заказов, если пуста (дальше ведется приращениями)
+echo "Checking sales rollups..."
+python -m app.sales_rollup --backfill
 
 # ЗАПУСК СКРИПТА УСТАНОВКИ ВЕБХУКА
 echo "Running webhook setup script..."
 python /app/set_webhook.py # <-- ИЗМЕНЕНИЕ ЗДЕСЬ!
 
 # Запуск основного приложения FastAPI
-echo "Starting FastAPI app..."
+# WEB_CONCURRENCY - число воркеров uvicorn (у каждого свои пулы соединений: DB_POOL_SIZE + DB_MAX_OVERFLOW на движок).
+# Миграции и вебхук уже выполнены выше один раз, воркеры их не повторяют;
+# кэши каталога между воркерами синхронизируются через LISTEN/NOTIFY (app/cache_bus.py).
+echo "Starting FastAPI app with ${WEB_CONCURRENCY:-1} worker(s)..."
+export RUN_MIGRATIONS_ON_STARTUP=0
 # Добавляем флаги для корректной работы за реверс-прокси (Nginx)
-exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --proxy-headers --forwarded-allow-ips='*'
\ No newline at end of file
+exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-1}" --proxy-headers --forwarded-allow-ips='*'
\ No newline at end of file
@@ -1,177 +1,262 @@
 # backend/migrate_data.py
+"""
+Синхронизация каталога из data/ в БД (запускается из entrypoint.sh при каждом старте).
+
+Файлы global_catalog.json, info.json и venue_configs/*.json хэшируются; если
+хэш совпадает с записанным при прошлой синхронизации, скрипт ничего не делает.
+Иначе до любой записи проверяются ссылки между файлами (категории, группы
+добавок, варианты, заведения), затем в одной транзакции применяется разница:
+новые и измененные строки - пакетным INSERT ... ON CONFLICT DO UPDATE, строки,
+которых больше нет в файлах, удаляются. Заказы не трогаются; заведение,
+у которого есть заказы, не удаляется, даже если пропало из info.json.
+
+Запуск: python migrate_data.py [--force]  (--force - синхронизировать без проверки хэша)
+"""
+import hashlib
 import json
 import os
-import traceback
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import sys
+from typing import Dict, List, Tuple
+
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.database import engine
+from app.db_migrations import upgrade_database
 from app.models import (
-    Base, Cafe, Category, GlobalProduct, GlobalProductVariant, VenueMenuItem, Order,
+    Cafe, Category, GlobalProduct, GlobalProductVariant, VenueMenuItem, Order,
     GlobalAddonGroup, GlobalAddonItem, VenueAddonItem, product_addon_groups_association,
-    AppSetting
+    AppSetting, CATALOG_SYNC_HASH_KEY, with_media_prefix
 )
+from app import cache_bus
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise Exception("FATAL: DATABASE_URL not set!")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+CATALOG_PATH = os.path.join(DATA_DIR, "global_catalog.json")
+VENUES_PATH = os.path.join(DATA_DIR, "info.json")
+VENUE_CONFIGS_DIR = os.path.join(DATA_DIR, "venue_configs")
+DEFAULT_LOGO_PATH = "/icons/logo-laurel.svg"
+
+# Таблица и ее ключ; порядок - от родителей к детям (вставка в прямом порядке, удаление в обратном)
+SYNC_TABLES = [
+    (Category.__table__, ("id",)),
+    (GlobalAddonGroup.__table__, ("id",)),
+    (GlobalAddonItem.__table__, ("id",)),
+    (GlobalProduct.__table__, ("id",)),
+    (GlobalProductVariant.__table__, ("id",)),
+    (product_addon_groups_association, ("product_id", "addon_group_id")),
+    (Cafe.__table__, ("id",)),
+    (VenueMenuItem.__table__, ("venue_id", "variant_id")),
+    (VenueAddonItem.__table__, ("venue_id", "addon_id")),
+]
+
+
+class CatalogValidationError(Exception):
+    def __init__(self, errors: List[str]):
+        super().__init__(f"{len(errors)} catalog error(s)")
+        self.errors = errors
+
+
+def source_files() -> List[str]:
+    configs = sorted(
+        os.path.join(VENUE_CONFIGS_DIR, name) for name in os.listdir(VENUE_CONFIGS_DIR) if name.endswith(".json")
+    )
+    return [CATALOG_PATH, VENUES_PATH, *configs]
+
+
+def content_hash(paths: List[str]) -> str:
+    # Имя файла входит в хэш: переименование конфига заведения - тоже изменение
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, DATA_DIR).encode("utf-8") + b"\0")
+        with open(path, "rb") as f:
+            digest.update(f.read())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _read_json(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_rows(paths: List[str]) -> Dict[str, List[dict]]:
+    """Строки всех таблиц каталога в том виде, в каком они должны лежать в БД."""
+    catalog = _read_json(CATALOG_PATH)
+    addons = catalog.get("addons", {})
+    rows: Dict[str, List[dict]] = {table.name: [] for table, _ in SYNC_TABLES}
+
+    for cat in catalog.get("categories", []):
+        rows["categories"].append({
+            "id": cat["id"], "name": cat["name"], "icon": cat.get("icon"),
+            "background_color": cat.get("backgroundColor", cat.get("background_color")),
+        })
+    for group in addons.get("groups", []):
+        rows["global_addon_groups"].append({"id": group["id"], "name": group["name"]})
+    for item in addons.get("items", []):
+        rows["global_addon_items"].append({"id": item["id"], "group_id": item.get("group_id"), "name": item["name"]})
+    for prod in catalog.get("products", []):
+        rows["global_products"].append({
+            "id": prod["id"], "name": prod["name"], "description": prod.get("description"),
+            # Префикс /media/ ставит ORM-событие before_insert, а пакетная вставка идет мимо ORM
+            "image": with_media_prefix(prod.get("image")), "category_id": prod.get("category_id"),
+            "sub_category": prod.get("sub_category"), "is_popular": bool(prod.get("is_popular", False)),
+        })
+        for var in prod.get("variants", []):
+            rows["global_product_variants"].append({
+                "id": var["id"], "global_product_id": prod["id"], "name": var["name"], "weight": var.get("weight"),
+            })
+        for group_id in prod.get("addon_group_ids", []):
+            rows["product_addon_groups"].append({"product_id": prod["id"], "addon_group_id": group_id})
+
+    for venue in _read_json(VENUES_PATH):
+        rows["cafes"].append({
+            "id": venue["id"], "name": venue["name"], "cover_image": with_media_prefix(venue.get("coverImage")),
+            "kitchen_categories": venue.get("kitchenCategories"), "rating": venue.get("rating"),
+            "cooking_time": venue.get("cookingTime"), "status": venue.get("status"),
+            "opening_hours": venue.get("openingHours"), "min_order_amount": venue.get("minOrderAmount", 0),
+        })
+
+    for path in paths[2:]:
+        venue_id = os.path.splitext(os.path.basename(path))[0]
+        config = _read_json(path)
+        for item in config.get("variants", []):
+            rows["venue_menu_items"].append({
+                "venue_id": venue_id, "variant_id": item["variant_id"],
+                "price": item["price"], "is_available": item.get("is_available", True),
+            })
+        for item in config.get("addons", []):
+            rows["venue_addon_items"].append({
+                "venue_id": venue_id, "addon_id": item["addon_id"],
+                "price": item["price"], "is_available": item.get("is_available", True),
+            })
+    return rows
+
+
+def validate(rows: Dict[str, List[dict]]) -> None:
+    """Проверяет дубликаты ключей и висячие ссылки; в БД ничего не пишет."""
+    errors: List[str] = []
+    for table, keys in SYNC_TABLES:
+        seen = set()
+        for row in rows[table.name]:
+            key = tuple(row[k] for k in keys)
+            if key in seen: errors.append(f"{table.name}: duplicate key {key}")
+            seen.add(key)
+
+    def ids(table_name: str) -> set:
+        return {row["id"] for row in rows[table_name]}
+
+    references = [
+        ("global_products", "category_id", ids("categories")),
+        ("global_addon_items", "group_id", ids("global_addon_groups")),
+        ("product_addon_groups", "addon_group_id", ids("global_addon_groups")),
+        ("venue_menu_items", "venue_id", ids("cafes")),
+        ("venue_menu_items", "variant_id", ids("global_product_variants")),
+        ("venue_addon_items", "venue_id", ids("cafes")),
+        ("venue_addon_items", "addon_id", ids("global_addon_items")),
+    ]
+    for table_name, column, known in references:
+        for row in rows[table_name]:
+            if row[column] is not None and row[column] not in known:
+                owner = row.get("id") or row.get("product_id") or row.get("venue_id")
+                errors.append(f"{table_name}: {column}='{row[column]}' of '{owner}' does not exist")
+    if errors:
+        raise CatalogValidationError(errors)
+
+
+def _insert(connection, table):
+    return (postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert)(table)
+
+
+def _upsert(connection, table, keys: Tuple[str, ...], rows: List[dict]) -> None:
+    stmt = _insert(connection, table)
+    updates = {column: stmt.excluded[column] for column in rows[0] if column not in keys}
+    if updates:
+        stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_=updates)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(keys))
+    connection.execute(stmt, rows)
+
+
+def _delete(connection, table, keys: Tuple[str, ...], stale: List[tuple]) -> None:
+    if len(keys) == 1:
+        condition = table.c[keys[0]].in_([key[0] for key in stale])
+    else:
+        condition = tuple_(*(table.c[k] for k in keys)).in_(stale)
+    connection.execute(delete(table).where(condition))
+
+
+def _diff(connection, table, keys: Tuple[str, ...], rows: List[dict]) -> Tuple[List[dict], List[tuple]]:
+    """(новые и измененные строки, ключи строк, которых больше нет в файлах)."""
+    columns = [table.c[name] for name in (rows[0] if rows else keys)]
+    existing = {
+        tuple(row[k] for k in keys): dict(row)
+        for row in connection.execute(select(*columns)).mappings()
+    }
+    changed = [row for row in rows if existing.get(tuple(row[k] for k in keys)) != row]
+    wanted = {tuple(row[k] for k in keys) for row in rows}
+    stale = [key for key in existing if key not in wanted]
+    return changed, stale
+
+
+def sync(force: bool = False) -> bool:
+    """Приводит каталог в БД к файлам. Возвращает False, если файлы не менялись."""
+    paths = source_files()
+    digest = content_hash(paths)
+    with engine.connect() as connection:
+        stored = connection.execute(select(AppSetting.value).where(AppSetting.key == CATALOG_SYNC_HASH_KEY)).scalar()
+    if stored == digest and not force:
+        print(f"-> Catalog files unchanged ({digest[:12]}), skipping sync.")
+        return False
+
+    rows = load_rows(paths)
+    validate(rows)
+
+    with engine.begin() as connection:
+        diffs = []
+        for table, keys in SYNC_TABLES:
+            changed, stale = _diff(connection, table, keys, rows[table.name])
+            if table is Cafe.__table__ and stale:
+                # Заведения с заказами не удаляем: заказы ссылаются на них внешним ключом
+                with_orders = set(connection.execute(
+                    select(Order.cafe_id).where(Order.cafe_id.in_([key[0] for key in stale])).distinct()
+                ).scalars())
+                for cafe_id in with_orders:
+                    print(f"  [WARNING] Venue '{cafe_id}' is gone from info.json but has orders. Keeping it.")
+                stale = [key for key in stale if key[0] not in with_orders]
+            diffs.append((table, keys, changed, stale))
+
+        for table, keys, changed, stale in reversed(diffs):
+            if stale: _delete(connection, table, keys, stale)
+        for table, keys, changed, stale in diffs:
+            if changed: _upsert(connection, table, keys, changed)
+            print(f"  -> {table.name}: {len(changed)} upserted, {len(stale)} deleted")
+        # Запись через Core минует события ORM-сессии (menu_cache): кэши работающих воркеров
+        # сбрасываем сами - pg_notify уйдет вместе с коммитом. Ключи - как у menu_cache для массовых изменений
+        keys = {"venues" if table is Cafe.__table__ else "menu" for table, _, changed, stale in diffs if changed or stale}
+        if keys: cache_bus.publish(connection, keys)
+
+        settings = AppSetting.__table__
+        connection.execute(
+            _insert(connection, settings).on_conflict_do_nothing(index_elements=["key"]),
+            [{"key": "logo_path", "value": DEFAULT_LOGO_PATH}],
+        )
+        _upsert(connection, settings, ("key",), [{"key": CATALOG_SYNC_HASH_KEY, "value": digest}])
+    print(f"-> Catalog synced ({digest[:12]}).")
+    return True
 
-def migrate():
-    db = SessionLocal()
-    try:
-        print("\n--- STARTING MIGRATION ---")
-
-        # 1. Очистка таблиц в правильном порядке
-        print("-> Clearing old data...")
-        # Сначала удаляем записи из таблиц, которые имеют внешние ключи
-        db.query(Order).delete()
-        db.query(VenueMenuItem).delete()
-        db.query(VenueAddonItem).delete()
-        db.execute(product_addon_groups_association.delete())
-
-        # Затем из тех, на которые ссылаются
-        # Ассоциативная таблица очистится каскадом при удалении продуктов/групп
-        db.query(GlobalProductVariant).delete()
-        db.query(GlobalProduct).delete()
-        db.query(GlobalAddonItem).delete()
-        db.query(GlobalAddonGroup).delete()
-        db.query(Category).delete()
-        db.query(Cafe).delete()
-        db.commit()
-        
-        print("-> Seeding App Settings...")
-        logo_setting = db.query(AppSetting).filter_by(key='logo_path').first()
-        if not logo_setting:
-            db.add(AppSetting(key='logo_path', value='/icons/logo-laurel.svg'))
-            db.commit()
-            print("  -> 'logo_path' setting initialized.")
-        else:
-            print("  -> 'logo_path' setting already exists.")
-
-        # 2. Загрузка глобального каталога
-        print("-> Migrating Global Catalog...")
-        with open('data/global_catalog.json', 'r', encoding='utf-8') as f:
-            catalog = json.load(f)
-
-        # 2.1 Сначала категории
-        for cat_data in catalog.get('categories', []):
-            if 'backgroundColor' in cat_data:
-                cat_data['background_color'] = cat_data.pop('backgroundColor')
-            db.add(Category(**cat_data))
-        db.commit()
-        print("-> Categories migrated.")
-
-        # 2.2 Затем группы добавок и сами добавки
-        addons_data = catalog.get('addons', {})
-        for group_data in addons_data.get('groups', []):
-            db.add(GlobalAddonGroup(**group_data))
-        db.commit() # Коммитим группы, чтобы получить их ID для добавок
-        print("-> Addon Groups migrated.")
-        
-        for item_data in addons_data.get('items', []):
-            db.add(GlobalAddonItem(**item_data))
-        db.commit()
-        print("-> Addon Items migrated.")
-
-        # 2.3 Теперь, когда группы добавок существуют в БД, загружаем продукты
-        # и связываем их с группами
-        all_addon_groups = db.query(GlobalAddonGroup).all()
-        addon_groups_map = {group.id: group for group in all_addon_groups}
-
-        for prod_data in catalog.get('products', []):
-            # Извлекаем ID групп добавок, чтобы они не попали в конструктор
-            addon_group_ids = prod_data.pop('addon_group_ids', [])
-            variants_data = prod_data.pop('variants', [])
-            
-            # Создаем продукт с оставшимися данными
-            product = GlobalProduct(**prod_data)
-
-            # Находим объекты групп по ID и добавляем их к продукту
-            if addon_group_ids:
-                for group_id in addon_group_ids:
-                    if group_id in addon_groups_map:
-                        product.addon_groups.append(addon_groups_map[group_id])
-                    else:
-                        print(f"  [WARNING] Addon group with id '{group_id}' not found for product '{product.id}'.")
-
-            db.add(product)
-            db.flush() # Используем flush, чтобы получить product.id для вариантов
-
-            # Создаем варианты для этого продукта
-            for var_data in variants_data:
-                db.add(GlobalProductVariant(global_product_id=product.id, **var_data))
-        
-        db.commit() # Коммитим все продукты и варианты вместе
-        print("-> Products and Variants migrated successfully.")
-
-
-        # 3. Загрузка ВСЕХ заведений (и реальных, и виртуальных)
-        print("-> Migrating Venues (Cafes and Deliveries)...")
-
-        with open('data/info.json', 'r', encoding='utf-8') as f:
-            all_venues_info = json.load(f)
-
-        for venue_data in all_venues_info:
-            venue_data_for_db = {k: v for k, v in venue_data.items() if k in Cafe.__table__.columns.keys()}
-            # Ручное переименование ключей, если они не совпадают
-            if 'coverImage' in venue_data: venue_data_for_db['cover_image'] = venue_data['coverImage']
-            if 'kitchenCategories' in venue_data: venue_data_for_db['kitchen_categories'] = venue_data['kitchenCategories']
-            if 'cookingTime' in venue_data: venue_data_for_db['cooking_time'] = venue_data['cookingTime']
-            if 'openingHours' in venue_data: venue_data_for_db['opening_hours'] = venue_data['openingHours']
-            if 'minOrderAmount' in venue_data: venue_data_for_db['min_order_amount'] = venue_data['minOrderAmount']
-            
-            # Удаляем старые ключи, чтобы избежать ошибок
-            for key in ['coverImage', 'logoImage', 'kitchenCategories', 'cookingTime', 'openingHours', 'minOrderAmount']:
-                venue_data_for_db.pop(key, None)
-
-            db.add(Cafe(**venue_data_for_db))
-        db.commit()
-        print(f"-> All Venues committed. Total in DB: {db.query(Cafe).count()}")
-
-        # 4. Загрузка цен и наличия для каждого заведения
-        print("-> Migrating Venue-specific menus (prices & availability)...")
-        configs_path = "data/venue_configs"
-        for filename in os.listdir(configs_path):
-            if filename.endswith(".json"):
-                venue_id = filename.split('.')[0]
-                print(f"  -> Processing config for venue: {venue_id}")
-                
-                # Проверяем, существует ли такое заведение в БД
-                venue_exists = db.query(Cafe).filter_by(id=venue_id).first()
-                if not venue_exists:
-                    print(f"  [WARNING] Venue with id '{venue_id}' from config file not found in DB. Skipping.")
-                    continue
-
-                with open(os.path.join(configs_path, filename), 'r', encoding='utf-8') as f:
-                    venue_config = json.load(f)
-                    # Обработка цен на варианты
-                    for item_config in venue_config.get("variants", []):
-                        db.add(VenueMenuItem(
-                            venue_id=venue_id,
-                            variant_id=item_config['variant_id'],
-                            price=item_config['price'],
-                            is_available=item_config.get('is_available', True)
-                        ))
-                    # Обработка цен на добавки
-                    for addon_config in venue_config.get("addons", []):
-                        db.add(VenueAddonItem(
-                            venue_id=venue_id,
-                            addon_id=addon_config['addon_id'],
-                            price=addon_config['price'],
-                            is_available=addon_config.get('is_available', True)
-                        ))
-        db.commit()
-        print("-> Venue menus migrated successfully.")
-
-    except Exception as e:
-        print(f"\n !!! AN ERROR OCCURRED DURING MIGRATION: {e} !!! \n")
-        traceback.print_exc()
-        db.rollback()
-    finally:
-        print(f"\n--- MIGRATION FINISHED ---")
-        db.close()
 
 if __name__ == "__main__":
-    Base.metadata.create_all(engine)
-    migrate()
\ No newline at end of file
+    upgrade_database()
+    print("\n--- STARTING CATALOG SYNC ---")
+    try:
+        sync(force="--force" in sys.argv[1:])
+    except CatalogValidationError as e:
+        print(f"\n !!! CATALOG IS INCONSISTENT, NOTHING WAS WRITTEN: {e} !!! \n")
+        for error in e.errors:
+            print(f"  - {error}")
+        sys.exit(1)
+    print("--- CATALOG SYNC FINISHED ---")
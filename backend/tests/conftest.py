@@ -0,0 +1,14 @@
+# backend/tests/conftest.py
+"""
+Окружение тестов: временная SQLite-база и папка загрузок. Переменные выставляются
+до импорта app - database.py и main.py читают их при импорте.
+"""
+import os
+import sys
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="ezh-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR}/test.db"
+os.environ["UPLOAD_DIR"] = _TMP_DIR
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,70 @@
+# backend/tests/test_admin_lists.py
+"""
+Keyset-списки админки (admin_lists.py) на установленной версии sqladmin: переходы
+по курсорам вперед и назад показывают каждую строку ровно один раз, в порядке
+(created_at, id) по убыванию. Запуск из backend/:
+    python -m pytest -q tests
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import pytest
+from starlette.requests import Request
+
+from app.admin import OrderAdmin
+from app.admin_lists import KeysetPagination
+from app.database import engine, SessionLocal
+from app.main import admin
+from app.models import Base, Cafe, Order
+
+VENUE = "test-venue"
+ORDERS = 23
+PAGE_SIZE = 5
+
+
+def list_page(view: OrderAdmin, **params) -> KeysetPagination:
+    request = Request({"type": "http", "method": "GET", "path": "/admin/order/list", "headers": [], "query_string": urlencode(params).encode()})
+    return asyncio.run(view.list(request))
+
+
+@pytest.fixture(scope="module")
+def order_view():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    started = datetime(2026, 1, 1)
+    with SessionLocal() as db:
+        db.add(Cafe(id=VENUE, name="Тестовое кафе"))
+        # По три заказа на одну секунду: внутри секунды порядок решает id
+        db.add_all(Order(id=uuid.uuid4(), cafe_id=VENUE, created_at=started + timedelta(seconds=i // 3), status="paid") for i in range(ORDERS))
+        db.commit()
+        expected = [order.id for order in db.query(Order).order_by(Order.created_at.desc(), Order.id.desc())]
+    return next(view for view in admin.views if isinstance(view, OrderAdmin)), expected
+
+
+def test_pages_forward_cover_every_row_once(order_view):
+    view, expected = order_view
+    seen, params = [], {"pageSize": PAGE_SIZE}
+    while True:
+        page = list_page(view, **params)
+        seen.extend(row.id for row in page.rows)
+        if not page.has_next: break
+        params = {"pageSize": PAGE_SIZE, "page": page.page + 1, "after": page.next_cursor}
+    assert seen == expected
+    assert page.count == ORDERS
+
+
+def test_pages_backward_mirror_forward(order_view):
+    view, expected = order_view
+    pages, params = [], {"pageSize": PAGE_SIZE}
+    while True:
+        page = list_page(view, **params)
+        pages.append([row.id for row in page.rows])
+        if not page.has_next: break
+        params = {"pageSize": PAGE_SIZE, "page": page.page + 1, "after": page.next_cursor}
+    back = []
+    while page.has_previous:
+        page = list_page(view, pageSize=PAGE_SIZE, page=page.page - 1, before=page.previous_cursor)
+        back.append([row.id for row in page.rows])
+    assert back == pages[-2::-1]
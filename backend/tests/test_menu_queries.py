@@ -0,0 +1,101 @@
+# backend/tests/test_menu_queries.py
+"""
+Число SQL-запросов на эндпоинты меню не зависит от размера каталога (нет N+1).
+
+Каталог засевается в SQLite двух размеров; для каждого эндпоинта снимок меню
+собирается заново (холодный кэш) и считаются выполненные запросы. Запуск из backend/:
+    python -m pytest -q tests
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import async_engine, engine, SessionLocal
+from app.main import app
+from app.menu_cache import menu_cache
+from app.models import (
+    Base, Cafe, Category, GlobalAddonGroup, GlobalAddonItem, GlobalProduct, GlobalProductVariant,
+    VenueAddonItem, VenueMenuItem,
+)
+
+VENUE = "test-venue"
+# Маленький и в 10 раз больший каталог: число запросов должно совпасть
+SIZES = (3, 30)
+ENDPOINTS = (
+    f"/cafes/{VENUE}/categories",
+    f"/cafes/{VENUE}/popular",
+    f"/cafes/{VENUE}/menu",
+    f"/cafes/{VENUE}/menu/cat-0",
+    f"/cafes/{VENUE}/menu/details/product-0",
+)
+
+
+def seed_catalog(products: int) -> None:
+    """Заведение с products продуктами в двух категориях; у каждого два варианта и две группы добавок."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        db.add(Cafe(id=VENUE, name="Тестовое кафе"))
+        db.add_all(Category(id=f"cat-{c}", name=f"Категория {c}") for c in range(2))
+        groups = []
+        for g in range(products):
+            group = GlobalAddonGroup(id=f"group-{g}", name=f"Группа {g}")
+            groups.append(group)
+            for i in range(2):
+                db.add(GlobalAddonItem(id=f"addon-{g}-{i}", group_id=group.id, name=f"Добавка {g}-{i}"))
+                db.add(VenueAddonItem(venue_id=VENUE, addon_id=f"addon-{g}-{i}", price=1000, is_available=True))
+        db.add_all(groups)
+        for p in range(products):
+            product = GlobalProduct(id=f"product-{p}", name=f"Продукт {p}", category_id=f"cat-{p % 2}", is_popular=p % 3 == 0)
+            product.addon_groups = [groups[p], groups[(p + 1) % products]]
+            db.add(product)
+            for v in range(2):
+                db.add(GlobalProductVariant(id=f"variant-{p}-{v}", global_product_id=product.id, name=f"Вариант {v}"))
+                db.add(VenueMenuItem(venue_id=VENUE, variant_id=f"variant-{p}-{v}", price=10000 + v, is_available=True))
+        db.commit()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+@pytest.fixture(scope="module")
+def query_counts():
+    """{размер каталога: {эндпоинт: (запросов на холодном кэше, на теплом)}}."""
+    counter = QueryCounter()
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", counter)
+    # Без контекстного менеджера lifespan (бот, фоновые задачи) не запускается
+    client = TestClient(app)
+    counts = {}
+    try:
+        for size in SIZES:
+            seed_catalog(size)
+            counts[size] = {}
+            for endpoint in ENDPOINTS:
+                menu_cache.invalidate()
+                counter.count = 0
+                assert client.get(endpoint).status_code == 200, endpoint
+                cold = counter.count
+                counter.count = 0
+                assert client.get(endpoint).status_code == 200, endpoint
+                counts[size][endpoint] = (cold, counter.count)
+    finally:
+        for target in (engine, async_engine.sync_engine):
+            event.remove(target, "before_cursor_execute", counter)
+    return counts
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_query_count_does_not_grow_with_catalog(query_counts, endpoint):
+    small, large = (query_counts[size][endpoint][0] for size in SIZES)
+    assert small == large, f"{endpoint}: {small} queries for {SIZES[0]} products, {large} for {SIZES[1]}"
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_cached_menu_needs_no_queries(query_counts, endpoint):
+    assert all(query_counts[size][endpoint][1] == 0 for size in SIZES), query_counts
@@ -1,6 +1,6 @@
 // frontend_modern/src/api/index.ts
 import axios from 'axios';
-import type { CategorySchema, MenuItemSchema, OrderRequest, CafeSettingsSchema, CafeSchema, PromotionSchema } from './types'; // Removed CafeInfoSchema
+import type { MenuItemSchema, OrderRequest, CafeSettingsSchema, CafeSchema, PromotionSchema, CartItemRequest, CartQuote, VenueMenu } from './types'; // Removed CafeInfoSchema
 import { logger } from '../utils/logger'; // Import logger
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL;
@@ -43,40 +43,6 @@ export const getCafeById = async (cafeId: string): Promise<CafeSchema> => {
   }
 };
 
-// UPDATED: Get list of categories for a specific cafe
-export const getCafeCategories = async (cafeId: string): Promise<CategorySchema[]> => {
-  try {
-    const response = await apiClient.get<CategorySchema[]>(`/cafes/${cafeId}/categories`);
-    console.log(`Raw response for categories of ${cafeId}:`, response); // <--- ДОБАВЬТЕ ЭТОТ ЛОГ
-    return Array.isArray(response.data) ? response.data : [];
-  } catch (error) {
-    logger.error(`Error fetching categories for cafe ${cafeId}:`, error);
-    throw error;
-  }
-};
-
-// UPDATED: Get menu by category for a specific cafe
-export const getCafeCategoryMenu = async (cafeId: string, categoryId: string): Promise<MenuItemSchema[]> => {
-  try {
-    const response = await apiClient.get<MenuItemSchema[]>(`/cafes/${cafeId}/menu/${categoryId}`);
-    return response.data;
-  } catch (error) {
-    logger.error(`Error fetching menu for category ${categoryId} of cafe ${cafeId}:`, error);
-    throw error;
-  }
-};
-
-// UPDATED: Get details of a menu item for a specific cafe
-export const getCafeMenuItemDetails = async (cafeId: string, itemId: string): Promise<MenuItemSchema> => {
-  try {
-    const response = await apiClient.get<MenuItemSchema>(`/cafes/${cafeId}/menu/details/${itemId}`);
-    return response.data;
-  } catch (error) {
-    logger.error(`Error fetching details for item ${itemId} of cafe ${cafeId}:`, error);
-    throw error;
-  }
-};
-
 // UPDATED: Get cafe settings for a specific cafe
 export const getCafeSettings = async (cafeId: string): Promise<CafeSettingsSchema> => {
     try {
@@ -89,9 +55,12 @@ export const getCafeSettings = async (cafeId: string): Promise<CafeSettingsSchem
 };
 
 // UPDATED: Create an order for a specific cafe
-export const createOrder = async (cafeId: string, orderData: OrderRequest): Promise<{ invoiceUrl: string }> => {
+// idempotencyKey: повтор с тем же ключом получает ответ первого запроса, второй заказ не создается
+export const createOrder = async (cafeId: string, orderData: OrderRequest, idempotencyKey?: string): Promise<{ invoiceUrl: string }> => {
   try {
-    const response = await apiClient.post<{ invoiceUrl: string }>(`/cafes/${cafeId}/order`, orderData);
+    const response = await apiClient.post<{ invoiceUrl: string }>(`/cafes/${cafeId}/order`, orderData, {
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
+    });
     return response.data;
   } catch (error) {
     logger.error("Error creating order:", error);
@@ -102,17 +71,67 @@ export const createOrder = async (cafeId: string, orderData: OrderRequest): Prom
   }
 };
 
-export const getCafePopularMenu = async (cafeId: string): Promise<MenuItemSchema[]> => {
+// Проверка цен и наличия позиций корзины перед оформлением заказа
+export const quoteCart = async (cafeId: string, cartItems: CartItemRequest[]): Promise<CartQuote> => {
   try {
-    const response = await apiClient.get<MenuItemSchema[]>(`/cafes/${cafeId}/popular`);
-    console.log(`Raw response for popular of ${cafeId}:`, response); // <--- И ЭТОТ ЛОГ
-    return Array.isArray(response.data) ? response.data : [];
+    const response = await apiClient.post<CartQuote>(`/cafes/${cafeId}/cart/quote`, { cartItems });
+    return response.data;
   } catch (error) {
-    logger.error(`Error fetching popular menu for cafe ${cafeId}:`, error);
+    logger.error(`Error quoting cart for cafe ${cafeId}:`, error);
     throw error;
   }
 };
 
+// Все меню заведения одним документом. С since возвращается только разница с этой версией
+export const getCafeMenu = async (cafeId: string, since?: string): Promise<VenueMenu> => {
+  try {
+    const response = await apiClient.get<VenueMenu>(`/cafes/${cafeId}/menu`, { params: since ? { since } : undefined });
+    return response.data;
+  } catch (error) {
+    logger.error(`Error fetching full menu for cafe ${cafeId}:`, error);
+    throw error;
+  }
+};
+
+// Накладывает ответ getCafeMenu(cafeId, base.version) на сохраненное меню
+export const applyMenuDelta = (base: VenueMenu, update: VenueMenu): VenueMenu => {
+  if (!update.isDelta || update.baseVersion !== base.version) return update;
+  const byId = new Map<string, MenuItemSchema>(base.products.map(product => [product.id, product]));
+  update.removedProductIds.forEach(id => byId.delete(id));
+  update.products.forEach(product => byId.set(product.id, product));
+  // Порядок - серверный (productIds), а не "новые в конец"
+  const order = update.productIds ?? Array.from(byId.keys());
+  const products = order.flatMap(id => byId.get(id) ?? []);
+  return { ...update, isDelta: false, baseVersion: null, products, removedProductIds: [], productIds: null };
+};
+
+// Меню заведений, загруженные за сессию: страницы берут их отсюда, а не запрашивают по категориям
+const MENU_REFRESH_MS = 60_000;
+const cafeMenus = new Map<string, { menu: VenueMenu; loadedAt: number }>();
+const pendingMenus = new Map<string, Promise<VenueMenu>>();
+
+// Меню заведения: первый раз целиком, дальше не чаще раза в MENU_REFRESH_MS дельтой ?since=<версия>
+export const loadCafeMenu = (cafeId: string): Promise<VenueMenu> => {
+  const cached = cafeMenus.get(cafeId);
+  if (cached && Date.now() - cached.loadedAt < MENU_REFRESH_MS) return Promise.resolve(cached.menu);
+  const pending = pendingMenus.get(cafeId);
+  if (pending) return pending;
+  const request = getCafeMenu(cafeId, cached?.menu.version)
+    .then(update => {
+      const menu = cached ? applyMenuDelta(cached.menu, update) : update;
+      cafeMenus.set(cafeId, { menu, loadedAt: Date.now() });
+      return menu;
+    })
+    .catch(error => {
+      // Не обновилось - показываем то, что уже есть
+      if (cached) return cached.menu;
+      throw error;
+    })
+    .finally(() => pendingMenus.delete(cafeId));
+  pendingMenus.set(cafeId, request);
+  return request;
+};
+
 export interface AddressSuggestion {
     value: string; // Полный адрес
     data: {
@@ -39,6 +39,7 @@ export interface CafeSchema {
     id: string;
     name: string;
     coverImage?: string;
+    coverImageSrcset?: string | null;
     kitchenCategories?: string;
     rating?: string;
     cookingTime?: string;
@@ -67,6 +68,7 @@ export interface MenuItemSchema {
     cafeId: string;
     categoryId: string;
     image?: string;
+    imageSrcset?: string | null;
     name?: string;
     description?: string;
     variants: MenuItemVariantSchema[];
@@ -114,6 +116,42 @@ export interface DeliveryAddress {
     comment: string;
 }
 
+// --- Схемы предварительного расчета корзины (/cart/quote) ---
+export interface CartQuoteRequest {
+    cartItems: CartItemRequest[];
+}
+
+export interface CartQuoteLine {
+    variantId: string;
+    productId: string | null;
+    quantity: number;
+    unitPrice: number;
+    totalPrice: number;
+    label: string;
+    error: string | null;
+}
+
+export interface CartQuote {
+    lines: CartQuoteLine[];
+    totalAmount: number;
+    isValid: boolean;
+    errors: string[];
+}
+
+// --- Полное меню заведения (/cafes/{cafeId}/menu) ---
+export interface VenueMenu {
+    version: string;
+    // Дельта относительно baseVersion: в products только добавленные и измененные позиции
+    isDelta: boolean;
+    baseVersion: string | null;
+    categories: CategorySchema[];
+    products: MenuItemSchema[];
+    removedProductIds: string[];
+    // Только в дельте: id всех продуктов меню в серверном порядке
+    productIds?: string[] | null;
+    popularIds: string[];
+}
+
 // --- Типы для подсказок адреса ---
 export interface AddressSuggestion {
     value: string;
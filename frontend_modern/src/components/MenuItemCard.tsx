@@ -17,7 +17,7 @@ const MenuItemCard: React.FC<MenuItemCardProps> = ({ item, cafeId }) => {
                 navigate(`/cafe/${cafeId}/details/${item.id}`);
             }}
         >
-            <img className="cafe-item-image" src={item.image} alt={item.name}/>
+            <img className="cafe-item-image" src={item.image} srcSet={item.imageSrcset ?? undefined} sizes="50vw" loading="lazy" alt={item.name}/>
             <h6 className="cafe-item-name">{item.name}</h6>
             <p className="small cafe-item-description">{item.description}</p>
         </button>
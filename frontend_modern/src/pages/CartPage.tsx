@@ -1,5 +1,5 @@
 // frontend_modern/src/pages/CartPage.tsx
-import React, { useEffect, useState, useCallback } from 'react';
+import React, { useEffect, useState, useCallback, useRef } from 'react';
 import Lottie from 'lottie-react';
 import type { OrderRequest } from '../api/types';
 import { useCart } from '../store/cart';
@@ -16,6 +16,11 @@ import { useDelivery } from '../store/delivery';
 type PackagingType = 'dine-in' | 'take-away';
 type PaymentMethod = 'online' | 'card_on_delivery' | 'cash_on_delivery';
 
+const newIdempotencyKey = (): string =>
+    typeof crypto !== 'undefined' && 'randomUUID' in crypto
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
 const CartPage: React.FC = () => {
     const { items, increaseQuantity, decreaseQuantity, getItemCount, getTotalCost, clearCart } = useCart();
     const { showSnackbar } = useSnackbar();
@@ -26,6 +31,10 @@ const CartPage: React.FC = () => {
     const [minOrderAmount, setMinOrderAmount] = useState<number>(0);
     const [packaging, setPackaging] = useState<PackagingType>('take-away');
     const [paymentMethod, setPaymentMethod] = useState<PaymentMethod>('online');
+    // Ключ идемпотентности одного оформления: повторное нажатие или ретрай сети вернут тот же заказ,
+    // а изменение корзины, адреса или способа оплаты - это уже новый заказ
+    const idempotencyKey = useRef<string>(newIdempotencyKey());
+    useEffect(() => { idempotencyKey.current = newIdempotencyKey(); }, [items, address, paymentMethod, selectedCafe]);
 
     useEffect(() => {
         const loadSettings = async () => {
@@ -73,7 +82,7 @@ const CartPage: React.FC = () => {
                     paymentMethod: paymentMethod
                 };
 
-                const response = await createOrder(selectedCafe.id, orderData);
+                const response = await createOrder(selectedCafe.id, orderData, idempotencyKey.current);
 
                 if (response.invoiceUrl) {
                     TelegramSDK.openInvoice(response.invoiceUrl, (status) => {
@@ -1,7 +1,7 @@
 // frontend_modern/src/pages/CategoryPage.tsx
 import React, { useEffect, useState, useCallback, useMemo, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { getCafeCategoryMenu } from '../api';
+import { loadCafeMenu } from '../api';
 import type { MenuItemSchema } from '../api/types';
 import { useCart } from '../store/cart';
 import MenuItemCard from '../components/MenuItemCard';
@@ -35,8 +35,8 @@ const CategoryPage: React.FC = () => {
             setLoading(true);
             setError(null);
             try {
-                const items = await getCafeCategoryMenu(cafeId, categoryId);
-                setMenuItems(items || []);
+                const menu = await loadCafeMenu(cafeId);
+                setMenuItems(menu.products.filter(item => item.categoryId === categoryId));
             } catch (err: any) {
                 logger.error("Failed to load menu:", err);
                 setError(err.message || "Не удалось загрузить меню.");
@@ -1,6 +1,6 @@
 import React, { useEffect, useState, useCallback, useMemo, useLayoutEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { getCafeMenuItemDetails } from '../api';
+import { loadCafeMenu } from '../api';
 import type { MenuItemSchema, MenuItemVariantSchema, AddonGroup, AddonItem, CartItem, SelectedAddon} from '../api/types';
 import { toDisplayCost } from '../utils/currency';
 import { useCart } from '../store/cart';
@@ -37,7 +37,7 @@ const DetailsPage: React.FC = () => {
             setLoading(true);
             setError(null);
             try {
-                const item = await getCafeMenuItemDetails(cafeId, itemId);
+                const item = (await loadCafeMenu(cafeId)).products.find(product => product.id === itemId);
                 if (item && item.variants.length > 0) {
                     setMenuItem(item);
                     setSelectedVariant(item.variants[0]);
@@ -156,7 +156,7 @@ const DetailsPage: React.FC = () => {
         <section className="cafe-item-details-container">
             {/* ... JSX остается без изменений ... */}
             <div className="cafe-item-details-content">
-                <img className="cover" src={menuItem.image} alt={menuItem.name || 'Товар'}/>
+                <img className="cover" src={menuItem.image} srcSet={menuItem.imageSrcset ?? undefined} sizes="100vw" alt={menuItem.name || 'Товар'}/>
                 <div className="cafe-item-details-title-container">
                     <h1 id="cafe-item-details-name">{menuItem.name}</h1>
                 </div>
@@ -1,6 +1,6 @@
 import React, { useEffect, useState, useCallback, useMemo } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { getCafeCategories, getCafePopularMenu, getCafePromotions} from '../api';
+import { loadCafeMenu, getCafePromotions} from '../api';
 import type { CategorySchema, MenuItemSchema, PromotionSchema } from '../api/types';
 import { useCart } from '../store/cart';
 import MenuItemCard from '../components/MenuItemCard';
@@ -40,13 +40,14 @@ const HomePage: React.FC = () => {
             setIsLoadingCafeData(true);
             try {
                 logger.log(`Загрузка данных для кафе: ${cafeToDisplay.id}`);
-                const [categoriesData, popularData, promotionsData] = await Promise.all([
-                    getCafeCategories(cafeToDisplay.id),
-                    getCafePopularMenu(cafeToDisplay.id),
+                // Категории и популярное - из общего меню заведения, его же потом берут страницы категорий и товара
+                const [menu, promotionsData] = await Promise.all([
+                    loadCafeMenu(cafeToDisplay.id),
                     getCafePromotions(cafeToDisplay.id)
                 ]);
-                setCategories(categoriesData || []);
-                setPopularItems(popularData || []);
+                const productsById = new Map(menu.products.map(product => [product.id, product] as const));
+                setCategories(menu.categories);
+                setPopularItems(menu.popularIds.flatMap(id => productsById.get(id) ?? []));
                 setPromotions(promotionsData || []); // Сохраняем акции в состояние
             } catch (err: any) {
                 logger.error("Не удалось загрузить данные для кафе:", err);
@@ -115,7 +116,7 @@ const HomePage: React.FC = () => {
                 <img id="cafe-logo" className="cafe-logo" src={logoUrl} alt="Логотип кафе"/>
             </div>
             {/* 3. Используйте getImageUrl для обложки */}
-            <img id="cafe-cover" className="cover" src={cafeToDisplay.coverImage} alt="Обложка кафе"/>
+            <img id="cafe-cover" className="cover" src={cafeToDisplay.coverImage} srcSet={cafeToDisplay.coverImageSrcset ?? undefined} sizes="100vw" alt="Обложка кафе"/>
 
             <div id="cafe-info" className="cafe-info-container">
                 <button